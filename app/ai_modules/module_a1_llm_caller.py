@@ -6,13 +6,15 @@ import google.generativeai as genai
 from typing import List, Dict, Any, Optional
 
 from app.ai_modules.prompts_module_a1 import SYSTEM_PROMPT_A1_V1_1
+from app.services.llm_client import LLM_MODULE_A1, get_llm_client
 from app.core.config import Settings # Used for type hinting settings parameter
 
 async def invoke_module_a1_llm(
     parsed_transcript_segments: List[Dict[str, Any]], 
     user_input_title: Optional[str], 
     user_input_source_desc: Optional[str], 
-    settings: Settings
+    settings: Settings,
+    known_total_duration_seconds: Optional[float] = None
 ) -> Dict[str, Any]:
     """
     Invokes the Google Gemini API for Module A.1 processing.
@@ -21,12 +23,13 @@ async def invoke_module_a1_llm(
     @param user_input_title: Optional user-provided video title.
     @param user_input_source_desc: Optional user-provided source description.
     @param settings: Application settings instance containing the API key.
+    @param known_total_duration_seconds: Optional media duration from the probe step; when given the
+                                         model outputs null for totalDurationSeconds and this value is used.
     @return: A dictionary containing the LLM's structured JSON output.
     @raise Exception: If API call fails or response format is invalid.
     """
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY.get_secret_value())
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        llm_client = get_llm_client(settings)
 
         # Construct the user message
         # The system prompt expects keys: rawTranscriptSegments, userInputVideoTitle, userInputSourceDescription
@@ -45,6 +48,7 @@ Please process the following learning session data according to your instruction
 User Input:
 Title: {user_input_title if user_input_title else 'Not provided'}
 Source Description: {user_input_source_desc if user_input_source_desc else 'Not provided'}
+Known Total Duration (seconds): {f"{known_total_duration_seconds:.1f}" if known_total_duration_seconds else 'Not provided'}
 
 Raw Transcript Segments to process:
 ```json
@@ -63,14 +67,7 @@ Ensure your output is a single, valid JSON object adhering to the specified sche
 
         print(f"Attempting to call Gemini for Module A.1. Input segments count: {len(parsed_transcript_segments)}")
         
-        response = await model.generate_content_async(
-            [SYSTEM_PROMPT_A1_V1_1, user_message_content],
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                # Consider adding response_mime_type="application/json" if supported and desired for Gemini
-                # For now, we expect the LLM to produce a JSON string within its text response due to prompt instructions
-            )
-        )
+        response = await llm_client.generate_content(LLM_MODULE_A1, SYSTEM_PROMPT_A1_V1_1, user_message_content)
 
         if not response.candidates or not response.candidates[0].content.parts:
             print("Error: Gemini API returned no content or invalid content structure.")
@@ -108,6 +105,10 @@ Ensure your output is a single, valid JSON object adhering to the specified sche
             print(f"LLM Parsed Output was:\n{parsed_output}")
             raise ValueError("'transcriptSegments' in LLM A.1 response must be a list.")
 
+        if known_total_duration_seconds:
+            # The measured media duration is authoritative; the model is told not to estimate it
+            parsed_output["totalDurationSeconds"] = known_total_duration_seconds
+
         print("Successfully received and parsed response from Gemini for Module A.1.")
         return parsed_output
 
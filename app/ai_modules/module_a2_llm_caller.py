@@ -5,10 +5,9 @@ import json
 import re
 from typing import Dict, Any, List
 
-import google.generativeai as genai
-
 from app.core.config import Settings
 from app.ai_modules.prompts_module_a2 import SYSTEM_PROMPT_A2_V1_1
+from app.services.llm_client import LLM_MODULE_A2, get_llm_client
 
 async def invoke_module_a2_llm(module_a1_llm_output: Dict[str, Any], settings: Settings) -> Dict[str, Any]:
     """
@@ -28,8 +27,7 @@ async def invoke_module_a2_llm(module_a1_llm_output: Dict[str, Any], settings: S
     print(f"Attempting to call Gemini for Module A.2. Input videoId: {module_a1_llm_output.get('videoId')}")
 
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY.get_secret_value())
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        llm_client = get_llm_client(settings)
 
         # Prepare the user message
         # We only need to pass what's relevant for A2 as per its prompt (A1's output structure)
@@ -56,10 +54,7 @@ async def invoke_module_a2_llm(module_a1_llm_output: Dict[str, Any], settings: S
         
         print(f"Module A.2 LLM User Message prepared. Length: {len(user_message_content)} chars. First 200 chars: {user_message_content[:200]}")
 
-        response = await model.generate_content_async(
-            [SYSTEM_PROMPT_A2_V1_1, user_message_content],
-            generation_config=genai.types.GenerationConfig(temperature=0.3)
-        )
+        response = await llm_client.generate_content(LLM_MODULE_A2, SYSTEM_PROMPT_A2_V1_1, user_message_content)
 
         print("LLM A.2 call successful. Response received.")
         
@@ -6,10 +6,9 @@ import re
 from typing import Dict, Any, List
 import uuid # For potential noteId placeholder generation if needed, though DB will create final
 
-import google.generativeai as genai
-
 from app.core.config import Settings
 from app.ai_modules.prompts_module_b import SYSTEM_PROMPT_B_V1_0
+from app.services.llm_client import LLM_MODULE_B, get_llm_client
 
 async def invoke_module_b_llm(module_a1_output: Dict[str, Any], module_a2_output: Dict[str, Any], settings: Settings) -> Dict[str, Any]:
     """
@@ -31,8 +30,7 @@ async def invoke_module_b_llm(module_a1_output: Dict[str, Any], module_a2_output
     print(f"Attempting to call Gemini for Module B. Input videoId: {video_id_from_a1}")
 
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY.get_secret_value())
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        llm_client = get_llm_client(settings)
 
         # Prepare the user message for Module B
         user_message_input_data = {
@@ -55,10 +53,7 @@ The videoId in your output MUST be "{video_id_from_a1}".
         print(f"Module B LLM User Message prepared. Length: {len(user_message_content)} chars.")
         # print(f"Module B LLM User Message snippet: {user_message_content[:500]}") # Uncomment for debugging
 
-        response = await model.generate_content_async(
-            [SYSTEM_PROMPT_B_V1_0, user_message_content],
-            generation_config=genai.types.GenerationConfig(temperature=0.4)
-        )
+        response = await llm_client.generate_content(LLM_MODULE_B, SYSTEM_PROMPT_B_V1_0, user_message_content)
 
         print("LLM B call successful. Response received.")
         
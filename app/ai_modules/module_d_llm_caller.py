@@ -6,10 +6,9 @@ import re
 import uuid # For cueId generation
 from typing import Dict, Any, List, Optional
 
-import google.generativeai as genai
-
 from app.core.config import Settings
 from app.ai_modules.prompts_module_d import SYSTEM_PROMPT_D_V1_0
+from app.services.llm_client import LLM_MODULE_D, get_llm_client
 
 async def invoke_module_d_llm(
     note_markdown_content: str, 
@@ -40,8 +39,7 @@ async def invoke_module_d_llm(
     print(f"Attempting to call Gemini for Module D. Processing noteId: {note_id} for videoId: {video_id}")
 
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY.get_secret_value())
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        llm_client = get_llm_client(settings)
 
         user_message_content = f"""Please generate knowledge reinforcement cues based on the following study note content and its context, according to your detailed instructions (SYSTEM_PROMPT_D_V1_0).
 
@@ -72,10 +70,7 @@ All textual content in the cues must be in the same language as the input note.
         print(f"Module D LLM User Message prepared. Length: {len(user_message_content)} chars.")
         # print(f"Module D LLM User Message snippet: {user_message_content[:500]}...") # Uncomment for debugging
 
-        response = await model.generate_content_async(
-            [SYSTEM_PROMPT_D_V1_0, user_message_content],
-            generation_config=genai.types.GenerationConfig(temperature=0.75)
-        )
+        response = await llm_client.generate_content(LLM_MODULE_D, SYSTEM_PROMPT_D_V1_0, user_message_content)
 
         print("LLM D call successful. Response received.")
         
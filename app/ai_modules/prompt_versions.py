@@ -0,0 +1,35 @@
+"""
+ 系统提示版本指纹
+
+ 为每个LLM阶段计算提示版本号，用于判断缓存的阶段输出是否仍然有效。
+ 版本号由提示常量名和提示内容的哈希组成，并沿管道链式传递：
+ A.1的提示变化会同时使A.2、B、D的缓存失效（它们的输入来自上游阶段）。
+"""
+import hashlib
+from typing import Dict
+
+from app.core.enums import PipelineStage
+from app.ai_modules.prompts_module_a1 import SYSTEM_PROMPT_A1_V1_1
+from app.ai_modules.prompts_module_a2 import SYSTEM_PROMPT_A2_V1_1
+from app.ai_modules.prompts_module_b import SYSTEM_PROMPT_B_V1_0
+from app.ai_modules.prompts_module_d import SYSTEM_PROMPT_D_V1_0
+
+# 按管道执行顺序排列：(阶段, 提示常量名, 提示内容)
+_STAGE_PROMPTS = [
+    (PipelineStage.A1, "SYSTEM_PROMPT_A1_V1_1", SYSTEM_PROMPT_A1_V1_1),
+    (PipelineStage.A2, "SYSTEM_PROMPT_A2_V1_1", SYSTEM_PROMPT_A2_V1_1),
+    (PipelineStage.NOTE_GENERATION, "SYSTEM_PROMPT_B_V1_0", SYSTEM_PROMPT_B_V1_0),
+    (PipelineStage.KNOWLEDGE_CUES, "SYSTEM_PROMPT_D_V1_0", SYSTEM_PROMPT_D_V1_0),
+]
+
+def _build_prompt_versions() -> Dict[str, str]:
+    versions: Dict[str, str] = {}
+    upstream_version = ""
+    for stage, prompt_name, prompt_text in _STAGE_PROMPTS:
+        digest = hashlib.sha256(f"{upstream_version}|{prompt_text}".encode("utf-8")).hexdigest()[:16]
+        upstream_version = f"{prompt_name}:{digest}"
+        versions[stage.value] = upstream_version
+    return versions
+
+# 阶段值 -> 提示版本号，例如 {"a1": "SYSTEM_PROMPT_A1_V1_1:3f2a...", ...}
+PROMPT_VERSIONS: Dict[str, str] = _build_prompt_versions()
@@ -35,6 +35,7 @@ The system (orchestrator code) will provide you with input, typically as a JSON
 
 2.  **`userInputVideoTitle`** (string, optional, nullable): A video title potentially provided by the user along with the transcript.
 3.  **`userInputSourceDescription`** (string, optional, nullable): A source description potentially provided by the user.
+4.  **Known Total Duration** (float, optional): The measured duration of the media in seconds, when the system knows it.
 
 ## 3. Core Tasks
 # [Task 7, text, B 和 C 部分有重要更新]
@@ -77,7 +78,7 @@ Based on the provided input, you must perform the following tasks with precision
             *   Achieve logical breaks by **creating a new `transcriptSegment` object**.
         *   **E. Preserve Original Language:** (Instruction from v1.3 remains)
         *   The overall goal for `text` is a polished, human-readable, and **factually accurate** representation of the ASR input, segmented logically.
-8.  **Estimate `totalDurationSeconds`**: `endTimeSeconds` of your last `transcriptSegment`, or `null`.
+8.  **Estimate `totalDurationSeconds`**: If the user message provides a Known Total Duration, output `null` (the system fills in the measured value; do not estimate it). Otherwise, `endTimeSeconds` of your last `transcriptSegment`, or `null`.
 
 ## 4. Output Format Specification
 # [保持不变，内容同v1.3]
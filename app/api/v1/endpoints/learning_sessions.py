@@ -1,83 +1,80 @@
 import uuid
 from datetime import datetime
 from typing import Optional, Dict, Any, List
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, BackgroundTasks
+from fastapi import APIRouter, Body, Depends, HTTPException, Path
 from sqlalchemy.orm import Session
 import json
 
-from app.core.enums import ProcessingStatus
+from app.core.enums import ProcessingStatus, PipelineJobStatus
 from app.models.data_models import (
     LearningSessionInput, 
     LearningSessionResponse,
+    LearningSessionBatchInput,
+    LearningSessionBatchItem,
+    LearningSessionBatchResponse,
     LearningSessionDetail,
     NoteWithCues,
     FinalResultsPayload,
     GeneratedNoteRead,
-    KnowledgeCueRead
+    KnowledgeCueRead,
+    SessionProgressRead,
+    StageTimingRead,
+    SessionTimingsResponse
 )
 from app.db.database import get_db
 from app.db import crud
 from app.db.models import LearningSession as DbLearningSession
-from app.services.orchestration import start_session_processing_pipeline
+from app.services.job_queue import ensure_queue_capacity, enqueue_new_session, enqueue_session_batch, PipelineQueueFullError
+from app.services.cancellation import cancel_session
 from app.core.config import Settings, get_settings
 
 router = APIRouter()
 
+def _validate_session_input(session_input: LearningSessionInput) -> Optional[str]:
+    """
+     校验会话输入必须且只能提供URL或原始转录之一
+
+     @param session_input 学习会话输入数据
+     @return 校验失败时的错误信息，通过时返回None
+    """
+    # Validate that either bilibili_video_url or rawTranscriptText is provided
+    if not session_input.bilibili_video_url and not session_input.rawTranscriptText:
+        return "Either 'bilibili_video_url' or 'rawTranscriptText' must be provided."
+    # Validate that not both are provided simultaneously (optional, but good practice)
+    if session_input.bilibili_video_url and session_input.rawTranscriptText:
+        return "Provide either 'bilibili_video_url' or 'rawTranscriptText', but not both."
+    return None
+
 @router.post("/", response_model=LearningSessionResponse)
 async def create_learning_session(
     session_input: LearningSessionInput = Body(...),
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
     settings: Settings = Depends(get_settings)
 ) -> LearningSessionResponse:
     """
      创建新的学习会话
      
+     会话处理管道不在请求内启动，而是写入持久化任务队列，由管道工作池认领执行。
+     
      @param session_input 学习会话输入数据
      @param db 数据库会话（通过依赖注入）
-     @param background_tasks 后台任务队列（用于异步处理）
      @param settings 配置设置
      @return LearningSessionResponse 新创建的学习会话信息
     """
-    # Validate that either bilibili_video_url or rawTranscriptText is provided
-    if not session_input.bilibili_video_url and not session_input.rawTranscriptText:
-        raise HTTPException(
-            status_code=422,
-            detail="Either 'bilibili_video_url' or 'rawTranscriptText' must be provided."
-        )
-    # Validate that not both are provided simultaneously (optional, but good practice)
-    if session_input.bilibili_video_url and session_input.rawTranscriptText:
-        raise HTTPException(
-            status_code=422,
-            detail="Provide either 'bilibili_video_url' or 'rawTranscriptText', but not both."
-        )
+    validation_error = _validate_session_input(session_input)
+    if validation_error:
+        raise HTTPException(status_code=422, detail=validation_error)
 
+    # 背压：队列已满时拒绝新会话，避免突发提交压垮下游服务
     try:
-        # 步骤1: 在数据库中创建新的学习会话记录
-        db_session = crud.create_learning_session(
-            db=db,
-            status=ProcessingStatus.PROCESSING_INITIATED,
-            user_id=None  # 目前没有用户认证，将来可以添加
-        )
-        
-        # 步骤2: 使用session_id创建学习资源记录
-        db_source = crud.create_learning_source(
-            db=db,
-            session_id=db_session.session_id,
-            video_title=session_input.initialVideoTitle if session_input.initialVideoTitle else "Untitled Video - Pending AI Processing",
-            initial_source_description=session_input.initialSourceDescription,
-            user_id=None  # 目前没有用户认证，将来可以添加
-        )
-        
-        # 步骤3: 添加后台任务，启动处理管道
-        if background_tasks:
-            background_tasks.add_task(
-                start_session_processing_pipeline,
-                session_id=db_session.session_id,
-                settings=settings,
-                video_id=db_source.video_id,
-                learning_session_input=session_input 
-            )
+        ensure_queue_capacity(db, settings)
+    except PipelineQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    try:
+        # 在同一事务中创建学习会话、学习资源记录，并将处理管道写入任务队列，由工作池异步执行
+        # （任一步失败都整体回滚，不会留下没有任务、永远停在初始状态的会话）
+        db_session, _, _ = enqueue_new_session(db=db, learning_session_input=session_input)
         
         # 返回响应
         return LearningSessionResponse(
@@ -93,6 +90,87 @@ async def create_learning_session(
             detail=f"创建学习会话失败: {str(e)}"
         )
 
+@router.post("/batch", response_model=LearningSessionBatchResponse)
+async def create_learning_session_batch(
+    batch_input: LearningSessionBatchInput = Body(...),
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+) -> LearningSessionBatchResponse:
+    """
+     批量创建学习会话（如导入整个播放列表）
+     
+     所有会话、学习资源和管道任务在同一事务中批量写入；任务按批次顺序被工作池认领，
+     同一批次的并发数受 PIPELINE_BATCH_MAX_CONCURRENCY 限制。
+     
+     @param batch_input 批量会话输入数据
+     @param db 数据库会话（通过依赖注入）
+     @param settings 配置设置
+     @return LearningSessionBatchResponse 批次ID及各会话ID
+    """
+    items = batch_input.items
+    if not items:
+        raise HTTPException(status_code=422, detail="'items' must contain at least one session input.")
+    if len(items) > settings.PIPELINE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"A batch may contain at most {settings.PIPELINE_BATCH_MAX_ITEMS} items, got {len(items)}."
+        )
+    for index, session_input in enumerate(items):
+        validation_error = _validate_session_input(session_input)
+        if validation_error:
+            raise HTTPException(status_code=422, detail=f"items[{index}]: {validation_error}")
+
+    try:
+        ensure_queue_capacity(db, settings, incoming_jobs=len(items))
+    except PipelineQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    try:
+        db_batch, db_jobs = enqueue_session_batch(db, items)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"批量创建学习会话失败: {str(e)}")
+
+    return LearningSessionBatchResponse(
+        batchId=db_batch.batch_id,
+        sessions=[
+            LearningSessionBatchItem(
+                position=db_job.batch_position,
+                sessionId=db_job.session_id,
+                status=ProcessingStatus.PROCESSING_INITIATED,
+                jobStatus=PipelineJobStatus.QUEUED
+            )
+            for db_job in db_jobs
+        ]
+    )
+
+@router.get("/batch/{batch_id}", response_model=LearningSessionBatchResponse)
+async def get_learning_session_batch(
+    batch_id: str,
+    db: Session = Depends(get_db)
+) -> LearningSessionBatchResponse:
+    """
+     查询批次内各会话的处理状态
+     
+     @param batch_id 批次ID
+     @param db 数据库会话（通过依赖注入）
+     @return LearningSessionBatchResponse 批次ID及各会话状态
+    """
+    if crud.get_session_batch(db, batch_id) is None:
+        raise HTTPException(status_code=404, detail=f"Batch ID {batch_id} not found")
+    return LearningSessionBatchResponse(
+        batchId=batch_id,
+        sessions=[
+            LearningSessionBatchItem(
+                position=db_job.batch_position,
+                sessionId=db_session.session_id,
+                status=db_session.status,
+                jobStatus=db_job.status
+            )
+            for db_job, db_session in crud.get_batch_sessions(db, batch_id)
+        ]
+    )
+
 @router.get("/{session_id}/status", response_model=LearningSessionDetail)
 async def get_learning_session_status(
     session_id: str,
@@ -153,6 +231,9 @@ async def get_learning_session_status(
 
     session_detail = LearningSessionDetail.model_validate(db_session)
     session_detail.final_results = final_results_payload
+    db_progress = crud.get_session_progress(db, session_id)
+    if db_progress is not None:
+        session_detail.progress = SessionProgressRead.model_validate(db_progress)
 
     # Ensure the status is correctly cast to the enum if not already
     # This should be handled by Pydantic model validation, but as a safeguard:
@@ -205,6 +286,139 @@ async def update_learning_session_status_manual(
             detail=f"更新会话状态失败: {str(e)}"
         )
 
+@router.post("/{session_id}/resume", response_model=LearningSessionResponse)
+async def resume_learning_session(
+    session_id: str = Path(..., description="要恢复处理的会话ID"),
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+) -> LearningSessionResponse:
+    """
+     恢复处理失败的学习会话
+     
+     重新将会话写入任务队列。管道会加载已保存的阶段检查点，
+     跳过已完成的阶段（例如下载/ASR、A.1、A.2），从第一个未完成阶段继续。
+     
+     @param session_id 会话ID
+     @param db 数据库会话（通过依赖注入）
+     @param settings 配置设置
+     @return LearningSessionResponse 恢复后的会话信息
+    """
+    db_session = crud.get_learning_session(db, session_id)
+    if db_session is None:
+        raise HTTPException(status_code=404, detail=f"Session ID {session_id} not found")
+
+    if db_session.status == ProcessingStatus.ALL_PROCESSING_COMPLETE.value:
+        raise HTTPException(status_code=409, detail=f"Session {session_id} has already completed processing.")
+
+    latest_job = crud.get_latest_pipeline_job_for_session(db, session_id)
+    if latest_job is None:
+        raise HTTPException(status_code=409, detail=f"Session {session_id} has no recorded pipeline input to resume from.")
+    if latest_job.status in (
+        PipelineJobStatus.QUEUED.value,
+        PipelineJobStatus.RUNNING.value,
+        PipelineJobStatus.CANCEL_REQUESTED.value
+    ):
+        raise HTTPException(status_code=409, detail=f"Session {session_id} is still being processed (job status '{latest_job.status}').")
+
+    try:
+        ensure_queue_capacity(db, settings)
+    except PipelineQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    try:
+        crud.create_pipeline_job(
+            db=db,
+            session_id=session_id,
+            video_id=latest_job.video_id,
+            payload_json=latest_job.payload_json
+        )
+        updated_session = crud.update_learning_session_status(db, session_id, ProcessingStatus.PROCESSING_RESUMED)
+        return LearningSessionResponse(
+            sessionId=updated_session.session_id,
+            status=updated_session.status
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"恢复学习会话失败: {str(e)}"
+        )
+
+@router.post("/{session_id}/cancel", response_model=LearningSessionResponse)
+async def cancel_learning_session(
+    session_id: str = Path(..., description="要取消的会话ID"),
+    db: Session = Depends(get_db)
+) -> LearningSessionResponse:
+    """
+     取消正在排队或处理中的学习会话
+     
+     排队中的任务直接取消；运行中的管道会终止yt-dlp/ffmpeg子进程、停止讯飞轮询、
+     跳过剩余LLM阶段并清理临时目录，随后会话状态变为cancelled。
+     管道运行在其他工作进程中时，由该进程在下一次轮询取消请求时终止。
+     
+     @param session_id 会话ID
+     @param db 数据库会话（通过依赖注入）
+     @return LearningSessionResponse 会话当前信息
+    """
+    db_session = crud.get_learning_session(db, session_id)
+    if db_session is None:
+        raise HTTPException(status_code=404, detail=f"Session ID {session_id} not found")
+
+    latest_job = crud.get_latest_pipeline_job_for_session(db, session_id)
+    if latest_job is None or latest_job.status not in (
+        PipelineJobStatus.QUEUED.value,
+        PipelineJobStatus.RUNNING.value,
+        PipelineJobStatus.CANCEL_REQUESTED.value
+    ):
+        raise HTTPException(status_code=409, detail=f"Session {session_id} has no queued or running processing to cancel.")
+
+    try:
+        db_job = crud.request_pipeline_job_cancel(db, latest_job.job_id)
+        if db_job.status == PipelineJobStatus.CANCELLED.value:
+            # 任务尚未被认领，直接结束
+            db_session = crud.update_learning_session_status(db, session_id, ProcessingStatus.CANCELLED)
+        else:
+            # 管道在本进程内运行时立即取消，否则等待所属工作进程轮询到取消请求
+            cancel_session(session_id)
+            db.refresh(db_session)
+        return LearningSessionResponse(
+            sessionId=db_session.session_id,
+            status=db_session.status
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"取消学习会话失败: {str(e)}"
+        )
+
+@router.get("/{session_id}/timings", response_model=SessionTimingsResponse)
+async def get_session_timings(
+    session_id: str = Path(..., description="会话ID"),
+    db: Session = Depends(get_db)
+) -> SessionTimingsResponse:
+    """
+     获取会话各管道步骤的耗时明细
+     
+     每个已执行的步骤（下载、音频提取、ASR、A.1/A.2/B/D）一条记录，
+     包含开始/结束时间、排队等待时间、字节数、片段数和LLM令牌用量。重试/恢复产生的记录会一并列出。
+     
+     @param session_id 会话ID
+     @param db 数据库会话（通过依赖注入）
+     @return SessionTimingsResponse 步骤耗时明细
+    """
+    db_session = crud.get_learning_session(db, session_id)
+    if db_session is None:
+        raise HTTPException(status_code=404, detail=f"Session ID {session_id} not found")
+
+    db_metrics = crud.get_stage_metrics_by_session_id(db, session_id)
+    return SessionTimingsResponse(
+        session_id=session_id,
+        status=db_session.status,
+        total_duration_ms=sum(db_metric.duration_ms for db_metric in db_metrics),
+        stages=[StageTimingRead.model_validate(db_metric) for db_metric in db_metrics]
+    )
+
 @router.get("/{session_id}/source", response_model=Dict[str, Any])
 async def get_session_source(
     session_id: str = Path(..., description="会话ID"),
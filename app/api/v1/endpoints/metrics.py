@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.db.database import get_db
+from app.db import crud
+from app.services.resource_governor import get_resource_governor
+from app.services.stage_metrics import summarize_stage_durations
+
+router = APIRouter()
+
+@router.get("/resources")
+async def get_resource_metrics() -> Dict[str, Any]:
+    """
+     获取外部资源（Gemini、讯飞、yt-dlp、ffmpeg）的占用与排队等待指标
+     
+     指标为当前进程内的统计；管道工作池单独部署时，请在工作进程一侧采集。
+     
+     @return 资源名称 -> 指标（并发上限、占用数、排队数、累计/平均/最大排队等待秒数等）
+    """
+    return {"resources": get_resource_governor().get_metrics()}
+
+@router.get("/stages")
+async def get_stage_latency_metrics(
+    window_hours: float = Query(24.0, gt=0, description="统计最近多少小时内开始的步骤"),
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """
+     获取各管道步骤耗时的 p50/p95/p99 分位数（只统计成功的步骤）
+     
+     @param window_hours 统计时间窗口（小时）
+     @param db 数据库会话（通过依赖注入）
+     @return 时间窗口与 步骤 -> 分位数统计
+    """
+    since = datetime.now() - timedelta(hours=window_hours)
+    rows = crud.get_stage_durations_since(db, since)
+    return {
+        "windowHours": window_hours,
+        "since": since.isoformat(),
+        "stages": summarize_stage_durations(rows)
+    }
@@ -3,6 +3,7 @@ from enum import Enum
 class ProcessingStatus(str, Enum):
     """Defines the comprehensive set of processing statuses for a learning session."""
     PROCESSING_INITIATED = "processing_initiated"
+    PROCESSING_RESUMED = "processing_resumed" # Re-queued via the resume endpoint, restarts at the first incomplete stage
     TRANSCRIPT_PROCESSING_STARTED = "transcript_processing_started" # For raw text input path
     BILI_PROCESSING_STARTED = "bili_processing_started"
     BILI_DOWNLOAD_ACTIVE = "bili_download_active"
@@ -31,4 +32,53 @@ class ProcessingStatus(str, Enum):
     ERROR_IN_D_LLM = "error_in_d_llm"
     ALL_PROCESSING_COMPLETE = "all_processing_complete"
     ERROR_NO_VALID_INPUT = "error_no_valid_input"
-    ERROR_PIPELINE_FAILED = "error_pipeline_failed" # Generic pipeline failure 
\ No newline at end of file
+    ERROR_PIPELINE_FAILED = "error_pipeline_failed" # Generic pipeline failure 
+    CANCELLED = "cancelled" # Cancelled by the user via the cancel endpoint
+
+class PipelineJobStatus(str, Enum):
+    """Lifecycle states of a queued session pipeline job (see app.services.job_queue)."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    CANCEL_REQUESTED = "cancel_requested" # Running job asked to stop; the owning worker cancels its pipeline
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class AsrTaskStatus(str, Enum):
+    """Lifecycle phases of an LFASR task persisted in asr_tasks, in order (see app.services.xunfei_async_asr_service)."""
+    PREPARED = "prepared" # /prepare returned a task_id; slices are being uploaded (uploaded ids are recorded)
+    UPLOADED = "uploaded" # Every slice acknowledged, /merge not yet confirmed
+    MERGED = "merged" # /merge accepted, transcription running on the Xunfei side
+    POLLING = "polling" # Tracked by the central poller, waiting for the transcription to finish
+    SUCCEEDED = "succeeded" # Finished; the result is stored once /getResult returns
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class PipelineStage(str, Enum):
+    """Checkpointed stages of the session pipeline, in execution order."""
+    TRANSCRIPT = "transcript" # Parsed segments fed to A.1 (download + ASR, or raw transcript parsing)
+    A1 = "a1"
+    A2 = "a2"
+    NOTE_GENERATION = "b"
+    KNOWLEDGE_CUES = "d"
+
+class MetricStage(str, Enum):
+    """Timed steps of the session pipeline recorded in session_stage_metrics (finer-grained than PipelineStage)."""
+    PROBE = "probe" # yt-dlp metadata probe (duration, audio codec, size) before download
+    DOWNLOAD = "download" # yt-dlp
+    AUDIO_EXTRACTION = "audio_extraction" # ffmpeg
+    STREAMED_ACQUISITION = "streamed_acquisition" # yt-dlp piped into ffmpeg (replaces DOWNLOAD + AUDIO_EXTRACTION)
+    SILENCE_TRIM = "silence_trim" # VAD pre-pass that cuts long silences before ASR
+    AUDIO_CHUNKING = "audio_chunking" # Splitting long audio at quiet points for parallel ASR tasks
+    ASR = "asr" # Xunfei upload + queueing + transcription
+    TRANSCRIPT_PARSE = "transcript_parse" # Raw transcript text input path
+    A1 = "a1"
+    A2 = "a2"
+    NOTE_GENERATION = "b"
+    KNOWLEDGE_CUES = "d"
+
+class StageOutcome(str, Enum):
+    """Outcome of a timed pipeline step."""
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
@@ -2,7 +2,8 @@
 Core utility functions for the application.
 """
 import re
-from urllib.parse import urlparse, urlunparse
+from typing import Optional, Tuple
+from urllib.parse import urlparse, urlunparse, parse_qs
 
 def normalize_bilibili_url(url_string: str) -> str:
     """
@@ -73,6 +74,51 @@ def normalize_bilibili_url(url_string: str) -> str:
     # If URL is not recognized as a Bilibili or b23.tv domain that we can process
     return ""
 
+def extract_bilibili_video_key(url_string: str) -> Optional[Tuple[str, int]]:
+    """
+    Extracts the canonical (BV ID, page) pair identifying a single Bilibili video part.
+
+    Uses the same BV ID rules as `normalize_bilibili_url`, and additionally reads the
+    `p` query parameter (multi-part videos) which the normalized URL drops.
+    b23.tv short links cannot be resolved offline and yield None.
+
+    Args:
+        url_string: The Bilibili video URL string (raw or normalized) or a bare BV ID.
+
+    Returns:
+        A (bv_id, page) tuple with page >= 1, or None if no BV ID can be identified.
+    """
+    normalized_url = normalize_bilibili_url(url_string)
+    bv_match = re.search(r"/video/(BV[1-9A-HJ-NP-Za-km-z]{10})/", normalized_url)
+    if not bv_match:
+        return None
+
+    page = 1
+    try:
+        query_params = parse_qs(urlparse(url_string.strip()).query)
+        if 'p' in query_params:
+            page = max(1, int(query_params['p'][0]))
+    except ValueError:
+        page = 1
+    return bv_match.group(1), page
+
+def build_bilibili_download_url(url_string: str) -> str:
+    """
+    Builds the URL handed to yt-dlp: the normalized URL plus the `p` query parameter
+    for parts after the first, so multi-part videos fetch the requested part.
+
+    Args:
+        url_string: The Bilibili video URL string (raw or normalized) or a bare BV ID.
+
+    Returns:
+        The download URL, or an empty string if the URL is not recognized.
+    """
+    normalized_url = normalize_bilibili_url(url_string)
+    video_key = extract_bilibili_video_key(url_string)
+    if normalized_url and video_key and video_key[1] > 1:
+        return f"{normalized_url}?p={video_key[1]}"
+    return normalized_url
+
 if __name__ == '__main__':
     # Test cases
     urls_to_test = [
@@ -3,9 +3,11 @@
  
  该模块提供数据库CRUD（创建、读取、更新、删除）操作函数。
 """
-from typing import Optional, List
+from datetime import datetime
+from typing import Optional, List, Tuple
+from sqlalchemy import and_, case, func, or_
 from sqlalchemy.orm import Session
-from app.core.enums import ProcessingStatus
+from app.core.enums import ProcessingStatus, PipelineJobStatus, PipelineStage, MetricStage, StageOutcome, AsrTaskStatus
 
 from . import models as db_models
 from app.models import data_models as pydantic_models
@@ -308,4 +310,1047 @@ def get_learning_source_by_video_id(db: Session, video_id: str) -> Optional[db_m
     Returns:
         The LearningSource object if found, otherwise None.
     """
-    return db.query(db_models.LearningSource).filter(db_models.LearningSource.video_id == video_id).first() 
\ No newline at end of file
+    return db.query(db_models.LearningSource).filter(db_models.LearningSource.video_id == video_id).first()
+
+def create_pipeline_job(
+    db: Session,
+    session_id: str,
+    video_id: str,
+    payload_json: str,
+    media_duration_seconds: Optional[float] = None
+) -> db_models.PipelineJob:
+    """
+     创建排队中的管道任务记录
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @param video_id 视频ID
+     @param payload_json 序列化后的LearningSessionInput
+     @param media_duration_seconds 已探测到的媒体时长（秒，可选）
+     @return 创建的管道任务数据库模型实例
+    """
+    db_job = db_models.PipelineJob(
+        session_id=session_id,
+        video_id=video_id,
+        payload_json=payload_json,
+        status=PipelineJobStatus.QUEUED.value,
+        media_duration_seconds=media_duration_seconds
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def create_session_with_pipeline_job(
+    db: Session,
+    session_input: pydantic_models.LearningSessionInput,
+    user_id: Optional[str] = None,
+    media_duration_seconds: Optional[float] = None
+) -> Tuple[db_models.LearningSession, db_models.LearningSource, db_models.PipelineJob]:
+    """
+     在单个事务中创建会话、学习资源和排队中的管道任务
+     
+     主键预先生成，三条记录只提交一次，任一条失败则全部回滚，不会留下没有任务的会话。
+     
+     @param db 数据库会话
+     @param session_input 会话输入，序列化后随任务持久化
+     @param user_id 用户ID（可选）
+     @param media_duration_seconds 已探测到的媒体时长（秒，可选）
+     @return (会话记录, 学习资源记录, 管道任务记录)
+    """
+    session_id = db_models.generate_uuid()
+    video_id = db_models.generate_uuid()
+    db_session = db_models.LearningSession(
+        session_id=session_id,
+        status=ProcessingStatus.PROCESSING_INITIATED.value,
+        user_id=user_id
+    )
+    db_source = db_models.LearningSource(
+        video_id=video_id,
+        session_id=session_id,
+        video_title=session_input.initialVideoTitle or "Untitled Video - Pending AI Processing",
+        source_description=session_input.initialSourceDescription,
+        user_id=user_id
+    )
+    db_job = db_models.PipelineJob(
+        session_id=session_id,
+        video_id=video_id,
+        payload_json=session_input.model_dump_json(),
+        status=PipelineJobStatus.QUEUED.value,
+        media_duration_seconds=media_duration_seconds
+    )
+    try:
+        db.add(db_session)
+        db.add(db_source)
+        db.add(db_job)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(db_session)
+    return db_session, db_source, db_job
+
+def create_session_batch(
+    db: Session,
+    session_inputs: List[pydantic_models.LearningSessionInput],
+    user_id: Optional[str] = None,
+    media_durations: Optional[List[Optional[float]]] = None
+) -> Tuple[db_models.SessionBatch, List[db_models.PipelineJob]]:
+    """
+     在单个事务中批量创建会话、学习资源和排队中的管道任务
+     
+     主键预先生成，三类记录分别批量插入，整个批次只提交一次，任一条失败则全部回滚。
+     
+     @param db 数据库会话
+     @param session_inputs 批次内各会话的输入，顺序即批次内序号
+     @param user_id 用户ID（可选）
+     @param media_durations 与 session_inputs 对应的已探测媒体时长（秒，可选，未知项为None）
+     @return (批次记录, 按批次顺序排列的管道任务列表)
+    """
+    db_batch = db_models.SessionBatch(
+        batch_id=db_models.generate_uuid(),
+        item_count=len(session_inputs)
+    )
+    db_sessions = []
+    db_sources = []
+    db_jobs = []
+    for position, session_input in enumerate(session_inputs):
+        session_id = db_models.generate_uuid()
+        video_id = db_models.generate_uuid()
+        db_sessions.append(db_models.LearningSession(
+            session_id=session_id,
+            status=ProcessingStatus.PROCESSING_INITIATED.value,
+            user_id=user_id
+        ))
+        db_sources.append(db_models.LearningSource(
+            video_id=video_id,
+            session_id=session_id,
+            video_title=session_input.initialVideoTitle or "Untitled Video - Pending AI Processing",
+            source_description=session_input.initialSourceDescription,
+            user_id=user_id
+        ))
+        db_jobs.append(db_models.PipelineJob(
+            session_id=session_id,
+            video_id=video_id,
+            payload_json=session_input.model_dump_json(),
+            status=PipelineJobStatus.QUEUED.value,
+            batch_id=db_batch.batch_id,
+            batch_position=position,
+            media_duration_seconds=media_durations[position] if media_durations else None
+        ))
+    try:
+        db.add(db_batch)
+        db.add_all(db_sessions)
+        db.add_all(db_sources)
+        db.add_all(db_jobs)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return db_batch, db_jobs
+
+def get_session_batch(db: Session, batch_id: str) -> Optional[db_models.SessionBatch]:
+    """
+     根据批次ID获取会话批次
+     
+     @param db 数据库会话
+     @param batch_id 批次ID
+     @return 会话批次数据库模型实例，如果不存在则返回None
+    """
+    return db.query(db_models.SessionBatch).filter(db_models.SessionBatch.batch_id == batch_id).first()
+
+def get_batch_sessions(db: Session, batch_id: str) -> List[Tuple[db_models.PipelineJob, db_models.LearningSession]]:
+    """
+     获取批次内的管道任务及其会话，按批次内序号排序
+     
+     @param db 数据库会话
+     @param batch_id 批次ID
+     @return (管道任务, 学习会话) 列表
+    """
+    return (
+        db.query(db_models.PipelineJob, db_models.LearningSession)
+        .join(db_models.LearningSession, db_models.LearningSession.session_id == db_models.PipelineJob.session_id)
+        .filter(db_models.PipelineJob.batch_id == batch_id)
+        .order_by(db_models.PipelineJob.batch_position)
+        .all()
+    )
+
+def count_queued_pipeline_jobs(db: Session) -> int:
+    """
+     统计仍在排队（尚未被工作进程认领）的管道任务数量
+     
+     @param db 数据库会话
+     @return 排队中的任务数量
+    """
+    return db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.status == PipelineJobStatus.QUEUED.value
+    ).count()
+
+def claim_next_pipeline_job(
+    db: Session,
+    worker_id: str,
+    batch_max_concurrency: int = 0,
+    long_job_seconds: float = 0,
+    long_lane_max_running: int = 0
+) -> Optional[db_models.PipelineJob]:
+    """
+     认领下一个排队中的管道任务
+     
+     使用 SELECT ... FOR UPDATE SKIP LOCKED，多个工作进程并发认领时互不阻塞，
+     且同一任务只会被一个工作进程拿到。批次任务按批次内序号依次认领；
+     已有 batch_max_concurrency 个任务在运行的批次会被跳过，让其他会话得到工作协程。
+     媒体时长不短于 long_job_seconds 的任务属于长任务通道，运行中的长任务达到 long_lane_max_running 个时
+     不再认领长任务，避免几条长视频占满所有工作协程。认领前的这两项过滤只是预筛选，
+     两个上限都由认领提交后的复核保证（见 release_pipeline_job_over_limits）。
+     
+     @param db 数据库会话
+     @param worker_id 认领任务的工作进程标识
+     @param batch_max_concurrency 同一批次同时运行的任务上限（0表示不限制）
+     @param long_job_seconds 长任务的媒体时长阈值（秒，0表示不区分通道）
+     @param long_lane_max_running 同时运行的长任务上限（0表示不限制）
+     @return 已标记为running的任务，如果队列为空则返回None
+    """
+    active_statuses = [PipelineJobStatus.RUNNING.value, PipelineJobStatus.CANCEL_REQUESTED.value]
+    query = db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.status == PipelineJobStatus.QUEUED.value
+    )
+    if long_job_seconds > 0 and long_lane_max_running > 0:
+        running_long_jobs = count_running_long_pipeline_jobs(db, long_job_seconds)
+        if running_long_jobs >= long_lane_max_running:
+            query = query.filter(or_(
+                db_models.PipelineJob.media_duration_seconds.is_(None),
+                db_models.PipelineJob.media_duration_seconds < long_job_seconds
+            ))
+    if batch_max_concurrency > 0:
+        saturated_batch_ids = (
+            db.query(db_models.PipelineJob.batch_id)
+            .filter(
+                db_models.PipelineJob.batch_id.isnot(None),
+                db_models.PipelineJob.status.in_(active_statuses)
+            )
+            .group_by(db_models.PipelineJob.batch_id)
+            .having(func.count(db_models.PipelineJob.job_id) >= batch_max_concurrency)
+        )
+        query = query.filter(or_(
+            db_models.PipelineJob.batch_id.is_(None),
+            db_models.PipelineJob.batch_id.notin_(saturated_batch_ids)
+        ))
+    db_job = (
+        query
+        .order_by(db_models.PipelineJob.created_at, db_models.PipelineJob.batch_position)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if db_job is None:
+        # 结束只读事务，释放可能持有的锁
+        db.commit()
+        return None
+
+    # 条件更新保证只有一个工作进程认领成功（不支持SKIP LOCKED的数据库如SQLite会忽略行锁）
+    now = datetime.now()
+    claimed_count = db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.job_id == db_job.job_id,
+        db_models.PipelineJob.status == PipelineJobStatus.QUEUED.value
+    ).update({
+        db_models.PipelineJob.status: PipelineJobStatus.RUNNING.value,
+        db_models.PipelineJob.worker_id: worker_id,
+        db_models.PipelineJob.attempts: db_models.PipelineJob.attempts + 1,
+        db_models.PipelineJob.claimed_at: now,
+        db_models.PipelineJob.heartbeat_at: now
+    }, synchronize_session=False)
+    db.commit()
+    if claimed_count != 1:
+        return None
+    db.refresh(db_job)
+    if release_pipeline_job_over_limits(db, db_job, batch_max_concurrency, long_job_seconds, long_lane_max_running):
+        return None
+    db.refresh(db_job)
+    return db_job
+
+def release_pipeline_job_over_limits(
+    db: Session,
+    db_job: db_models.PipelineJob,
+    batch_max_concurrency: int = 0,
+    long_job_seconds: float = 0,
+    long_lane_max_running: int = 0
+) -> bool:
+    """
+     复核已提交的认领（或刚记录的媒体时长）是否使运行中的任务超出上限，超出则把任务放回队列
+     
+     各工作进程先提交认领、再在新事务中复核，复核能看到此前已提交的所有认领：并发认领同一批次或同一通道时，
+     至少后复核的一方会看到对方并放回，因此运行中的任务数不会超过上限；双方同时看到对方时都会放回，
+     由下一轮认领重新竞争。
+     
+     @param db 数据库会话
+     @param db_job 已由当前工作进程认领并提交的任务
+     @param batch_max_concurrency 同一批次同时运行的任务上限（0表示不限制）
+     @param long_job_seconds 长任务的媒体时长阈值（秒，0表示不区分通道）
+     @param long_lane_max_running 同时运行的长任务上限（0表示不限制）
+     @return 是否已放回队列
+    """
+    over_limit = (
+        batch_max_concurrency > 0
+        and db_job.batch_id is not None
+        and db.query(db_models.PipelineJob).filter(
+            db_models.PipelineJob.batch_id == db_job.batch_id,
+            db_models.PipelineJob.status.in_([PipelineJobStatus.RUNNING.value, PipelineJobStatus.CANCEL_REQUESTED.value])
+        ).count() > batch_max_concurrency
+    ) or (
+        long_job_seconds > 0
+        and long_lane_max_running > 0
+        and db_job.media_duration_seconds is not None
+        and db_job.media_duration_seconds >= long_job_seconds
+        and count_running_long_pipeline_jobs(db, long_job_seconds) > long_lane_max_running
+    )
+    if not over_limit:
+        # 结束只读事务
+        db.commit()
+        return False
+    return release_pipeline_job(db, db_job.job_id, db_job.media_duration_seconds)
+
+def count_running_long_pipeline_jobs(db: Session, long_job_seconds: float) -> int:
+    """
+     统计运行中（含请求取消中）的长任务数量
+     
+     @param db 数据库会话
+     @param long_job_seconds 长任务的媒体时长阈值（秒）
+     @return 运行中的长任务数量
+    """
+    return db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.status.in_([PipelineJobStatus.RUNNING.value, PipelineJobStatus.CANCEL_REQUESTED.value]),
+        db_models.PipelineJob.media_duration_seconds >= long_job_seconds
+    ).count()
+
+def release_pipeline_job(
+    db: Session,
+    job_id: str,
+    media_duration_seconds: Optional[float] = None
+) -> bool:
+    """
+     把刚认领的任务放回队列（不计入尝试次数），例如探测后发现是长任务而长任务通道已满
+     
+     @param db 数据库会话
+     @param job_id 任务ID
+     @param media_duration_seconds 探测到的媒体时长（秒，可选），一并写入任务
+     @return 是否已放回（任务已不在running状态时返回False）
+    """
+    released_count = db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.job_id == job_id,
+        db_models.PipelineJob.status == PipelineJobStatus.RUNNING.value
+    ).update({
+        db_models.PipelineJob.status: PipelineJobStatus.QUEUED.value,
+        db_models.PipelineJob.worker_id: None,
+        db_models.PipelineJob.attempts: db_models.PipelineJob.attempts - 1,
+        db_models.PipelineJob.claimed_at: None,
+        db_models.PipelineJob.heartbeat_at: None,
+        db_models.PipelineJob.media_duration_seconds: media_duration_seconds
+    }, synchronize_session=False)
+    db.commit()
+    return released_count == 1
+
+def set_pipeline_job_media_duration(db: Session, job_id: str, media_duration_seconds: float) -> None:
+    """
+     记录任务的媒体时长
+     
+     @param db 数据库会话
+     @param job_id 任务ID
+     @param media_duration_seconds 媒体时长（秒）
+    """
+    db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.job_id == job_id
+    ).update({db_models.PipelineJob.media_duration_seconds: media_duration_seconds}, synchronize_session=False)
+    db.commit()
+
+def touch_pipeline_job_heartbeats(db: Session, job_ids: List[str]) -> None:
+    """
+     刷新运行中任务的心跳时间
+     
+     @param db 数据库会话
+     @param job_ids 当前工作进程正在执行的任务ID列表
+    """
+    if not job_ids:
+        return
+    db.query(db_models.PipelineJob).filter(
+        db_models.PipelineJob.job_id.in_(job_ids),
+        db_models.PipelineJob.status.in_([PipelineJobStatus.RUNNING.value, PipelineJobStatus.CANCEL_REQUESTED.value])
+    ).update({db_models.PipelineJob.heartbeat_at: datetime.now()}, synchronize_session=False)
+    db.commit()
+
+def finish_pipeline_job(
+    db: Session,
+    job_id: str,
+    status: PipelineJobStatus,
+    last_error: Optional[str] = None
+) -> Optional[db_models.PipelineJob]:
+    """
+     将管道任务标记为结束状态
+     
+     @param db 数据库会话
+     @param job_id 任务ID
+     @param status 结束状态（succeeded/failed/cancelled）
+     @param last_error 失败原因（可选）
+     @return 更新后的任务数据库模型实例，如果不存在则返回None
+    """
+    db_job = db.query(db_models.PipelineJob).filter(db_models.PipelineJob.job_id == job_id).first()
+    if db_job is None:
+        return None
+    db_job.status = status.value
+    db_job.last_error = last_error
+    db_job.finished_at = datetime.now()
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def requeue_stale_pipeline_jobs(
+    db: Session,
+    stale_before: datetime,
+    max_attempts: int
+) -> List[db_models.PipelineJob]:
+    """
+     回收心跳超时的运行中任务
+     
+     工作进程崩溃或重启后，其认领的任务会停止心跳。超时任务如果还有重试次数则重新排队，
+     否则标记为失败；已请求取消的超时任务直接标记为已取消。
+     
+     @param db 数据库会话
+     @param stale_before 心跳早于该时间的运行中任务视为失联
+     @param max_attempts 最大尝试次数
+     @return 被回收（重新排队或标记失败）的任务列表
+    """
+    stale_jobs = (
+        db.query(db_models.PipelineJob)
+        .filter(
+            db_models.PipelineJob.status.in_([PipelineJobStatus.RUNNING.value, PipelineJobStatus.CANCEL_REQUESTED.value]),
+            db_models.PipelineJob.heartbeat_at < stale_before
+        )
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for db_job in stale_jobs:
+        if db_job.status == PipelineJobStatus.CANCEL_REQUESTED.value:
+            db_job.status = PipelineJobStatus.CANCELLED.value
+            db_job.finished_at = datetime.now()
+        elif (db_job.attempts or 0) >= max_attempts:
+            db_job.status = PipelineJobStatus.FAILED.value
+            db_job.last_error = "Worker heartbeat lost and max attempts reached."
+            db_job.finished_at = datetime.now()
+        else:
+            db_job.status = PipelineJobStatus.QUEUED.value
+            db_job.worker_id = None
+    db.commit()
+    return stale_jobs
+
+def request_pipeline_job_cancel(db: Session, job_id: str) -> Optional[db_models.PipelineJob]:
+    """
+     请求取消管道任务
+     
+     排队中的任务直接标记为已取消；运行中的任务标记为cancel_requested，
+     由持有该任务的工作进程在下一次轮询时终止管道。
+     
+     @param db 数据库会话
+     @param job_id 任务ID
+     @return 更新后的任务数据库模型实例，如果不存在则返回None
+    """
+    db_job = (
+        db.query(db_models.PipelineJob)
+        .filter(db_models.PipelineJob.job_id == job_id)
+        .with_for_update()
+        .first()
+    )
+    if db_job is None:
+        return None
+    if db_job.status == PipelineJobStatus.QUEUED.value:
+        db_job.status = PipelineJobStatus.CANCELLED.value
+        db_job.finished_at = datetime.now()
+    elif db_job.status == PipelineJobStatus.RUNNING.value:
+        db_job.status = PipelineJobStatus.CANCEL_REQUESTED.value
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_cancel_requested_job_ids(db: Session, job_ids: List[str]) -> List[str]:
+    """
+     在给定任务中筛选出已被请求取消的任务
+     
+     @param db 数据库会话
+     @param job_ids 当前工作进程正在执行的任务ID列表
+     @return 状态为cancel_requested的任务ID列表
+    """
+    if not job_ids:
+        return []
+    rows = db.query(db_models.PipelineJob.job_id).filter(
+        db_models.PipelineJob.job_id.in_(job_ids),
+        db_models.PipelineJob.status == PipelineJobStatus.CANCEL_REQUESTED.value
+    ).all()
+    db.commit()
+    return [row[0] for row in rows]
+
+def get_latest_pipeline_job_for_session(
+    db: Session,
+    session_id: str
+) -> Optional[db_models.PipelineJob]:
+    """
+     获取会话最近一次入队的管道任务
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @return 最近的管道任务数据库模型实例，如果不存在则返回None
+    """
+    return (
+        db.query(db_models.PipelineJob)
+        .filter(db_models.PipelineJob.session_id == session_id)
+        .order_by(db_models.PipelineJob.created_at.desc())
+        .first()
+    )
+
+def save_stage_checkpoint(
+    db: Session,
+    session_id: str,
+    stage: PipelineStage,
+    output_json: Optional[str]
+) -> db_models.SessionStageCheckpoint:
+    """
+     保存（或覆盖）会话某个阶段的检查点
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @param stage 管道阶段
+     @param output_json 阶段输出的JSON字符串
+     @return 检查点数据库模型实例
+    """
+    db_checkpoint = db.query(db_models.SessionStageCheckpoint).filter(
+        db_models.SessionStageCheckpoint.session_id == session_id,
+        db_models.SessionStageCheckpoint.stage == stage.value
+    ).first()
+    if db_checkpoint is None:
+        db_checkpoint = db_models.SessionStageCheckpoint(session_id=session_id, stage=stage.value)
+        db.add(db_checkpoint)
+    db_checkpoint.output_json = output_json
+    db.commit()
+    db.refresh(db_checkpoint)
+    return db_checkpoint
+
+def get_stage_checkpoints(
+    db: Session,
+    session_id: str
+) -> List[db_models.SessionStageCheckpoint]:
+    """
+     获取会话所有已保存的阶段检查点
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @return 检查点数据库模型实例列表
+    """
+    return db.query(db_models.SessionStageCheckpoint).filter(
+        db_models.SessionStageCheckpoint.session_id == session_id
+    ).all()
+
+def get_generated_note(db: Session, note_id: str) -> Optional[db_models.GeneratedNote]:
+    """
+     根据ID获取生成的笔记
+     
+     @param db 数据库会话
+     @param note_id 笔记ID
+     @return 笔记数据库模型实例，如果不存在则返回None
+    """
+    return db.query(db_models.GeneratedNote).filter(db_models.GeneratedNote.note_id == note_id).first()
+
+def delete_knowledge_cues_by_note_id(db: Session, note_id: str) -> int:
+    """
+     删除笔记下的所有知识提示（用于模块D重试前清理部分写入的结果）
+     
+     @param db 数据库会话
+     @param note_id 笔记ID
+     @return 删除的记录数
+    """
+    deleted_count = db.query(db_models.KnowledgeCue).filter(
+        db_models.KnowledgeCue.note_id == note_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted_count
+
+def get_video_cache_entries(
+    db: Session,
+    cache_key: str
+) -> List[db_models.VideoContentCache]:
+    """
+     获取某个视频缓存键下的所有阶段缓存记录
+     
+     @param db 数据库会话
+     @param cache_key 视频缓存键（BV号+分P）
+     @return 缓存记录列表
+    """
+    return db.query(db_models.VideoContentCache).filter(
+        db_models.VideoContentCache.cache_key == cache_key
+    ).all()
+
+def upsert_video_cache_entry(
+    db: Session,
+    cache_key: str,
+    stage: PipelineStage,
+    output_json: str,
+    expires_at: datetime,
+    prompt_version: Optional[str] = None,
+    input_fingerprint: Optional[str] = None
+) -> db_models.VideoContentCache:
+    """
+     写入（或覆盖）视频某个阶段的缓存
+     
+     @param db 数据库会话
+     @param cache_key 视频缓存键（BV号+分P）
+     @param stage 管道阶段
+     @param output_json 阶段输出的JSON字符串
+     @param expires_at 过期时间
+     @param prompt_version 生成该输出的提示版本（可选）
+     @param input_fingerprint 用户输入指纹（可选）
+     @return 缓存记录
+    """
+    db_entry = db.query(db_models.VideoContentCache).filter(
+        db_models.VideoContentCache.cache_key == cache_key,
+        db_models.VideoContentCache.stage == stage.value
+    ).first()
+    if db_entry is None:
+        db_entry = db_models.VideoContentCache(cache_key=cache_key, stage=stage.value)
+        db.add(db_entry)
+    db_entry.output_json = output_json
+    db_entry.prompt_version = prompt_version
+    db_entry.input_fingerprint = input_fingerprint
+    db_entry.created_at = datetime.now()
+    db_entry.expires_at = expires_at
+    db.commit()
+    db.refresh(db_entry)
+    return db_entry
+
+def delete_video_cache_entries(db: Session, cache_ids: List[str]) -> int:
+    """
+     删除指定的视频缓存记录（过期或提示版本已变化）
+     
+     @param db 数据库会话
+     @param cache_ids 缓存记录ID列表
+     @return 删除的记录数
+    """
+    if not cache_ids:
+        return 0
+    deleted_count = db.query(db_models.VideoContentCache).filter(
+        db_models.VideoContentCache.cache_id.in_(cache_ids)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted_count
+
+def create_stage_metric(
+    db: Session,
+    session_id: str,
+    stage: MetricStage,
+    outcome: StageOutcome,
+    started_at: datetime,
+    finished_at: datetime,
+    duration_ms: int,
+    queue_wait_ms: int = 0,
+    bytes_in: Optional[int] = None,
+    bytes_out: Optional[int] = None,
+    segment_count: Optional[int] = None,
+    prompt_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None
+) -> db_models.SessionStageMetric:
+    """
+     记录一个管道步骤的耗时与用量
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @param stage 管道步骤
+     @param outcome 执行结果
+     @param started_at 开始时间
+     @param finished_at 结束时间
+     @param duration_ms 耗时（毫秒）
+     @param queue_wait_ms 等待资源槽位的时间（毫秒）
+     @param bytes_in 输入字节数（可选）
+     @param bytes_out 输出字节数（可选）
+     @param segment_count 片段数（可选）
+     @param prompt_tokens LLM输入令牌数（可选）
+     @param output_tokens LLM输出令牌数（可选）
+     @return 创建的阶段耗时数据库模型实例
+    """
+    db_metric = db_models.SessionStageMetric(
+        session_id=session_id,
+        stage=stage.value,
+        outcome=outcome.value,
+        started_at=started_at,
+        finished_at=finished_at,
+        duration_ms=duration_ms,
+        queue_wait_ms=queue_wait_ms,
+        bytes_in=bytes_in,
+        bytes_out=bytes_out,
+        segment_count=segment_count,
+        prompt_tokens=prompt_tokens,
+        output_tokens=output_tokens
+    )
+    db.add(db_metric)
+    db.commit()
+    db.refresh(db_metric)
+    return db_metric
+
+def get_stage_metrics_by_session_id(db: Session, session_id: str) -> List[db_models.SessionStageMetric]:
+    """
+     获取会话的所有阶段耗时记录，按开始时间排序
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @return 阶段耗时记录列表
+    """
+    return (
+        db.query(db_models.SessionStageMetric)
+        .filter(db_models.SessionStageMetric.session_id == session_id)
+        .order_by(db_models.SessionStageMetric.started_at)
+        .all()
+    )
+
+def get_stage_durations_since(
+    db: Session,
+    since: datetime,
+    outcome: StageOutcome = StageOutcome.SUCCEEDED
+) -> List[Tuple[str, int, int]]:
+    """
+     获取某时间之后开始的阶段耗时，用于计算分位数
+     
+     @param db 数据库会话
+     @param since 起始时间
+     @param outcome 只统计该结果的记录
+     @return (阶段, 耗时毫秒, 排队等待毫秒) 列表
+    """
+    return (
+        db.query(
+            db_models.SessionStageMetric.stage,
+            db_models.SessionStageMetric.duration_ms,
+            db_models.SessionStageMetric.queue_wait_ms
+        )
+        .filter(
+            db_models.SessionStageMetric.started_at >= since,
+            db_models.SessionStageMetric.outcome == outcome.value
+        )
+        .all()
+    )
+
+def upsert_session_progress(
+    db: Session,
+    session_id: str,
+    stage: MetricStage,
+    percent: float
+) -> db_models.SessionProgress:
+    """
+     写入（或覆盖）会话当前步骤的完成百分比
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @param stage 当前管道步骤
+     @param percent 完成百分比（0~100）
+     @return 会话进度数据库模型实例
+    """
+    db_progress = db.query(db_models.SessionProgress).filter(
+        db_models.SessionProgress.session_id == session_id
+    ).first()
+    if db_progress is None:
+        db_progress = db_models.SessionProgress(session_id=session_id)
+        db.add(db_progress)
+    db_progress.stage = stage.value
+    db_progress.percent = percent
+    db_progress.updated_at = datetime.now()
+    db.commit()
+    db.refresh(db_progress)
+    return db_progress
+
+def get_session_progress(db: Session, session_id: str) -> Optional[db_models.SessionProgress]:
+    """
+     获取会话当前步骤的进度
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @return 会话进度数据库模型实例，如果没有记录则返回None
+    """
+    return db.query(db_models.SessionProgress).filter(
+        db_models.SessionProgress.session_id == session_id
+    ).first()
+
+def get_media_probe(db: Session, cache_key: str) -> Optional[db_models.MediaProbe]:
+    """
+     获取视频的媒体探测结果（含已过期的记录，由调用方判断）
+     
+     @param db 数据库会话
+     @param cache_key 视频缓存键
+     @return 媒体探测数据库模型实例，如果不存在则返回None
+    """
+    return db.query(db_models.MediaProbe).filter(db_models.MediaProbe.cache_key == cache_key).first()
+
+def get_media_probes(db: Session, cache_keys: List[str]) -> List[db_models.MediaProbe]:
+    """
+     批量获取媒体探测结果
+     
+     @param db 数据库会话
+     @param cache_keys 视频缓存键列表
+     @return 媒体探测数据库模型实例列表
+    """
+    if not cache_keys:
+        return []
+    return db.query(db_models.MediaProbe).filter(db_models.MediaProbe.cache_key.in_(cache_keys)).all()
+
+def upsert_media_probe(
+    db: Session,
+    cache_key: str,
+    duration_seconds: Optional[float],
+    audio_codec: Optional[str],
+    filesize_bytes: Optional[int],
+    title: Optional[str],
+    expires_at: datetime
+) -> db_models.MediaProbe:
+    """
+     写入（或覆盖）视频的媒体探测结果
+     
+     @param db 数据库会话
+     @param cache_key 视频缓存键
+     @param duration_seconds 时长（秒）
+     @param audio_codec 音频编码
+     @param filesize_bytes 音频流大小（字节）
+     @param title 视频标题
+     @param expires_at 过期时间
+     @return 媒体探测数据库模型实例
+    """
+    db_probe = get_media_probe(db, cache_key)
+    if db_probe is None:
+        db_probe = db_models.MediaProbe(cache_key=cache_key)
+        db.add(db_probe)
+    db_probe.duration_seconds = duration_seconds
+    db_probe.audio_codec = audio_codec
+    db_probe.filesize_bytes = filesize_bytes
+    db_probe.title = title
+    db_probe.probed_at = datetime.now()
+    db_probe.expires_at = expires_at
+    db.commit()
+    db.refresh(db_probe)
+    return db_probe
+
+def create_asr_task(
+    db: Session,
+    task_id: str,
+    session_id: Optional[str],
+    file_name: str,
+    file_len: int,
+    audio_sha256: Optional[str],
+    slice_num: int,
+    slice_size_bytes: int,
+    audio_duration_seconds: Optional[float] = None
+) -> db_models.AsrTask:
+    """
+     登记一个刚完成 /prepare 的讯飞ASR任务（prepared 阶段）
+     
+     @param db 数据库会话
+     @param task_id 讯飞任务ID
+     @param session_id 会话ID（可选）
+     @param file_name 上传的音频文件名
+     @param file_len 音频文件大小（字节）
+     @param audio_sha256 音频文件的SHA-256（可选）
+     @param slice_num 分片数量
+     @param slice_size_bytes 分片大小（字节）
+     @param audio_duration_seconds 音频时长（秒，可选）
+     @return ASR任务数据库模型实例
+    """
+    db_task = db_models.AsrTask(
+        task_id=task_id,
+        session_id=session_id,
+        status=AsrTaskStatus.PREPARED.value,
+        file_name=file_name,
+        file_len=file_len,
+        audio_sha256=audio_sha256,
+        slice_num=slice_num,
+        slice_size_bytes=slice_size_bytes,
+        uploaded_slice_ids=[],
+        audio_duration_seconds=audio_duration_seconds
+    )
+    db.add(db_task)
+    db.commit()
+    db.refresh(db_task)
+    return db_task
+
+def get_asr_task(db: Session, task_id: str) -> Optional[db_models.AsrTask]:
+    """
+     获取ASR任务
+     
+     @param db 数据库会话
+     @param task_id 讯飞任务ID
+     @return ASR任务数据库模型实例，如果不存在则返回None
+    """
+    return db.query(db_models.AsrTask).filter(db_models.AsrTask.task_id == task_id).first()
+
+def get_resumable_asr_task(
+    db: Session,
+    session_id: str,
+    file_name: str,
+    audio_sha256: str,
+    file_len: int,
+    other_sessions_idle_after: Optional[datetime] = None
+) -> Optional[db_models.AsrTask]:
+    """
+     获取同一音频内容最近一个尚未失败或取消的ASR任务，用于重启后接续
+     （文件名在每次尝试中相同，音频可能因VAD、分段、编码设置或重新下载而改变，因此同时按内容哈希与长度匹配）
+     
+     @param db 数据库会话
+     @param session_id 会话ID
+     @param file_name 上传的音频文件名
+     @param audio_sha256 音频文件的 SHA-256
+     @param file_len 音频文件字节数
+     @param other_sessions_idle_after 给出时，也匹配其他会话按内容哈希与长度相同的任务（例如共享转写只记录了第一个会话），
+                                      但排除所属会话的管道任务仍在运行且心跳晚于该时间的任务（它们正由存活的工作进程推进）；
+                                      本会话的任务优先
+     @return ASR任务数据库模型实例，如果没有则返回None
+    """
+    own_session = and_(db_models.AsrTask.session_id == session_id, db_models.AsrTask.file_name == file_name)
+    query = db.query(db_models.AsrTask).filter(
+        db_models.AsrTask.audio_sha256 == audio_sha256,
+        db_models.AsrTask.file_len == file_len,
+        db_models.AsrTask.status.notin_([AsrTaskStatus.FAILED.value, AsrTaskStatus.CANCELLED.value])
+    )
+    if other_sessions_idle_after is None:
+        return query.filter(own_session).order_by(db_models.AsrTask.created_at.desc()).first()
+    live_job_exists = db.query(db_models.PipelineJob.job_id).filter(
+        db_models.PipelineJob.session_id == db_models.AsrTask.session_id,
+        db_models.PipelineJob.status == PipelineJobStatus.RUNNING.value,
+        db_models.PipelineJob.heartbeat_at >= other_sessions_idle_after
+    ).exists()
+    return query.filter(or_(own_session, ~live_job_exists)).order_by(
+        case((own_session, 0), else_=1),
+        db_models.AsrTask.created_at.desc()
+    ).first()
+
+def get_unfinished_asr_tasks(
+    db: Session,
+    statuses: List[AsrTaskStatus],
+    created_after: datetime,
+    live_heartbeat_after: Optional[datetime] = None
+) -> List[db_models.AsrTask]:
+    """
+     获取处于指定阶段、在给定时间之后创建的ASR任务（进程启动时接续等待）
+     
+     @param db 数据库会话
+     @param statuses 任务阶段列表
+     @param created_after 只返回在该时间之后创建的任务
+     @param live_heartbeat_after 给出时，排除所属会话的管道任务仍在运行且心跳晚于该时间的ASR任务
+                                 （它们正由其他存活的工作进程等待）
+     @return ASR任务数据库模型实例列表（按创建时间升序）
+    """
+    query = db.query(db_models.AsrTask).filter(
+        db_models.AsrTask.status.in_([status.value for status in statuses]),
+        db_models.AsrTask.created_at >= created_after
+    )
+    if live_heartbeat_after is not None:
+        live_job_exists = db.query(db_models.PipelineJob.job_id).filter(
+            db_models.PipelineJob.session_id == db_models.AsrTask.session_id,
+            db_models.PipelineJob.status == PipelineJobStatus.RUNNING.value,
+            db_models.PipelineJob.heartbeat_at >= live_heartbeat_after
+        ).exists()
+        query = query.filter(~live_job_exists)
+    return query.order_by(db_models.AsrTask.created_at.asc()).all()
+
+def add_asr_task_uploaded_slice(db: Session, task_id: str, slice_id: str) -> None:
+    """
+     记录一个已被服务端确认的分片
+     
+     @param db 数据库会话
+     @param task_id 讯飞任务ID
+     @param slice_id 分片ID
+    """
+    db_task = get_asr_task(db, task_id)
+    if db_task is None:
+        return
+    uploaded_slice_ids = list(db_task.uploaded_slice_ids or [])
+    if slice_id not in uploaded_slice_ids:
+        uploaded_slice_ids.append(slice_id)
+        # 重新赋值，使JSON列的变更被跟踪
+        db_task.uploaded_slice_ids = uploaded_slice_ids
+        db.commit()
+
+def set_asr_task_status(
+    db: Session,
+    task_id: str,
+    status: AsrTaskStatus,
+    session_id: Optional[str] = None,
+    audio_duration_seconds: Optional[float] = None
+) -> db_models.AsrTask:
+    """
+     更新ASR任务所处阶段（任务不存在时创建，例如未经 create_asr_task 登记的任务交给轮询器时）
+     
+     @param db 数据库会话
+     @param task_id 讯飞任务ID
+     @param status 新阶段
+     @param session_id 会话ID（可选，仅在创建或原值为空时写入）
+     @param audio_duration_seconds 音频时长（秒，可选，仅在原值为空时写入）
+     @return ASR任务数据库模型实例
+    """
+    db_task = get_asr_task(db, task_id)
+    if db_task is None:
+        db_task = db_models.AsrTask(task_id=task_id)
+        db.add(db_task)
+    db_task.status = status.value
+    if db_task.session_id is None:
+        db_task.session_id = session_id
+    if db_task.audio_duration_seconds is None:
+        db_task.audio_duration_seconds = audio_duration_seconds
+    db.commit()
+    db.refresh(db_task)
+    return db_task
+
+def save_asr_task_result(db: Session, task_id: str, result: list) -> None:
+    """
+     保存ASR任务的转写结果并标记为成功
+     
+     @param db 数据库会话
+     @param task_id 讯飞任务ID
+     @param result 转写片段列表
+    """
+    db.query(db_models.AsrTask).filter(db_models.AsrTask.task_id == task_id).update({
+        db_models.AsrTask.status: AsrTaskStatus.SUCCEEDED.value,
+        db_models.AsrTask.result: result,
+        db_models.AsrTask.next_poll_at: None,
+        db_models.AsrTask.finished_at: datetime.now()
+    }, synchronize_session=False)
+    db.commit()
+
+def update_asr_task_polls(db: Session, polls: List[Tuple[str, int, Optional[datetime]]]) -> None:
+    """
+     批量记录一轮进度查询
+     
+     @param db 数据库会话
+     @param polls (task_id, 累计查询次数, 下次查询时间) 列表
+    """
+    if not polls:
+        return
+    now = datetime.now()
+    for task_id, poll_count, next_poll_at in polls:
+        db.query(db_models.AsrTask).filter(
+            db_models.AsrTask.task_id == task_id,
+            db_models.AsrTask.status == AsrTaskStatus.POLLING.value
+        ).update({
+            db_models.AsrTask.poll_count: poll_count,
+            db_models.AsrTask.last_polled_at: now,
+            db_models.AsrTask.next_poll_at: next_poll_at
+        }, synchronize_session=False)
+    db.commit()
+
+def finish_asr_tasks(db: Session, outcomes: List[Tuple[str, AsrTaskStatus, Optional[str]]]) -> None:
+    """
+     批量将ASR任务标记为结束状态（已保存转写结果的任务不会被改回）
+     
+     @param db 数据库会话
+     @param outcomes (task_id, 结束状态, 失败原因) 列表
+    """
+    if not outcomes:
+        return
+    now = datetime.now()
+    for task_id, status, last_error in outcomes:
+        db.query(db_models.AsrTask).filter(
+            db_models.AsrTask.task_id == task_id,
+            db_models.AsrTask.result.is_(None)
+        ).update({
+            db_models.AsrTask.status: status.value,
+            db_models.AsrTask.last_error: last_error,
+            db_models.AsrTask.next_poll_at: None,
+            db_models.AsrTask.finished_at: now
+        }, synchronize_session=False)
+    db.commit()
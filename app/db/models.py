@@ -5,7 +5,7 @@
 """
 import uuid
 import datetime
-from sqlalchemy import Column, String, Text, Float, Boolean, Integer, ForeignKey, DateTime, func, JSON
+from sqlalchemy import Column, String, Text, Float, Boolean, Integer, BigInteger, ForeignKey, DateTime, func, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
@@ -120,4 +120,204 @@ class KnowledgeCue(Base):
     last_modified_at = Column(String(50), default=lambda: datetime.datetime.now().isoformat())
     
     def __repr__(self):
-        return f"<KnowledgeCue(cue_id='{self.cue_id}', difficulty_level='{self.difficulty_level}')>" 
\ No newline at end of file
+        return f"<KnowledgeCue(cue_id='{self.cue_id}', difficulty_level='{self.difficulty_level}')>"
+
+class SessionBatch(Base):
+    """
+     会话批次表模型
+     
+     对应数据库中的session_batches表。一次批量提交（如导入整个播放列表）对应一条记录，
+     批次内每个会话的管道任务通过 pipeline_jobs.batch_id 关联。
+    """
+    __tablename__ = "session_batches"
+    
+    batch_id = Column(String(36), primary_key=True, index=True, default=generate_uuid)
+    item_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<SessionBatch(batch_id='{self.batch_id}', item_count={self.item_count})>"
+
+class PipelineJob(Base):
+    """
+     管道任务队列表模型
+     
+     对应数据库中的pipeline_jobs表。API层只负责入队，
+     由管道工作进程通过 SELECT ... FOR UPDATE SKIP LOCKED 认领并执行。
+    """
+    __tablename__ = "pipeline_jobs"
+    
+    job_id = Column(String(36), primary_key=True, index=True, default=generate_uuid)
+    session_id = Column(String(36), ForeignKey("learning_sessions.session_id"), nullable=False, index=True)
+    video_id = Column(String(36), ForeignKey("learning_sources.video_id"), nullable=False)
+    # LearningSessionInput 的JSON序列化，工作进程据此重建管道输入
+    payload_json = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    # 批量提交时所属批次及批次内序号，单独提交的会话为空
+    batch_id = Column(String(36), ForeignKey("session_batches.batch_id"), nullable=True, index=True)
+    batch_position = Column(Integer, nullable=True)
+    # 媒体时长（秒，来自 media_probes），超过 PIPELINE_LONG_JOB_SECONDS 的任务走长任务通道；未知时为空
+    media_duration_seconds = Column(Float, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(100), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False, index=True)
+    claimed_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<PipelineJob(job_id='{self.job_id}', session_id='{self.session_id}', status='{self.status}')>"
+
+class SessionStageCheckpoint(Base):
+    """
+     会话阶段检查点表模型
+     
+     对应数据库中的session_stage_checkpoints表。每个已成功完成的管道阶段保存一条记录，
+     管道重试/恢复时从第一个没有检查点的阶段开始执行。
+    """
+    __tablename__ = "session_stage_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("session_id", "stage", name="uq_session_stage_checkpoint"),
+    )
+    
+    checkpoint_id = Column(String(36), primary_key=True, index=True, default=generate_uuid)
+    session_id = Column(String(36), ForeignKey("learning_sessions.session_id"), nullable=False, index=True)
+    stage = Column(String(30), nullable=False)
+    # 阶段输出的JSON序列化（例如A.1/A.2的完整LLM输出，或模块B生成的笔记ID）
+    output_json = Column(Text(length=2**24), nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<SessionStageCheckpoint(session_id='{self.session_id}', stage='{self.stage}')>"
+
+class SessionStageMetric(Base):
+    """
+     会话阶段耗时表模型
+     
+     对应数据库中的session_stage_metrics表。管道每执行一个步骤（下载、音频提取、ASR、各LLM阶段）记录一条，
+     用于定位慢会话的瓶颈。跳过的阶段（检查点/缓存命中）不记录。
+    """
+    __tablename__ = "session_stage_metrics"
+    
+    metric_id = Column(String(36), primary_key=True, index=True, default=generate_uuid)
+    session_id = Column(String(36), ForeignKey("learning_sessions.session_id"), nullable=False, index=True)
+    stage = Column(String(30), nullable=False, index=True)
+    outcome = Column(String(20), nullable=False)
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    # 等待资源调度槽位（并发/限速）的时间，已包含在duration_ms中
+    queue_wait_ms = Column(Integer, nullable=False, default=0)
+    bytes_in = Column(BigInteger, nullable=True)
+    bytes_out = Column(BigInteger, nullable=True)
+    segment_count = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<SessionStageMetric(session_id='{self.session_id}', stage='{self.stage}', duration_ms={self.duration_ms})>"
+
+class VideoContentCache(Base):
+    """
+     视频内容缓存表模型
+     
+     对应数据库中的video_content_cache表。以B站视频的 BV号+分P 为键，跨会话缓存
+     ASR转录片段以及各LLM阶段的输出，重复提交同一视频时直接复用。
+    """
+    __tablename__ = "video_content_cache"
+    __table_args__ = (
+        UniqueConstraint("cache_key", "stage", name="uq_video_content_cache_key_stage"),
+    )
+    
+    cache_id = Column(String(36), primary_key=True, index=True, default=generate_uuid)
+    # 形如 "BV1GF411p722:p2"
+    cache_key = Column(String(40), nullable=False, index=True)
+    stage = Column(String(30), nullable=False)
+    # 生成该输出时的提示版本（转录阶段为空），提示变化后缓存自动失效
+    prompt_version = Column(String(64), nullable=True)
+    # 生成该输出时的输入指纹：用户输入（标题、描述）与上游阶段输出的哈希，转录阶段为空
+    input_fingerprint = Column(String(64), nullable=True)
+    output_json = Column(Text(length=2**24), nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<VideoContentCache(cache_key='{self.cache_key}', stage='{self.stage}')>"
+
+class SessionProgress(Base):
+    """
+     会话进度表模型
+     
+     对应数据库中的session_progress表。每个会话一条记录，保存当前长时间步骤（下载、音频提取）的完成百分比，
+     由子进程输出的进度行实时更新，供状态接口展示。
+    """
+    __tablename__ = "session_progress"
+    
+    session_id = Column(String(36), ForeignKey("learning_sessions.session_id"), primary_key=True, index=True)
+    # 当前步骤（MetricStage 的值）
+    stage = Column(String(30), nullable=False)
+    percent = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<SessionProgress(session_id='{self.session_id}', stage='{self.stage}', percent={self.percent})>"
+
+class MediaProbe(Base):
+    """
+     媒体探测结果表模型
+     
+     对应数据库中的media_probes表。以B站视频的 BV号+分P 为键，缓存下载前探测到的时长、音频编码和大小，
+     供任务调度（长任务通道）、ASR轮询间隔和A.1的总时长使用。
+    """
+    __tablename__ = "media_probes"
+    
+    # 形如 "BV1GF411p722:p2"
+    cache_key = Column(String(40), primary_key=True, index=True)
+    duration_seconds = Column(Float, nullable=True)
+    audio_codec = Column(String(50), nullable=True)
+    # 所选音频流的大小（字节，精确值或服务端估算值）
+    filesize_bytes = Column(BigInteger, nullable=True)
+    title = Column(String(500), nullable=True)
+    probed_at = Column(DateTime, default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<MediaProbe(cache_key='{self.cache_key}', duration_seconds={self.duration_seconds})>"
+
+class AsrTask(Base):
+    """
+     讯飞ASR任务表模型
+     
+     对应数据库中的asr_tasks表。每个讯飞转写任务一条记录，记录任务所处阶段（prepared/uploaded/merged/polling）、
+     已确认上传的分片ID和转写结果，进程重启后据此接续原任务而不是重新提交；等待阶段由进程内的中央轮询器
+     （app/services/asr/task_poller.py）批量查询进度并更新状态。分段转写时一个会话对应多个任务。
+    """
+    __tablename__ = "asr_tasks"
+    
+    # 讯飞返回的 task_id
+    task_id = Column(String(64), primary_key=True, index=True)
+    session_id = Column(String(36), ForeignKey("learning_sessions.session_id"), nullable=True, index=True)
+    # AsrTaskStatus 的值
+    status = Column(String(20), nullable=False, index=True)
+    # 上传的音频文件名、大小和SHA-256，用于确认重启后的音频与原任务一致
+    file_name = Column(String(255), nullable=True)
+    file_len = Column(BigInteger, nullable=True)
+    audio_sha256 = Column(String(64), nullable=True, index=True)
+    slice_num = Column(Integer, nullable=True)
+    slice_size_bytes = Column(Integer, nullable=True)
+    # 已被服务端确认的分片ID列表
+    uploaded_slice_ids = Column(JSON, nullable=True)
+    audio_duration_seconds = Column(Float, nullable=True)
+    poll_count = Column(Integer, nullable=False, default=0)
+    last_polled_at = Column(DateTime, nullable=True)
+    next_poll_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    # /getResult 返回的转写片段列表
+    result = Column(JSON(none_as_null=True), nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<AsrTask(task_id='{self.task_id}', session_id='{self.session_id}', status='{self.status}')>"
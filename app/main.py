@@ -5,10 +5,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 import traceback
 
-from app.api.v1.endpoints import learning_sessions
+from app.api.v1.endpoints import learning_sessions, metrics
 from app.db.database import get_db, engine
 from app.db.init_db import init_db
 from app.db.models import Base
+from app.core.config import get_settings
+from app.services.job_queue import PipelineWorkerPool
+from app.services.asr.task_poller import stop_asr_task_poller
+from app.services.xunfei_async_asr_service import close_lfasr_http_client
+from app.services.llm_client import close_llm_client
 
 app = FastAPI(
     title="AI Learning Companion System",
@@ -31,6 +36,11 @@ app.include_router(
     prefix="/api/v1/learning_sessions",
     tags=["learning_sessions"]
 )
+app.include_router(
+    metrics.router,
+    prefix="/api/v1/metrics",
+    tags=["metrics"]
+)
 
 @app.get("/")
 async def root():
@@ -67,7 +77,21 @@ def create_db_tables():
     except Exception as e:
         print(f"Error creating database tables: {e}")
 
-# 注册启动事件，确保数据库表创建
+# 注册启动事件，确保数据库表创建，并按配置启动进程内的管道工作池
 @app.on_event("startup")
 async def on_startup():
     create_db_tables()
+    settings = get_settings()
+    if settings.PIPELINE_RUN_WORKERS_IN_API and settings.PIPELINE_WORKER_COUNT > 0:
+        pipeline_worker_pool = PipelineWorkerPool(settings)
+        await pipeline_worker_pool.start()
+        app.state.pipeline_worker_pool = pipeline_worker_pool
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    pipeline_worker_pool = getattr(app.state, "pipeline_worker_pool", None)
+    if pipeline_worker_pool is not None:
+        await pipeline_worker_pool.stop()
+    await stop_asr_task_poller()
+    await close_lfasr_http_client()
+    await close_llm_client()
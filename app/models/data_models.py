@@ -1,7 +1,7 @@
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel, HttpUrl
-from app.core.enums import ProcessingStatus
+from app.core.enums import ProcessingStatus, PipelineJobStatus
 
 class LearningSessionInput(BaseModel):
     """
@@ -27,6 +27,38 @@ class LearningSessionResponse(BaseModel):
     sessionId: str
     status: ProcessingStatus
 
+class LearningSessionBatchInput(BaseModel):
+    """
+     批量创建学习会话的输入模型
+     
+     @param items 各会话的输入，顺序即批次内的处理顺序
+    """
+    items: List[LearningSessionInput]
+
+class LearningSessionBatchItem(BaseModel):
+    """
+     批次内单个会话的状态
+     
+     @param position 批次内序号（从0开始）
+     @param sessionId 会话ID
+     @param status 会话状态
+     @param jobStatus 管道任务状态
+    """
+    position: int
+    sessionId: str
+    status: ProcessingStatus
+    jobStatus: PipelineJobStatus
+
+class LearningSessionBatchResponse(BaseModel):
+    """
+     批量创建/查询学习会话的响应模型
+     
+     @param batchId 批次ID
+     @param sessions 批次内各会话，按批次内序号排列
+    """
+    batchId: str
+    sessions: List[LearningSessionBatchItem]
+
 class LearningSession(BaseModel):
     """
      学习会话完整模型
@@ -154,6 +186,23 @@ class FinalResultsPayload(BaseModel):
     timestamped_transcript_segments: Optional[List[Dict[str, Any]]] = None
     ai_generated_video_title: Optional[str] = None
 
+class MediaProbeInfo(BaseModel):
+    """Media metadata probed before download (see app/services/media_probe.py); any field may be unknown."""
+    model_config = {'from_attributes': True}
+
+    duration_seconds: Optional[float] = None
+    audio_codec: Optional[str] = None
+    filesize_bytes: Optional[int] = None
+    title: Optional[str] = None
+
+class SessionProgressRead(BaseModel):
+    """Pydantic model for reading the SessionProgress row (percent-complete of the current long-running step)."""
+    model_config = {'from_attributes': True}
+
+    stage: str
+    percent: float
+    updated_at: datetime
+
 class LearningSessionDetail(BaseModel):
     """Detailed Pydantic model for a learning session, potentially including final results."""
     model_config = {'from_attributes': True}
@@ -162,4 +211,28 @@ class LearningSessionDetail(BaseModel):
     status: ProcessingStatus
     user_id: Optional[str] = None
     created_at: datetime
+    progress: Optional[SessionProgressRead] = None
     final_results: Optional[FinalResultsPayload] = None
+
+class StageTimingRead(BaseModel):
+    """Pydantic model for reading one SessionStageMetric row (timing, bytes, segments and token usage of a pipeline step)."""
+    model_config = {'from_attributes': True}
+
+    stage: str
+    outcome: str
+    started_at: datetime
+    finished_at: datetime
+    duration_ms: int
+    queue_wait_ms: int
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    segment_count: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+class SessionTimingsResponse(BaseModel):
+    """Per-stage latency breakdown of a learning session."""
+    session_id: str
+    status: ProcessingStatus
+    total_duration_ms: int
+    stages: List[StageTimingRead] = []
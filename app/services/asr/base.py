@@ -5,6 +5,7 @@ ASR 服务抽象基类
 所有具体的 ASR 服务实现都应该继承这个基类。
 """
 from abc import ABC, abstractmethod
+import threading
 from typing import List, Dict, Any, Optional
 
 class AbstractAsrService(ABC):
@@ -14,14 +15,27 @@ class AbstractAsrService(ABC):
     定义了 ASR 服务必须实现的接口。
     所有具体的 ASR 服务实现都应该继承这个类并实现其抽象方法。
     """
+
+    # 为 True 时实现自行获取资源调度器的讯飞槽位（只在真正提交或等待讯飞任务时占用，
+    # 例如等待共享转写的会话不占槽位），调用方不应再在 transcribe 外获取
+    manages_provider_slots: bool = False
     
     @abstractmethod
-    async def transcribe(self, audio_file_path: str) -> Optional[List[Dict[str, Any]]]:
+    async def transcribe(
+        self,
+        audio_file_path: str,
+        cancel_event: Optional[threading.Event] = None,
+        audio_duration_seconds: Optional[float] = None,
+        session_id: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
         """
         异步转录指定的音频文件
 
         Args:
             audio_file_path: 要转录的音频文件的路径
+            cancel_event: 取消事件（可选），置位后应尽快停止上传/轮询并返回 None
+            audio_duration_seconds: 音频时长（秒，可选，如媒体探测结果），实现可据此调整轮询节奏与超时
+            session_id: 所属会话ID（可选），实现可据此持久化任务状态
 
         Returns:
             如果转录成功，返回一个片段字典列表，
@@ -29,4 +43,17 @@ class AbstractAsrService(ABC):
             (例如，包含 'text', 'start_time_ms', 'end_time_ms', 'speaker' 等键)。
             如果转录失败或没有识别到任何片段，返回 None。
         """
-        pass 
\ No newline at end of file
+        pass
+
+    async def resume_pending_tasks(self, max_age_seconds: float, stale_seconds: Optional[float] = None) -> int:
+        """
+        进程启动时接续上次未完成的转写任务（默认实现不做任何事）
+
+        Args:
+            max_age_seconds: 只接续在该时长内创建的任务
+            stale_seconds: 给出时，跳过所属管道任务仍在运行且心跳在该秒数内刷新过的任务（由存活的工作进程等待）
+
+        Returns:
+            接续的任务数量
+        """
+        return 0 
\ No newline at end of file
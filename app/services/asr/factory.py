@@ -6,12 +6,14 @@ ASR服务工厂模块。
 from app.core.config import Settings
 from app.services.asr.base import AbstractAsrService
 from app.services.xunfei_asr_service import XunfeiLfasrClient
+from app.services.xunfei_async_asr_service import XunfeiLfasrAsyncClient
 
 
 def get_asr_service(settings: Settings) -> AbstractAsrService:
     """
     获取ASR服务实例的工厂方法。
     当前仅支持讯飞ASR实现，后续可扩展。
+    XUNFEI_CLIENT_MODE 为 "async" 时返回协程实现（共享连接池），为 "thread" 时返回基于 requests 的同步实现。
 
     Args:
         settings (Settings): 全局配置对象，需包含ASR服务相关配置。
@@ -20,15 +22,38 @@ def get_asr_service(settings: Settings) -> AbstractAsrService:
         AbstractAsrService: 实现了ASR接口的服务实例。
 
     Raises:
-        ValueError: 如果未正确配置讯飞ASR所需的APPID和SECRET_KEY。
+        ValueError: 如果未正确配置讯飞ASR所需的APPID和SECRET_KEY，或 XUNFEI_CLIENT_MODE 无效。
     """
     # 检查讯飞ASR配置
     if settings.XUNFEI_APPID and settings.XUNFEI_SECRET_KEY:
         # 实例化并返回讯飞ASR客户端
-        return XunfeiLfasrClient(
-            appid=settings.XUNFEI_APPID,
-            secret_key=settings.XUNFEI_SECRET_KEY
-        )
+        if settings.XUNFEI_CLIENT_MODE == "async":
+            return XunfeiLfasrAsyncClient(
+                appid=settings.XUNFEI_APPID,
+                secret_key=settings.XUNFEI_SECRET_KEY,
+                host=settings.XUNFEI_API_HOST,
+                max_connections=settings.XUNFEI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.XUNFEI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                upload_parallelism=settings.XUNFEI_UPLOAD_PARALLELISM,
+                upload_max_retries=settings.XUNFEI_UPLOAD_MAX_RETRIES,
+                upload_retry_base_delay=settings.XUNFEI_UPLOAD_RETRY_BASE_DELAY_SECONDS,
+                poll_min_interval=settings.XUNFEI_POLL_MIN_INTERVAL_SECONDS,
+                poll_max_interval=settings.XUNFEI_POLL_MAX_INTERVAL_SECONDS,
+                expected_turnaround_ratio=settings.XUNFEI_EXPECTED_TURNAROUND_RATIO,
+                poll_max_consecutive_errors=settings.XUNFEI_POLL_MAX_CONSECUTIVE_ERRORS,
+                use_central_poller=settings.XUNFEI_CENTRAL_POLLER_ENABLED,
+                poller_tick_seconds=settings.XUNFEI_POLLER_TICK_SECONDS,
+                poller_batch_size=settings.XUNFEI_POLLER_BATCH_SIZE,
+                dedupe_inflight=settings.XUNFEI_INFLIGHT_DEDUP_ENABLED,
+                live_job_stale_seconds=settings.PIPELINE_JOB_STALE_SECONDS
+            )
+        if settings.XUNFEI_CLIENT_MODE == "thread":
+            return XunfeiLfasrClient(
+                appid=settings.XUNFEI_APPID,
+                secret_key=settings.XUNFEI_SECRET_KEY,
+                host=settings.XUNFEI_API_HOST
+            )
+        raise ValueError(f"Unsupported XUNFEI_CLIENT_MODE: {settings.XUNFEI_CLIENT_MODE!r} (expected 'async' or 'thread').")
     else:
         # 目前仅支持讯飞，未配置时报错
         raise ValueError("Xunfei ASR service is required but not configured with APPID and SECRET_KEY.")
@@ -0,0 +1,98 @@
+"""
+ASR任务进度轮询节奏
+
+按音频时长与观测到的转写耗时比（转写耗时 / 音频时长）估计任务的预计完成时间：
+- 开始阶段按指数退避轮询（间隔约等于已等待时长）；
+- 接近预计完成时间时间隔按剩余时长的比例缩短，直至最小间隔，任务完成后尽快取回结果；
+- 超过预计完成时间后间隔随超出时长逐渐增大。
+耗时比在进程内按指数移动平均（EWMA）更新，初值来自配置。
+"""
+import threading
+from typing import Optional
+
+# 未知时长或任务迟迟未完成时的最长等待（秒），与原固定轮询的 30秒 x 120次 一致
+DEFAULT_MAX_WAIT_SECONDS = 3600
+# 预计完成时间之外额外计入的排队耗时（秒）
+QUEUE_ALLOWANCE_SECONDS = 10.0
+# 轮询间隔与距预计完成时间之差的比例
+_APPROACH_FACTOR = 0.25
+# 耗时比EWMA的平滑系数及取值范围
+_RATIO_SMOOTHING = 0.3
+_MIN_RATIO = 0.01
+_MAX_RATIO = 2.0
+
+class TurnaroundRatioEstimator:
+    """
+    进程内共享的转写耗时比估计（线程安全）
+
+    Args:
+        initial_ratio: 初始耗时比
+    """
+
+    def __init__(self, initial_ratio: float):
+        self._ratio = min(_MAX_RATIO, max(_MIN_RATIO, initial_ratio))
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self) -> float:
+        return self._ratio
+
+    def observe(self, audio_duration_seconds: Optional[float], turnaround_seconds: float) -> None:
+        """
+        记录一次完成任务的实际耗时
+
+        Args:
+            audio_duration_seconds: 音频时长（秒），未知时忽略本次记录
+            turnaround_seconds: 从 merge 到任务完成的耗时（秒）
+        """
+        if not audio_duration_seconds or audio_duration_seconds <= 0:
+            return
+        observed_ratio = min(_MAX_RATIO, max(_MIN_RATIO, turnaround_seconds / audio_duration_seconds))
+        with self._lock:
+            self._ratio = (1 - _RATIO_SMOOTHING) * self._ratio + _RATIO_SMOOTHING * observed_ratio
+
+class AdaptivePollSchedule:
+    """
+    单个ASR任务的轮询节奏
+
+    Args:
+        audio_duration_seconds: 音频时长（秒），未知时为空（此时只做指数退避）
+        turnaround_ratio: 预计的转写耗时比
+        min_interval_seconds: 最小轮询间隔（秒），用于预计完成时间附近
+        max_interval_seconds: 最大轮询间隔（秒）
+    """
+
+    def __init__(self, audio_duration_seconds: Optional[float], turnaround_ratio: float,
+                 min_interval_seconds: float, max_interval_seconds: float):
+        self.min_interval_seconds = max(0.1, min_interval_seconds)
+        self.max_interval_seconds = max(self.min_interval_seconds, max_interval_seconds)
+        if audio_duration_seconds and audio_duration_seconds > 0:
+            self.expected_seconds: Optional[float] = QUEUE_ALLOWANCE_SECONDS + audio_duration_seconds * turnaround_ratio
+            self.max_wait_seconds = max(DEFAULT_MAX_WAIT_SECONDS, 2 * audio_duration_seconds, 3 * self.expected_seconds)
+        else:
+            self.expected_seconds = None
+            self.max_wait_seconds = DEFAULT_MAX_WAIT_SECONDS
+
+    def next_delay(self, elapsed_seconds: float) -> Optional[float]:
+        """
+        计算下一次轮询前的等待时间
+
+        Args:
+            elapsed_seconds: 自任务提交（merge）以来已等待的时长（秒）
+
+        Returns:
+            等待秒数；已超过最长等待时间时返回 None（放弃轮询）
+        """
+        remaining = self.max_wait_seconds - elapsed_seconds
+        if remaining <= 0:
+            return None
+        if self.expected_seconds is None:
+            delay = elapsed_seconds
+        elif elapsed_seconds < self.expected_seconds:
+            # 指数退避，越接近预计完成时间间隔越短
+            delay = min(elapsed_seconds, _APPROACH_FACTOR * (self.expected_seconds - elapsed_seconds))
+        else:
+            # 超过预计完成时间后间隔随超出时长逐渐增大
+            delay = self.min_interval_seconds + _APPROACH_FACTOR * (elapsed_seconds - self.expected_seconds)
+        delay = min(self.max_interval_seconds, max(self.min_interval_seconds, delay))
+        return min(delay, remaining)
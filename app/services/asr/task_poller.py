@@ -0,0 +1,248 @@
+"""
+中央ASR任务轮询器
+
+每个事件循环一个后台协程，统一跟踪本进程内所有已提交（merge）、等待转写完成的讯飞任务：
+按各任务的 AdaptivePollSchedule 计算下次查询时间，每个节拍把到期的任务按批并发查询，
+任务完成、失败、超时或取消时解析对应的等待 Future，并把状态写入 asr_tasks 表。
+等待中的任务不再各自占用一个轮询循环（或线程）。进程关闭或等待方被取消（而非会话被取消）时
+任务保持 polling 状态，重启后可以接续等待（见 XunfeiLfasrAsyncClient.resume_pending_tasks）。
+"""
+import asyncio
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.enums import AsrTaskStatus
+from app.db import crud
+from app.db.database import SessionLocal
+from app.services.asr.poll_schedule import AdaptivePollSchedule
+
+# 查询任务状态的协程：返回 True 表示转写成功，False 表示任务失败，None 表示仍在处理中；
+# 可重试的错误（网络错误、HTTP 429/5xx）应抛出 TransientPollError
+TaskStateFetcher = Callable[[str], Awaitable[Optional[bool]]]
+
+class TransientPollError(Exception):
+    """查询任务状态时出现的可重试错误"""
+
+@dataclass
+class _TrackedTask:
+    task_id: str
+    fetch_state: TaskStateFetcher
+    schedule: AdaptivePollSchedule
+    future: asyncio.Future
+    cancel_event: Optional[threading.Event]
+    started_at: float = field(default_factory=time.monotonic)
+    next_poll_at: float = field(default_factory=time.monotonic)
+    poll_count: int = 0
+    consecutive_errors: int = 0
+    waiters: int = 0
+
+class AsrTaskPoller:
+    """
+    中央ASR任务轮询器
+
+    Args:
+        tick_seconds: 检查到期任务的节拍（秒）
+        batch_size: 每个节拍最多并发查询的任务数
+        max_consecutive_errors: 单个任务允许连续出现的可重试错误次数
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, batch_size: int = 20, max_consecutive_errors: int = 5):
+        self.tick_seconds = max(0.05, tick_seconds)
+        self.batch_size = max(1, batch_size)
+        self.max_consecutive_errors = max(1, max_consecutive_errors)
+        self._tasks: Dict[str, _TrackedTask] = {}
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def tracked_task_count(self) -> int:
+        return len(self._tasks)
+
+    async def wait_for_completion(
+        self,
+        task_id: str,
+        fetch_state: TaskStateFetcher,
+        schedule: AdaptivePollSchedule,
+        cancel_event: Optional[threading.Event] = None,
+        session_id: Optional[str] = None,
+        audio_duration_seconds: Optional[float] = None
+    ) -> bool:
+        """
+        登记任务并等待其完成
+
+        Args:
+            task_id: 讯飞任务ID
+            fetch_state: 查询任务状态的协程
+            schedule: 该任务的轮询节奏
+            cancel_event: 取消事件（可选），置位后停止跟踪并返回 False
+            session_id: 会话ID（可选，写入 asr_tasks）
+            audio_duration_seconds: 音频时长（秒，可选，写入 asr_tasks）
+
+        Returns:
+            任务转写成功时返回 True；失败、超时或取消时返回 False
+        """
+        tracked = self._tasks.get(task_id)
+        if tracked is None or tracked.future.done():
+            # 数据库写入放到线程中执行（不阻塞事件循环）；写入期间可能已有另一个等待方登记了同一任务
+            await asyncio.to_thread(
+                _run_db,
+                lambda db: crud.set_asr_task_status(db, task_id, AsrTaskStatus.POLLING, session_id, audio_duration_seconds),
+                f"登记ASR任务 {task_id}"
+            )
+            tracked = self._tasks.get(task_id)
+            if tracked is None or tracked.future.done():
+                tracked = self._track(task_id, fetch_state, schedule, cancel_event)
+        # 同一任务可能有多个等待方（例如启动时接续的任务又被重新排队的管道等待），共享同一个 Future；
+        # 最后一个等待方被取消时 Future 随之取消，由轮询器在下一个节拍停止跟踪
+        tracked.waiters += 1
+        try:
+            return await asyncio.shield(tracked.future)
+        except asyncio.CancelledError:
+            if tracked.waiters == 1:
+                tracked.future.cancel()
+            raise
+        finally:
+            tracked.waiters -= 1
+
+    def _track(
+        self,
+        task_id: str,
+        fetch_state: TaskStateFetcher,
+        schedule: AdaptivePollSchedule,
+        cancel_event: Optional[threading.Event]
+    ) -> _TrackedTask:
+        tracked = _TrackedTask(
+            task_id=task_id,
+            fetch_state=fetch_state,
+            schedule=schedule,
+            future=asyncio.get_running_loop().create_future(),
+            cancel_event=cancel_event
+        )
+        self._tasks[task_id] = tracked
+        self._ensure_running()
+        return tracked
+
+    async def stop(self) -> None:
+        """停止后台轮询协程，仍在等待的调用返回 False（数据库中的任务保持 polling 状态，重启后接续）"""
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for tracked in self._tasks.values():
+            if not tracked.future.done():
+                tracked.future.set_result(False)
+        self._tasks.clear()
+
+    def _ensure_running(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._tasks:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"错误: ASR任务轮询器: 本轮查询失败: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    async def _tick(self) -> None:
+        outcomes: List[Tuple[str, AsrTaskStatus, Optional[str]]] = []
+        now = time.monotonic()
+        due: List[_TrackedTask] = []
+        for tracked in list(self._tasks.values()):
+            if tracked.future.done():
+                # 等待方已取消（如工作进程关闭）：停止跟踪，任务保持 polling 状态以便接续
+                self._tasks.pop(tracked.task_id, None)
+            elif tracked.cancel_event is not None and tracked.cancel_event.is_set():
+                tracked.future.set_result(False)
+                outcomes.append(self._untrack(tracked, AsrTaskStatus.CANCELLED, "Cancelled."))
+            elif tracked.next_poll_at <= now:
+                due.append(tracked)
+        due.sort(key=lambda tracked: tracked.next_poll_at)
+        due = due[:self.batch_size]
+
+        polls: List[Tuple[str, int, Optional[datetime]]] = []
+        results = await asyncio.gather(*(tracked.fetch_state(tracked.task_id) for tracked in due), return_exceptions=True)
+        for tracked, result in zip(due, results):
+            if tracked.future.done():
+                continue
+            tracked.poll_count += 1
+            if isinstance(result, TransientPollError):
+                tracked.consecutive_errors += 1
+                if tracked.consecutive_errors >= self.max_consecutive_errors:
+                    tracked.future.set_result(False)
+                    outcomes.append(self._untrack(tracked, AsrTaskStatus.FAILED, f"{tracked.consecutive_errors} consecutive poll errors: {result}"))
+                    continue
+            elif isinstance(result, BaseException):
+                tracked.future.set_result(False)
+                outcomes.append(self._untrack(tracked, AsrTaskStatus.FAILED, f"Poll error: {result!r}"))
+                continue
+            elif result is True:
+                tracked.future.set_result(True)
+                outcomes.append(self._untrack(tracked, AsrTaskStatus.SUCCEEDED, None))
+                continue
+            elif result is False:
+                tracked.future.set_result(False)
+                outcomes.append(self._untrack(tracked, AsrTaskStatus.FAILED, "Task failed on the ASR service."))
+                continue
+            else:
+                tracked.consecutive_errors = 0
+
+            delay = tracked.schedule.next_delay(time.monotonic() - tracked.started_at)
+            if delay is None:
+                tracked.future.set_result(False)
+                outcomes.append(self._untrack(tracked, AsrTaskStatus.FAILED, f"Timed out after {tracked.poll_count} polls."))
+                continue
+            tracked.next_poll_at = time.monotonic() + delay
+            polls.append((tracked.task_id, tracked.poll_count, datetime.now() + timedelta(seconds=delay)))
+
+        if polls:
+            await asyncio.to_thread(_run_db, lambda db: crud.update_asr_task_polls(db, polls), "记录ASR任务查询")
+        if outcomes:
+            await asyncio.to_thread(_run_db, lambda db: crud.finish_asr_tasks(db, outcomes), "记录ASR任务结束状态")
+
+    def _untrack(self, tracked: _TrackedTask, status: AsrTaskStatus, error: Optional[str]) -> Tuple[str, AsrTaskStatus, Optional[str]]:
+        self._tasks.pop(tracked.task_id, None)
+        if status != AsrTaskStatus.SUCCEEDED:
+            print(f"ASR任务 {tracked.task_id}: {status.value}（{error}）")
+        return tracked.task_id, status, error
+
+def _run_db(operation: Callable[[Session], object], description: str) -> None:
+    db_local: Session = SessionLocal()
+    try:
+        operation(db_local)
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: ASR任务轮询器: {description}失败: {e}")
+    finally:
+        db_local.close()
+
+# 轮询器的后台协程和 Future 绑定在创建它们的事件循环上
+_pollers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsrTaskPoller]" = weakref.WeakKeyDictionary()
+
+def get_asr_task_poller(tick_seconds: float = 1.0, batch_size: int = 20, max_consecutive_errors: int = 5) -> AsrTaskPoller:
+    """
+    获取当前事件循环共享的中央轮询器（参数只在首次创建时生效）
+
+    Returns:
+        AsrTaskPoller 实例
+    """
+    loop = asyncio.get_running_loop()
+    poller = _pollers.get(loop)
+    if poller is None:
+        poller = AsrTaskPoller(tick_seconds, batch_size, max_consecutive_errors)
+        _pollers[loop] = poller
+    return poller
+
+async def stop_asr_task_poller() -> None:
+    """停止当前事件循环的中央轮询器（如有，进程关闭时调用）"""
+    poller = _pollers.pop(asyncio.get_running_loop(), None)
+    if poller is not None:
+        await poller.stop()
@@ -0,0 +1,116 @@
+"""
+ 会话取消模块
+
+ 每条运行中的会话管道在本进程内登记一个取消令牌。取消时令牌会：
+ - 终止已登记的子进程（yt-dlp、ffmpeg）；
+ - 置位线程事件，让运行在线程中的讯飞轮询立即退出；
+ - 取消管道所在的 asyncio 任务，跳过剩余的LLM阶段。
+ 跨进程取消（API与工作进程分离部署）由工作池轮询 pipeline_jobs 表中 cancel_requested 状态的任务后调用 cancel_session 完成。
+"""
+import asyncio
+import subprocess
+import threading
+from typing import Dict, Optional, Set
+
+from app.utils.process_runner import kill_process_tree
+
+class CancellationToken:
+    """
+     单个会话管道的取消令牌
+
+     @param session_id 会话ID
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def attach_current_task(self) -> None:
+        """登记当前 asyncio 任务，取消时将其cancel。需在管道任务内调用。"""
+        self._task = asyncio.current_task()
+        self._loop = asyncio.get_running_loop()
+
+    def register_process(self, process: subprocess.Popen) -> None:
+        """登记子进程；如果会话已被取消则立即终止该进程。"""
+        with self._lock:
+            if not self.event.is_set():
+                self._processes.add(process)
+                return
+        _kill_process(process)
+
+    def unregister_process(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self) -> None:
+        """取消会话管道。可在任意线程中调用，重复调用无副作用。"""
+        with self._lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            processes = list(self._processes)
+            self._processes.clear()
+        # 先安排任务取消，再终止子进程：子进程退出后线程回调排在取消之后，管道不会先走到错误分支
+        if self._task is not None and self._loop is not None and not self._task.done():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        for process in processes:
+            _kill_process(process)
+
+def _kill_process(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        try:
+            kill_process_tree(process)
+            print(f"已终止子进程 pid={process.pid}。")
+        except OSError as e:
+            print(f"错误: 终止子进程 pid={process.pid} 失败: {e}")
+
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+def register_session(session_id: str) -> CancellationToken:
+    """
+     为即将运行的会话管道登记取消令牌
+
+     @param session_id 会话ID
+     @return 取消令牌
+    """
+    token = CancellationToken(session_id)
+    with _tokens_lock:
+        _tokens[session_id] = token
+    return token
+
+def unregister_session(session_id: str, token: CancellationToken) -> None:
+    """
+     管道结束后注销取消令牌（仅当登记的仍是该令牌时）
+
+     @param session_id 会话ID
+     @param token 登记时返回的取消令牌
+    """
+    with _tokens_lock:
+        if _tokens.get(session_id) is token:
+            del _tokens[session_id]
+
+def cancel_session(session_id: str) -> bool:
+    """
+     取消本进程内正在运行的会话管道
+
+     @param session_id 会话ID
+     @return 如果该会话的管道在本进程内运行并已发出取消则返回True
+    """
+    with _tokens_lock:
+        token = _tokens.get(session_id)
+    if token is None:
+        return False
+    if token.is_cancelled:
+        return True
+    print(f"会话 {session_id}: 收到取消请求，正在终止管道。")
+    token.cancel()
+    return True
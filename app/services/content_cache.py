@@ -0,0 +1,167 @@
+"""
+ 视频内容缓存服务
+
+ 以B站视频的 BV号+分P 为键，跨会话缓存转录片段和各LLM阶段输出。
+ 重复提交同一视频时，管道直接把缓存结果克隆到新会话，跳过下载、ASR和LLM调用。
+ LLM阶段的缓存带有提示版本号，提示变化后自动失效；并记录生成时的输入指纹（用户输入加上游阶段输出的哈希），
+ 上游输出不同（如A.1重新生成）时下游阶段的缓存不再命中，不会与新的上游输出混用。
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.database import SessionLocal
+from app.core.config import Settings
+from app.core.enums import PipelineStage
+from app.core.utils import extract_bilibili_video_key
+from app.ai_modules.prompt_versions import PROMPT_VERSIONS
+
+def build_video_cache_key(bilibili_url: str) -> Optional[str]:
+    """
+     根据B站URL构建缓存键
+
+     @param bilibili_url B站视频URL（原始或规范化）
+     @return 形如 "BV1GF411p722:p2" 的缓存键；无法识别BV号（如b23.tv短链）时返回None
+    """
+    video_key = extract_bilibili_video_key(bilibili_url)
+    if video_key is None:
+        return None
+    bv_id, page = video_key
+    return f"{bv_id}:p{page}"
+
+def build_input_fingerprint(video_title: Optional[str], source_description: Optional[str]) -> str:
+    """
+     计算影响LLM输出的用户输入指纹
+
+     @param video_title 用户提供的视频标题
+     @param source_description 用户提供的资源描述
+     @return 指纹字符串
+    """
+    raw = json.dumps([video_title or "", source_description or ""], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+# 每次运行都会改写的字段（会话的视频/笔记ID、处理时间戳），计算上游输出指纹时排除
+VOLATILE_OUTPUT_KEYS = frozenset({"videoId", "noteId", "processingTimestamp", "generationTimestamp"})
+
+def _without_volatile_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: item for key, item in value.items() if key not in VOLATILE_OUTPUT_KEYS}
+    if isinstance(value, list):
+        return [_without_volatile_keys(item) if isinstance(item, dict) else item for item in value]
+    return value
+
+def build_stage_fingerprint(input_fingerprint: str, upstream_output: Any) -> str:
+    """
+     计算LLM阶段的输入指纹：用户输入指纹加上该阶段所依据的上游输出
+
+     @param input_fingerprint 当前会话的用户输入指纹
+     @param upstream_output 该阶段的输入（转录片段、上游模块输出等，可JSON序列化）
+     @return 指纹字符串
+    """
+    raw = json.dumps([input_fingerprint, _without_volatile_keys(upstream_output)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def load_cached_stage_outputs(
+    cache_key: str,
+    settings: Settings
+) -> Dict[str, Tuple[Optional[str], Any]]:
+    """
+     加载某个视频仍然有效的阶段缓存
+
+     过期或提示版本已变化的记录会被删除。LLM阶段的输入指纹要等上游阶段完成后才能计算，
+     由 cached_stage_output 在使用时比对。
+
+     @param cache_key 视频缓存键
+     @param settings 配置设置
+     @return 阶段值 -> (输入指纹, 解码后的阶段输出)
+    """
+    db_local: Session = SessionLocal()
+    try:
+        now = datetime.now()
+        valid_outputs: Dict[str, Any] = {}
+        stale_ids = []
+        for db_entry in crud.get_video_cache_entries(db_local, cache_key):
+            if db_entry.expires_at <= now:
+                stale_ids.append(db_entry.cache_id)
+                continue
+            if db_entry.stage == PipelineStage.TRANSCRIPT.value:
+                valid_outputs[db_entry.stage] = (None, json.loads(db_entry.output_json))
+                continue
+            if not settings.VIDEO_CACHE_LLM_OUTPUTS:
+                continue
+            if db_entry.prompt_version != PROMPT_VERSIONS.get(db_entry.stage):
+                stale_ids.append(db_entry.cache_id)
+                continue
+            valid_outputs[db_entry.stage] = (db_entry.input_fingerprint, json.loads(db_entry.output_json))
+        if stale_ids:
+            crud.delete_video_cache_entries(db_local, stale_ids)
+        return valid_outputs
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 加载视频缓存 {cache_key} 失败，将不使用缓存: {e}")
+        return {}
+    finally:
+        db_local.close()
+
+def cached_stage_output(
+    cached_outputs: Dict[str, Tuple[Optional[str], Any]],
+    stage: PipelineStage,
+    stage_fingerprint: Optional[str] = None
+) -> Optional[Any]:
+    """
+     取出与当前输入一致的阶段缓存
+
+     @param cached_outputs load_cached_stage_outputs 的结果
+     @param stage 管道阶段
+     @param stage_fingerprint 该阶段的输入指纹（build_stage_fingerprint，转录阶段不需要）
+     @return 阶段输出；没有缓存或缓存基于不同的输入时返回None
+    """
+    entry = cached_outputs.get(stage.value)
+    if entry is None:
+        return None
+    entry_fingerprint, output = entry
+    if stage != PipelineStage.TRANSCRIPT and entry_fingerprint != stage_fingerprint:
+        return None
+    return output
+
+def store_cached_stage_output(
+    cache_key: str,
+    stage: PipelineStage,
+    output: Any,
+    stage_fingerprint: Optional[str],
+    settings: Settings
+) -> None:
+    """
+     写入某个视频阶段的缓存。失败只记录日志，不影响管道。
+
+     @param cache_key 视频缓存键
+     @param stage 管道阶段
+     @param output 阶段输出（可JSON序列化）
+     @param stage_fingerprint 该阶段的输入指纹（build_stage_fingerprint，转录阶段为None）
+     @param settings 配置设置
+    """
+    is_transcript = stage == PipelineStage.TRANSCRIPT
+    if not is_transcript and not settings.VIDEO_CACHE_LLM_OUTPUTS:
+        return
+
+    db_local: Session = SessionLocal()
+    try:
+        crud.upsert_video_cache_entry(
+            db_local,
+            cache_key=cache_key,
+            stage=stage,
+            output_json=json.dumps(output, ensure_ascii=False),
+            expires_at=datetime.now() + timedelta(seconds=settings.VIDEO_CACHE_TTL_SECONDS),
+            prompt_version=None if is_transcript else PROMPT_VERSIONS.get(stage.value),
+            input_fingerprint=None if is_transcript else stage_fingerprint
+        )
+        print(f"视频缓存 {cache_key}: 阶段 {stage.value} 的输出已缓存。")
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 写入视频缓存 {cache_key} 阶段 {stage.value} 失败: {e}")
+    finally:
+        db_local.close()
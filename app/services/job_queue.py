@@ -0,0 +1,368 @@
+"""
+ 管道任务队列模块
+
+ 基于数据库的持久化任务队列与有界工作池。API层只负责把会话写入 pipeline_jobs 表，
+ 由固定数量的工作协程通过 SELECT ... FOR UPDATE SKIP LOCKED 认领并执行处理管道。
+ 工作池既可以运行在API进程内，也可以通过 scripts/run_pipeline_worker.py 作为独立进程运行。
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db import models as db_models
+from app.db.database import SessionLocal
+from app.core.config import Settings
+from app.core.enums import ProcessingStatus, PipelineJobStatus
+from app.models.data_models import LearningSessionInput
+from app.services.orchestration import start_session_processing_pipeline
+from app.services.cancellation import cancel_session
+from app.services.media_probe import get_cached_media_durations, probe_bilibili_media
+from app.services.asr.factory import get_asr_service
+from app.services.asr.task_poller import stop_asr_task_poller
+from app.services.xunfei_async_asr_service import close_lfasr_http_client
+from app.services.llm_client import close_llm_client, get_llm_client
+
+class PipelineQueueFullError(Exception):
+    """排队任务数已达上限时抛出，API层据此返回503。"""
+
+    def __init__(self, queued_count: int, max_pending: int):
+        self.queued_count = queued_count
+        self.max_pending = max_pending
+        super().__init__(f"Pipeline queue is full ({queued_count}/{max_pending} jobs queued).")
+
+def ensure_queue_capacity(db: Session, settings: Settings, incoming_jobs: int = 1) -> None:
+    """
+     检查队列是否还能接收新任务（背压）
+
+     @param db 数据库会话
+     @param settings 配置设置
+     @param incoming_jobs 即将入队的任务数量
+     @raise PipelineQueueFullError 如果入队后会超过 PIPELINE_QUEUE_MAX_PENDING
+    """
+    queued_count = crud.count_queued_pipeline_jobs(db)
+    if queued_count + incoming_jobs > settings.PIPELINE_QUEUE_MAX_PENDING:
+        raise PipelineQueueFullError(queued_count, settings.PIPELINE_QUEUE_MAX_PENDING)
+
+def enqueue_new_session(
+    db: Session,
+    learning_session_input: LearningSessionInput
+) -> Tuple[db_models.LearningSession, db_models.LearningSource, db_models.PipelineJob]:
+    """
+     创建新会话及其学习资源，并在同一事务中写入任务队列
+
+     @param db 数据库会话
+     @param learning_session_input 会话输入，序列化后随任务持久化
+     @return (会话记录, 学习资源记录, 管道任务记录)
+    """
+    media_duration_seconds = get_cached_media_durations(db, [_bilibili_url_of(learning_session_input)])[0]
+    return crud.create_session_with_pipeline_job(db, learning_session_input, media_duration_seconds=media_duration_seconds)
+
+def enqueue_session_batch(
+    db: Session,
+    session_inputs: List[LearningSessionInput]
+) -> Tuple[db_models.SessionBatch, List[db_models.PipelineJob]]:
+    """
+     将一批会话一次性写入任务队列
+
+     批次内任务按序号依次被认领，且同时运行的数量受 PIPELINE_BATCH_MAX_CONCURRENCY 限制。
+     配合资源调度器的按资源限流，第N+1条的下载会与第N条的ASR重叠执行，形成流水线。
+
+     @param db 数据库会话
+     @param session_inputs 批次内各会话的输入
+     @return (批次记录, 按批次顺序排列的管道任务列表)
+    """
+    media_durations = get_cached_media_durations(db, [_bilibili_url_of(session_input) for session_input in session_inputs])
+    return crud.create_session_batch(db, session_inputs, media_durations=media_durations)
+
+def _bilibili_url_of(learning_session_input: LearningSessionInput) -> Optional[str]:
+    if learning_session_input.bilibili_video_url is None:
+        return None
+    return str(learning_session_input.bilibili_video_url)
+
+class PipelineWorkerPool:
+    """
+     有界的管道工作池
+
+     启动 worker_count 个工作协程循环认领任务，同一进程内最多同时运行 worker_count 条管道。
+     另有一个维护协程负责刷新心跳并回收失联工作进程遗留的任务，
+     以及一个取消协程负责发现被请求取消的运行中任务并终止其管道。
+    """
+
+    def __init__(self, settings: Settings, worker_count: Optional[int] = None):
+        self.settings = settings
+        self.worker_count = worker_count if worker_count is not None else settings.PIPELINE_WORKER_COUNT
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running_jobs: Dict[str, str] = {}  # job_id -> session_id
+        self._tasks: List[asyncio.Task] = []
+        self._stop_event: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        """启动工作协程与维护协程。"""
+        if self._tasks:
+            return
+        self._stop_event = asyncio.Event()
+        for index in range(self.worker_count):
+            self._tasks.append(asyncio.create_task(self._worker_loop(index)))
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        self._tasks.append(asyncio.create_task(self._cancellation_loop()))
+        print(f"管道工作池 {self.worker_id}: 已启动 {self.worker_count} 个工作协程。")
+        try:
+            # 预先配置Gemini并建好各模块的模型句柄，首个管道的LLM调用不再承担初始化开销
+            get_llm_client(self.settings)
+        except Exception as e:
+            print(f"错误: 管道工作池 {self.worker_id}: 创建LLM客户端失败: {e}")
+        await self._resume_pending_asr_tasks()
+
+    async def _resume_pending_asr_tasks(self) -> None:
+        """接续进程重启前已提交、尚未取回结果的ASR任务，结果写入 asr_tasks 表供重新排队的管道使用。"""
+        if self.settings.XUNFEI_TASK_RESUME_MAX_AGE_SECONDS <= 0:
+            return
+        try:
+            asr_client = get_asr_service(self.settings)
+            # 其他进程中存活的工作协程仍在等待的任务不接续，避免重复查询及超时后覆盖其状态
+            await asr_client.resume_pending_tasks(
+                self.settings.XUNFEI_TASK_RESUME_MAX_AGE_SECONDS,
+                stale_seconds=self.settings.PIPELINE_JOB_STALE_SECONDS
+            )
+        except ValueError:
+            # 未配置ASR服务
+            return
+        except Exception as e:
+            print(f"错误: 管道工作池 {self.worker_id}: 接续未完成的ASR任务失败: {e}")
+
+    async def stop(self) -> None:
+        """
+         停止工作池
+
+         正在执行的管道会被取消，其任务保持running状态，心跳超时后由其他工作进程重新排队。
+        """
+        if self._stop_event:
+            self._stop_event.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        print(f"管道工作池 {self.worker_id}: 已停止。")
+
+    async def run_forever(self) -> None:
+        """以独立进程方式运行，直到被取消。"""
+        await self.start()
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.stop()
+            await stop_asr_task_poller()
+            await close_lfasr_http_client()
+            await close_llm_client()
+
+    def _claim_next_job(self) -> Optional[db_models.PipelineJob]:
+        db_local: Session = SessionLocal()
+        try:
+            return crud.claim_next_pipeline_job(
+                db_local,
+                worker_id=self.worker_id,
+                batch_max_concurrency=self.settings.PIPELINE_BATCH_MAX_CONCURRENCY,
+                long_job_seconds=self.settings.PIPELINE_LONG_JOB_SECONDS,
+                long_lane_max_running=self.settings.PIPELINE_LONG_LANE_MAX_RUNNING
+            )
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 认领任务失败: {e}")
+            return None
+        finally:
+            db_local.close()
+
+    def _finish_job(self, job_id: str, session_id: str, cancelled_error: Optional[str] = None) -> None:
+        db_local: Session = SessionLocal()
+        try:
+            db_session = crud.get_learning_session(db_local, session_id)
+            session_status = db_session.status if db_session else ""
+            if cancelled_error is None and session_status == ProcessingStatus.ALL_PROCESSING_COMPLETE.value:
+                crud.finish_pipeline_job(db_local, job_id, PipelineJobStatus.SUCCEEDED)
+            elif session_status == ProcessingStatus.CANCELLED.value:
+                crud.finish_pipeline_job(db_local, job_id, PipelineJobStatus.CANCELLED, last_error="Cancelled by user.")
+            else:
+                crud.finish_pipeline_job(
+                    db_local, job_id, PipelineJobStatus.FAILED,
+                    last_error=cancelled_error or f"Pipeline ended with session status '{session_status}'."
+                )
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 更新任务 {job_id} 结束状态失败: {e}")
+        finally:
+            db_local.close()
+
+    def _mark_session_failed(self, session_id: str) -> None:
+        """管道启动前失败时把会话标记为失败（已取消的会话保持取消状态），否则会话会一直停在初始处理状态"""
+        db_local: Session = SessionLocal()
+        try:
+            db_session = crud.get_learning_session(db_local, session_id)
+            if db_session is not None and db_session.status != ProcessingStatus.CANCELLED.value:
+                crud.update_learning_session_status(db_local, session_id, ProcessingStatus.ERROR_PIPELINE_FAILED)
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 标记会话 {session_id} 失败状态失败: {e}")
+        finally:
+            db_local.close()
+
+    def _record_job_media_duration(self, db_job: db_models.PipelineJob, media_duration_seconds: float) -> bool:
+        db_local: Session = SessionLocal()
+        try:
+            crud.set_pipeline_job_media_duration(db_local, db_job.job_id, media_duration_seconds)
+            db_job.media_duration_seconds = media_duration_seconds
+            # 时长提交后再复核长任务通道，与认领时相同，避免并发探测的长任务同时越过上限
+            return crud.release_pipeline_job_over_limits(
+                db_local,
+                db_job,
+                long_job_seconds=self.settings.PIPELINE_LONG_JOB_SECONDS,
+                long_lane_max_running=self.settings.PIPELINE_LONG_LANE_MAX_RUNNING
+            )
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 记录任务 {db_job.job_id} 媒体时长失败: {e}")
+            return False
+        finally:
+            db_local.close()
+
+    async def _route_long_job(self, db_job: db_models.PipelineJob, learning_session_input: LearningSessionInput) -> bool:
+        """
+         认领时媒体时长未知的B站任务：先探测（结果缓存，管道随后直接复用），
+         如果是长任务而长任务通道已满，则把任务放回队列，由认领过滤条件推迟到通道空闲时执行
+
+         @return 任务是否已放回队列
+        """
+        settings = self.settings
+        bilibili_url = _bilibili_url_of(learning_session_input)
+        if (
+            bilibili_url is None
+            or db_job.media_duration_seconds is not None
+            or settings.PIPELINE_LONG_JOB_SECONDS <= 0
+            or settings.PIPELINE_LONG_LANE_MAX_RUNNING <= 0
+        ):
+            return False
+        media_probe_info = await probe_bilibili_media(bilibili_url, settings)
+        if media_probe_info is None or media_probe_info.duration_seconds is None:
+            return False
+        released = await asyncio.to_thread(self._record_job_media_duration, db_job, media_probe_info.duration_seconds)
+        if released:
+            print(f"会话 {db_job.session_id}: 管道任务 {db_job.job_id} 为长任务（{media_probe_info.duration_seconds:.0f} 秒），长任务通道已满，已放回队列。")
+        return released
+
+    async def _run_job(self, db_job: db_models.PipelineJob) -> None:
+        job_id = db_job.job_id
+        session_id = db_job.session_id
+        print(f"会话 {session_id}: 管道任务 {job_id} 已被 {self.worker_id} 认领 (第 {db_job.attempts} 次尝试)。")
+        self._running_jobs[job_id] = session_id
+        pipeline_task: Optional[asyncio.Task] = None
+        try:
+            learning_session_input = LearningSessionInput.model_validate_json(db_job.payload_json)
+            if await self._route_long_job(db_job, learning_session_input):
+                return
+            # 管道运行在独立任务中，取消会话时只取消该任务，不影响工作协程本身
+            pipeline_task = asyncio.create_task(start_session_processing_pipeline(
+                session_id=session_id,
+                video_id=db_job.video_id,
+                learning_session_input=learning_session_input,
+                settings=self.settings
+            ))
+            try:
+                await asyncio.wait({pipeline_task})
+            except asyncio.CancelledError:
+                pipeline_task.cancel()
+                raise
+            if not pipeline_task.cancelled():
+                pipeline_task.result()
+            await asyncio.to_thread(self._finish_job, job_id, session_id)
+        except asyncio.CancelledError:
+            # 工作池关闭：不标记任务结束，交给心跳超时回收逻辑重新排队
+            raise
+        except Exception as e:
+            print(f"错误: 会话 {session_id}: 管道任务 {job_id} 执行异常: {e}")
+            if pipeline_task is None:
+                # 管道自身会在出错时设置会话状态；启动前（解析输入、探测路由）的失败由这里标记
+                await asyncio.to_thread(self._mark_session_failed, session_id)
+            await asyncio.to_thread(self._finish_job, job_id, session_id, str(e))
+        finally:
+            self._running_jobs.pop(job_id, None)
+
+    async def _worker_loop(self, index: int) -> None:
+        while not self._stop_event.is_set():
+            db_job = await asyncio.to_thread(self._claim_next_job)
+            if db_job is None:
+                try:
+                    await asyncio.wait_for(
+                        self._stop_event.wait(),
+                        timeout=self.settings.PIPELINE_QUEUE_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(db_job)
+
+    def _heartbeat_and_recover(self) -> None:
+        db_local: Session = SessionLocal()
+        try:
+            crud.touch_pipeline_job_heartbeats(db_local, list(self._running_jobs.keys()))
+            stale_before = datetime.now() - timedelta(seconds=self.settings.PIPELINE_JOB_STALE_SECONDS)
+            recovered_jobs = crud.requeue_stale_pipeline_jobs(
+                db_local,
+                stale_before=stale_before,
+                max_attempts=self.settings.PIPELINE_JOB_MAX_ATTEMPTS
+            )
+            for db_job in recovered_jobs:
+                if db_job.status == PipelineJobStatus.CANCELLED.value:
+                    print(f"会话 {db_job.session_id}: 已请求取消的管道任务 {db_job.job_id} 失联，标记为已取消。")
+                    crud.update_learning_session_status(db_local, db_job.session_id, ProcessingStatus.CANCELLED)
+                elif db_job.status == PipelineJobStatus.FAILED.value:
+                    print(f"错误: 会话 {db_job.session_id}: 管道任务 {db_job.job_id} 失联且已达最大尝试次数，标记为失败。")
+                    crud.update_learning_session_status(db_local, db_job.session_id, ProcessingStatus.ERROR_PIPELINE_FAILED)
+                else:
+                    print(f"会话 {db_job.session_id}: 管道任务 {db_job.job_id} 失联，已重新排队。")
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 心跳/回收失败: {e}")
+        finally:
+            db_local.close()
+
+    async def _maintenance_loop(self) -> None:
+        while not self._stop_event.is_set():
+            await asyncio.to_thread(self._heartbeat_and_recover)
+            try:
+                await asyncio.wait_for(
+                    self._stop_event.wait(),
+                    timeout=self.settings.PIPELINE_JOB_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _find_cancel_requested_jobs(self) -> List[str]:
+        db_local: Session = SessionLocal()
+        try:
+            return crud.get_cancel_requested_job_ids(db_local, list(self._running_jobs.keys()))
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 管道工作池 {self.worker_id}: 查询取消请求失败: {e}")
+            return []
+        finally:
+            db_local.close()
+
+    async def _cancellation_loop(self) -> None:
+        while not self._stop_event.is_set():
+            if self._running_jobs:
+                for job_id in await asyncio.to_thread(self._find_cancel_requested_jobs):
+                    session_id = self._running_jobs.get(job_id)
+                    if session_id:
+                        cancel_session(session_id)
+            try:
+                await asyncio.wait_for(
+                    self._stop_event.wait(),
+                    timeout=self.settings.PIPELINE_QUEUE_POLL_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,191 @@
+"""
+ 共享LLM客户端
+
+ Gemini 只在进程内配置一次；每个AI模块（A.1、A.2、B、D）有一个预先建好、带各自生成配置的模型句柄，
+ 同一事件循环上的所有模块共享一个 Gemini 异步客户端（一个gRPC通道，连接复用）。
+ 此前每次调用都执行 genai.configure 并新建 GenerativeModel，而 genai.configure 会丢弃已建立的客户端，
+ 热路径上每次调用都要重新建连。gRPC 异步通道绑定在创建它的事件循环上，因此客户端按事件循环各保留一份
+（与讯飞的 httpx 连接池相同）。
+ 调用经过资源调度器的Gemini槽位，令牌用量计入当前管道步骤。
+ 启用系统提示缓存时（见 app/services/prompt_cache.py），缓存就绪的模块只发送用户消息并引用缓存内容，
+ 否则（缓存未就绪、创建失败或提供方报告缓存不存在）内联发送系统提示；两种方式都把系统提示作为 system_instruction 发送，
+ 而不是作为用户内容。
+
+ 模型句柄通过私有属性注入客户端与缓存名称（GenerativeModel._async_client、_cached_content），
+ 这依赖 google-generativeai 的内部实现，已在 0.8.x（0.8.6）上验证；requirements.txt 因此固定为 0.8.x，
+ 升级前需重新确认 GenerativeModel 仍在 generate_content_async 中只在 _async_client 为 None 时创建默认客户端、
+ 并按 _cached_content 引用缓存内容。
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import client_options as client_options_lib
+from google.api_core import exceptions as google_exceptions
+
+from app.core.config import Settings
+from app.services.prompt_cache import CachedPrompt, GeminiPromptCacheProvider, PromptCacheManager
+from app.services.resource_governor import GEMINI, get_resource_governor, estimate_llm_tokens
+from app.services.stage_metrics import record_llm_usage
+
+# AI模块名称
+LLM_MODULE_A1 = "a1"
+LLM_MODULE_A2 = "a2"
+LLM_MODULE_B = "b"
+LLM_MODULE_D = "d"
+
+# 各模块的生成配置（模块按提示词要求在文本中输出JSON，未设置 response_mime_type）
+MODULE_GENERATION_CONFIGS: Dict[str, Dict[str, Any]] = {
+    LLM_MODULE_A1: {"temperature": 0.1},
+    LLM_MODULE_A2: {"temperature": 0.3},
+    LLM_MODULE_B: {"temperature": 0.4},
+    LLM_MODULE_D: {"temperature": 0.75},
+}
+
+_configure_lock = threading.Lock()
+_configured_api_key: Optional[str] = None
+
+def _configure_genai(api_key: str) -> None:
+    """
+     配置 genai 的默认客户端（每个进程、每个密钥只执行一次）
+
+     @param api_key Google API密钥
+    """
+    global _configured_api_key
+    with _configure_lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+class LlmClient:
+    """
+     绑定在当前事件循环上的Gemini客户端
+
+     @param api_key Google API密钥
+     @param model_name Gemini模型名称
+     @param prompt_cache 系统提示缓存（None 时始终内联发送系统提示）
+    """
+
+    def __init__(self, api_key: str, model_name: str, prompt_cache: Optional[PromptCacheManager] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.prompt_cache = prompt_cache
+        # 模块 -> (缓存名称, 引用该缓存的模型)
+        self._cached_models: Dict[str, Tuple[str, genai.GenerativeModel]] = {}
+        # 模块 -> (系统提示, 以该提示为 system_instruction 的模型)
+        self._inline_models: Dict[str, Tuple[str, genai.GenerativeModel]] = {}
+        self._async_client = glm.GenerativeServiceAsyncClient(
+            client_options=client_options_lib.ClientOptions(api_key=api_key)
+        )
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        for module, generation_config in MODULE_GENERATION_CONFIGS.items():
+            model = genai.GenerativeModel(model_name, generation_config=genai.types.GenerationConfig(**generation_config))
+            # GenerativeModel 没有注入客户端的公开参数；预先设置后它不再回退到 genai 的全局默认客户端
+            model._async_client = self._async_client
+            self._models[module] = model
+
+    def model(self, module: str) -> genai.GenerativeModel:
+        """
+         获取模块的模型句柄
+
+         @param module 模块名称（LLM_MODULE_*）
+         @return 带该模块生成配置的模型
+        """
+        return self._models[module]
+
+    def _inline_model(self, module: str, system_prompt: str) -> genai.GenerativeModel:
+        entry = self._inline_models.get(module)
+        if entry is None or entry[0] != system_prompt:
+            model = genai.GenerativeModel(
+                self.model_name,
+                generation_config=genai.types.GenerationConfig(**MODULE_GENERATION_CONFIGS[module]),
+                system_instruction=system_prompt,
+            )
+            model._async_client = self._async_client
+            entry = (system_prompt, model)
+            self._inline_models[module] = entry
+        return entry[1]
+
+    def _cached_model(self, module: str, cached_prompt: CachedPrompt) -> genai.GenerativeModel:
+        entry = self._cached_models.get(module)
+        if entry is None or entry[0] != cached_prompt.name:
+            model = genai.GenerativeModel(
+                cached_prompt.model_name,
+                generation_config=genai.types.GenerationConfig(**MODULE_GENERATION_CONFIGS[module]),
+            )
+            # 与 GenerativeModel.from_cached_content 相同的设置方式，但不再按名称请求一次缓存内容
+            model._cached_content = cached_prompt.name
+            model._async_client = self._async_client
+            entry = (cached_prompt.name, model)
+            self._cached_models[module] = entry
+        return entry[1]
+
+    async def generate_content(self, module: str, system_prompt: str, user_message: str) -> Any:
+        """
+         调用Gemini生成内容（先获取资源调度器的Gemini槽位，完成后记录令牌用量；系统提示缓存可用时只发送用户消息）
+
+         @param module 模块名称（LLM_MODULE_*）
+         @param system_prompt 模块的系统提示
+         @param user_message 本次调用的用户消息
+         @return generate_content_async 的响应对象
+        """
+        cached_prompt = None
+        if self.prompt_cache is not None:
+            cached_prompt = self.prompt_cache.cached_prompt(module, self.model_name, system_prompt)
+        async with get_resource_governor().acquire(GEMINI, tokens=estimate_llm_tokens(system_prompt, user_message)):
+            response = None
+            if cached_prompt is not None:
+                try:
+                    response = await self._cached_model(module, cached_prompt).generate_content_async([user_message])
+                except (google_exceptions.NotFound, google_exceptions.PermissionDenied) as e:
+                    # 缓存已被删除或过期，作废后本次内联发送系统提示
+                    print(f"模块 {module} 的系统提示缓存 {cached_prompt.name} 不可用，改为内联发送：{e}")
+                    self.prompt_cache.invalidate(module)
+            if response is None:
+                response = await self._inline_model(module, system_prompt).generate_content_async([user_message])
+        record_llm_usage(response)
+        return response
+
+    async def close(self) -> None:
+        """删除系统提示缓存并关闭底层gRPC通道"""
+        if self.prompt_cache is not None:
+            await self.prompt_cache.close()
+        await self._async_client.transport.close()
+
+# gRPC 异步通道绑定在创建它的事件循环上，因此每个事件循环一个客户端
+_llm_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LlmClient]" = weakref.WeakKeyDictionary()
+
+def get_llm_client(settings: Settings) -> LlmClient:
+    """
+     获取当前事件循环共享的LLM客户端（首次调用时创建，工作池启动时预先创建）
+
+     @param settings 配置设置
+     @return LlmClient 实例
+    """
+    api_key = settings.GOOGLE_API_KEY.get_secret_value()
+    loop = asyncio.get_running_loop()
+    llm_client = _llm_clients.get(loop)
+    if llm_client is None or llm_client.api_key != api_key or llm_client.model_name != settings.GEMINI_MODEL_NAME:
+        _configure_genai(api_key)
+        prompt_cache = None
+        if settings.GEMINI_PROMPT_CACHE_ENABLED:
+            prompt_cache = PromptCacheManager(
+                GeminiPromptCacheProvider(),
+                ttl_seconds=settings.GEMINI_PROMPT_CACHE_TTL_SECONDS,
+                refresh_margin_seconds=settings.GEMINI_PROMPT_CACHE_REFRESH_MARGIN_SECONDS,
+                retry_seconds=settings.GEMINI_PROMPT_CACHE_RETRY_SECONDS,
+            )
+        llm_client = LlmClient(api_key, settings.GEMINI_MODEL_NAME, prompt_cache=prompt_cache)
+        _llm_clients[loop] = llm_client
+        print(f"已创建共享LLM客户端（模型 {settings.GEMINI_MODEL_NAME}，模块 {', '.join(MODULE_GENERATION_CONFIGS)}，"
+              f"系统提示缓存{'已启用' if prompt_cache is not None else '未启用'}）。")
+    return llm_client
+
+async def close_llm_client() -> None:
+    """关闭当前事件循环的LLM客户端（如有，进程关闭时调用）"""
+    llm_client = _llm_clients.pop(asyncio.get_running_loop(), None)
+    if llm_client is not None:
+        await llm_client.close()
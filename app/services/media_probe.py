@@ -0,0 +1,185 @@
+"""
+ 媒体探测服务
+
+ 在下载之前用 `yt-dlp --print`（不下载媒体）获取B站视频的时长、所选音频流的编码和大小，
+ 按 BV号+分P 缓存在 media_probes 表中。探测结果用于：
+ - 任务调度：长视频进入长任务通道（见 crud.claim_next_pipeline_job）；
+ - ASR：按音频时长确定讯飞进度轮询的间隔与上限；
+ - A.1：直接使用真实总时长，不再由LLM根据转录推断。
+ 探测失败只记录日志，管道照常执行。
+"""
+import asyncio
+import json
+import subprocess
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.database import SessionLocal
+from app.core.config import Settings
+from app.core.utils import build_bilibili_download_url
+from app.models.data_models import MediaProbeInfo
+from app.services.content_cache import build_video_cache_key
+from app.services.resource_governor import YT_DLP, get_resource_governor
+from app.utils.process_runner import run_process_async
+
+# 只输出所需字段组成的单行JSON（yt-dlp 输出模板的 .{...}j 语法），避免 --dump-json 的完整格式列表
+_PROBE_PRINT_TEMPLATE = "%(.{duration,acodec,filesize,filesize_approx,title})j"
+
+def build_probe_command(download_url: str) -> List[str]:
+    """
+     构建探测命令（与下载使用相同的格式选择，大小和编码对应实际会下载的音频流）
+
+     @param download_url 传给 yt-dlp 的视频URL
+     @return 命令及参数列表
+    """
+    return [
+        'yt-dlp', '--no-warnings', '--no-playlist', '--skip-download',
+        '-f', 'bestaudio/best',
+        '--print', _PROBE_PRINT_TEMPLATE,
+        download_url
+    ]
+
+def parse_probe_output(stdout: str) -> Optional[MediaProbeInfo]:
+    """
+     解析探测命令的输出
+
+     @param stdout 探测命令的标准输出（取最后一个JSON行）
+     @return 探测结果；输出无法解析时返回None
+    """
+    for line in reversed(stdout.splitlines()):
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            raw: Dict[str, Any] = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        filesize = raw.get("filesize") or raw.get("filesize_approx")
+        duration = raw.get("duration")
+        audio_codec = raw.get("acodec")
+        title = raw.get("title")
+        return MediaProbeInfo(
+            duration_seconds=float(duration) if duration else None,
+            audio_codec=audio_codec if audio_codec and audio_codec != "none" else None,
+            filesize_bytes=int(filesize) if filesize else None,
+            title=str(title)[:500] if title else None
+        )
+    return None
+
+def get_cached_media_probe(db: Session, cache_key: str) -> Optional[MediaProbeInfo]:
+    """
+     读取未过期的探测结果
+
+     @param db 数据库会话
+     @param cache_key 视频缓存键
+     @return 探测结果；不存在或已过期时返回None
+    """
+    db_probe = crud.get_media_probe(db, cache_key)
+    if db_probe is None or db_probe.expires_at <= datetime.now():
+        return None
+    return MediaProbeInfo.model_validate(db_probe)
+
+def get_cached_media_durations(db: Session, bilibili_urls: List[Optional[str]]) -> List[Optional[float]]:
+    """
+     批量读取已缓存的媒体时长（只查库，不发起探测），用于入队时给任务分配通道
+
+     @param db 数据库会话
+     @param bilibili_urls B站视频URL列表（非B站会话为None）
+     @return 与输入对应的时长列表（秒），未知项为None
+    """
+    cache_keys = [build_video_cache_key(url) if url else None for url in bilibili_urls]
+    now = datetime.now()
+    durations = {
+        db_probe.cache_key: db_probe.duration_seconds
+        for db_probe in crud.get_media_probes(db, [key for key in cache_keys if key])
+        if db_probe.expires_at > now
+    }
+    return [durations.get(key) if key else None for key in cache_keys]
+
+def load_cached_media_probe(cache_key: str) -> Optional[MediaProbeInfo]:
+    """
+     在独立数据库会话中读取未过期的探测结果（不发起探测），失败只记录日志
+
+     @param cache_key 视频缓存键
+     @return 探测结果；不存在、已过期或读取失败时返回None
+    """
+    db_local: Session = SessionLocal()
+    try:
+        return get_cached_media_probe(db_local, cache_key)
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 读取媒体探测缓存 {cache_key} 失败: {e}")
+        return None
+    finally:
+        db_local.close()
+
+def store_media_probe(cache_key: str, probe_info: MediaProbeInfo, settings: Settings) -> None:
+    """
+     在独立数据库会话中写入探测结果缓存，失败只记录日志
+
+     @param cache_key 视频缓存键
+     @param probe_info 探测结果
+     @param settings 配置设置
+    """
+    db_local: Session = SessionLocal()
+    try:
+        crud.upsert_media_probe(
+            db_local,
+            cache_key=cache_key,
+            duration_seconds=probe_info.duration_seconds,
+            audio_codec=probe_info.audio_codec,
+            filesize_bytes=probe_info.filesize_bytes,
+            title=probe_info.title,
+            expires_at=datetime.now() + timedelta(seconds=settings.MEDIA_PROBE_TTL_SECONDS)
+        )
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 写入媒体探测缓存 {cache_key} 失败: {e}")
+    finally:
+        db_local.close()
+
+async def probe_bilibili_media(bilibili_url: str, settings: Settings) -> Optional[MediaProbeInfo]:
+    """
+     获取B站视频的媒体信息：优先读取缓存，否则运行 yt-dlp 探测并写入缓存（缓存读写在工作线程中执行）
+
+     @param bilibili_url B站视频URL（原始或规范化）
+     @param settings 配置设置
+     @return 探测结果；探测关闭、URL无法识别或探测失败时返回None
+    """
+    if not settings.MEDIA_PROBE_ENABLED:
+        return None
+    cache_key = build_video_cache_key(bilibili_url)
+    download_url = build_bilibili_download_url(bilibili_url)
+    if not download_url:
+        return None
+
+    if cache_key:
+        cached_probe = await asyncio.to_thread(load_cached_media_probe, cache_key)
+        if cached_probe is not None:
+            return cached_probe
+
+    command = build_probe_command(download_url)
+    try:
+        async with get_resource_governor().acquire(YT_DLP):
+            result = await run_process_async(command, timeout_seconds=settings.MEDIA_PROBE_TIMEOUT_SECONDS)
+    except FileNotFoundError:
+        print("错误: 媒体探测失败，未找到 yt-dlp。")
+        return None
+    except subprocess.TimeoutExpired:
+        print(f"错误: 媒体探测 {download_url} 超时（{settings.MEDIA_PROBE_TIMEOUT_SECONDS} 秒）。")
+        return None
+    if result.returncode != 0:
+        print(f"错误: 媒体探测 {download_url} 失败，返回码 {result.returncode}: {result.stderr}")
+        return None
+    probe_info = parse_probe_output(result.stdout)
+    if probe_info is None:
+        print(f"错误: 无法解析媒体探测 {download_url} 的输出: {result.stdout[-500:]}")
+        return None
+    print(f"媒体探测 {cache_key or download_url}: 时长 {probe_info.duration_seconds} 秒，音频编码 {probe_info.audio_codec}，大小 {probe_info.filesize_bytes} 字节。")
+
+    if cache_key:
+        await asyncio.to_thread(store_media_probe, cache_key, probe_info, settings)
+    return probe_info
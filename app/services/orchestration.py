@@ -8,6 +8,9 @@ import json
 import asyncio
 import os
 import shutil # Added for temporary directory cleanup
+import subprocess
+import threading
+import contextlib
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 import tempfile
@@ -18,18 +21,42 @@ from app.db import models as db_models
 from app.db import crud
 from app.db.database import SessionLocal
 from app.core.config import Settings
-from app.core.enums import ProcessingStatus # Added import
+from app.core.enums import ProcessingStatus, PipelineStage, MetricStage
 from app.utils.transcript_parser import parse_raw_transcript_to_segments
-from app.utils.audio_processor import prepare_audio_for_asr
+from app.utils.audio_processor import (
+    prepare_audio_for_asr_async,
+    find_media_file,
+    stream_audio_for_asr,
+    asr_audio_extension,
+    AsrAudioPart,
+    prepare_asr_upload_audio,
+    remap_asr_timestamp_ms
+)
 from app.services.asr.factory import get_asr_service
 from app.services.asr.base import AbstractAsrService
 from app.ai_modules.module_a1_llm_caller import invoke_module_a1_llm
 from app.ai_modules.module_a2_llm_caller import invoke_module_a2_llm
 from app.ai_modules.module_b_llm_caller import invoke_module_b_llm
 from app.ai_modules.module_d_llm_caller import invoke_module_d_llm
-from app.models.data_models import LearningSessionInput, GeneratedNoteRead, KnowledgeCueRead # Modified
+from app.models.data_models import LearningSessionInput, GeneratedNoteRead, KnowledgeCueRead, MediaProbeInfo # Modified
 # from app.ai_modules.module_d_knowledge_cues import generate_knowledge_cues # 已移除 # Keep this line if it was meant to be commented out.
-from app.core.utils import normalize_bilibili_url
+from app.core.utils import build_bilibili_download_url
+from app.services.media_probe import load_cached_media_probe, probe_bilibili_media
+from app.services.content_cache import (
+    build_video_cache_key,
+    build_input_fingerprint,
+    build_stage_fingerprint,
+    cached_stage_output,
+    load_cached_stage_outputs,
+    store_cached_stage_output
+)
+from app.services.resource_governor import get_resource_governor, XUNFEI, YT_DLP, FFMPEG
+from app.services.cancellation import register_session, unregister_session
+from app.services.stage_metrics import record_stage
+from app.utils.process_runner import run_process_async
+from app.utils.progress_parsers import parse_yt_dlp_progress, progress_line_handler
+from app.services.session_progress import SessionProgressReporter
+from app.utils.media_cache import get_media_cache, asr_audio_kind, MEDIA_KIND_SOURCE_AUDIO
 
 # Helper function to update status within its own session
 def _update_status_in_session(session_id: str, status: ProcessingStatus):
@@ -67,6 +94,228 @@ def _get_session_in_session(session_id: str) -> Optional[db_models.LearningSessi
     finally:
         db_local.close()
 
+# Helper function to load saved stage checkpoints within its own session
+def _load_checkpoints_in_session(session_id: str) -> Dict[str, Any]:
+    """Creates a local session to load the decoded stage checkpoints of a session, keyed by stage value."""
+    db_local: Session = SessionLocal()
+    try:
+        return {
+            db_checkpoint.stage: json.loads(db_checkpoint.output_json) if db_checkpoint.output_json else None
+            for db_checkpoint in crud.get_stage_checkpoints(db_local, session_id)
+        }
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 会话 {session_id}: 加载阶段检查点失败，将从头开始处理: {e}")
+        return {}
+    finally:
+        db_local.close()
+
+# Helper function to save a stage checkpoint within its own session
+def _save_checkpoint_in_session(session_id: str, stage: PipelineStage, output: Any) -> None:
+    """Creates a local session to persist the output of a completed stage. Failures are logged, not raised."""
+    db_local: Session = SessionLocal()
+    try:
+        crud.save_stage_checkpoint(db_local, session_id, stage, json.dumps(output, ensure_ascii=False))
+        print(f"会话 {session_id}: 阶段 {stage.value} 的检查点已保存。")
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 会话 {session_id}: 保存阶段 {stage.value} 的检查点失败: {e}")
+    finally:
+        db_local.close()
+
+# Helper function to get a generated note within its own session
+def _get_note_in_session(note_id: str) -> Optional[db_models.GeneratedNote]:
+    """Creates a local session to get a generated note object."""
+    db_local: Session = SessionLocal()
+    try:
+        return crud.get_generated_note(db_local, note_id)
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 获取笔记 {note_id} 失败: {e}")
+        return None
+    finally:
+        db_local.close()
+
+async def _store_in_video_cache(
+    video_cache_key: Optional[str],
+    stage: PipelineStage,
+    output: Any,
+    stage_fingerprint: Optional[str],
+    settings: Settings
+) -> None:
+    """Stores a freshly computed stage output in the cross-session video cache (in a worker thread), if caching applies to this session."""
+    if video_cache_key and settings.VIDEO_CACHE_ENABLED:
+        await asyncio.to_thread(store_cached_stage_output, video_cache_key, stage, output, stage_fingerprint, settings)
+
+def _fetch_from_media_cache(
+    video_cache_key: Optional[str],
+    kind: str,
+    dest_dir: str,
+    dest_name_no_ext: str
+) -> Optional[str]:
+    """Copies/links a cached media file for this video into the session's temp dir, if the on-disk media cache has it."""
+    media_cache = get_media_cache()
+    if media_cache is None or not video_cache_key:
+        return None
+    return media_cache.fetch(video_cache_key, kind, dest_dir, dest_name_no_ext)
+
+def _store_in_media_cache(video_cache_key: Optional[str], kind: str, file_path: str) -> None:
+    """Stores a freshly downloaded/transcoded media file in the on-disk media cache, if caching applies to this session."""
+    media_cache = get_media_cache()
+    if media_cache is not None and video_cache_key:
+        media_cache.store(video_cache_key, kind, file_path)
+
+def _asr_provider_slot(asr_client: AbstractAsrService) -> Any:
+    """Xunfei slot of the resource governor around a transcription, unless the ASR client takes the slot itself."""
+    if asr_client.manages_provider_slots:
+        return contextlib.nullcontext()
+    return get_resource_governor().acquire(XUNFEI)
+
+async def _transcribe_audio_chunks(
+    session_id: str,
+    asr_client: AbstractAsrService,
+    audio_chunks: List[AsrAudioPart],
+    session_cancel_event: threading.Event,
+    max_parallel: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Transcribes audio chunks as independent ASR tasks (at most max_parallel at once per session,
+    and within the Xunfei slots of the resource governor) and stitches the results onto one timeline
+    by remapping each chunk's bg/ed through the chunk's offset map.
+
+    Returns the combined segment list in timeline order, or None if any chunk fails
+    (the remaining chunks are then stopped).
+    """
+    # Stops the other chunks' upload/polling threads when one chunk fails or the session is cancelled
+    chunk_abort_event = threading.Event()
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def transcribe_chunk(index: int, chunk: AsrAudioPart) -> List[Dict[str, Any]]:
+        async with semaphore:
+            if chunk_abort_event.is_set() or session_cancel_event.is_set():
+                raise RuntimeError(f"ASR chunk {index + 1}/{len(audio_chunks)} skipped: transcription aborted.")
+            async with _asr_provider_slot(asr_client):
+                print(f"会话 {session_id}: 提交ASR分段 {index + 1}/{len(audio_chunks)}（{chunk.duration_seconds:.1f} 秒）。")
+                segments = await asr_client.transcribe(
+                    audio_file_path=chunk.path,
+                    cancel_event=chunk_abort_event,
+                    audio_duration_seconds=chunk.duration_seconds,
+                    session_id=session_id
+                )
+        if segments is None:
+            raise RuntimeError(f"ASR chunk {index + 1}/{len(audio_chunks)} failed (transcribe returned None).")
+        shifted_segments = []
+        for segment in segments:
+            shifted_segment = dict(segment)
+            shifted_segment['bg'] = str(remap_asr_timestamp_ms(int(segment.get('bg', '0')), chunk.offset_map))
+            shifted_segment['ed'] = str(remap_asr_timestamp_ms(int(segment.get('ed', '0')), chunk.offset_map, is_end=True))
+            shifted_segments.append(shifted_segment)
+        return shifted_segments
+
+    tasks = [
+        asyncio.create_task(transcribe_chunk(index, chunk))
+        for index, chunk in enumerate(audio_chunks)
+    ]
+    try:
+        chunk_results = await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        chunk_abort_event.set()
+        for task in tasks:
+            task.cancel()
+        raise
+    except Exception as e:
+        print(f"错误: 会话 {session_id}: {e} 正在停止其余ASR分段。")
+        chunk_abort_event.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return None
+    return [segment for chunk_segments in chunk_results for segment in chunk_segments]
+
+def _build_yt_dlp_command(url: str, output_template: str, download_mode: str) -> List[str]:
+    """
+    Builds the yt-dlp command for the configured acquisition mode.
+
+    "audio_only" selects the best audio-only stream and skips video download and muxing entirely
+    (falling back to the best single-file format if the site offers no audio-only stream);
+    "video" keeps the original behaviour of merging video and audio into an MP4.
+    An output template of "-" writes the stream to stdout; merging is impossible there,
+    so the audio-only format selection is always used.
+    """
+    # -o: output template (extension chosen by yt-dlp from the selected format)
+    # --no-warnings: suppress common warnings
+    # --progress --newline: one progress line per update (to stderr when streaming to stdout), parsed for session progress
+    to_stdout = output_template == "-"
+    command = ['yt-dlp', '--no-warnings', '--progress', '--newline', '-o', output_template]
+    if download_mode == "video" and not to_stdout:
+        command += ['--merge-output-format', 'mp4'] # Ensure MP4 output
+    else:
+        if download_mode != "audio_only":
+            print(f"警告: 未知的 BILI_DOWNLOAD_MODE '{download_mode}'，按 audio_only 处理。")
+        command += ['-f', 'bestaudio/best']
+    command.append(url)
+    return command
+
+async def _acquire_audio_streaming(
+    session_id: str,
+    bilibili_url: str,
+    audio_output_dir: str,
+    settings: Settings,
+    audio_codec: str,
+    audio_bitrate: Optional[str]
+) -> str:
+    """
+    Downloads a Bilibili video's audio and converts it to ASR-compliant audio in one streamed step:
+    yt-dlp writes to stdout and ffmpeg reads from stdin, so download and transcoding overlap and only
+    the final audio file (in audio_codec: ASR_AUDIO_CODEC, or 16kHz PCM when VAD runs afterwards) is written to disk.
+    Session cancellation cancels the pipeline task, which kills both processes.
+
+    Returns the audio path; raises (after setting the matching error status) on failure.
+    """
+    compliant_wav_path = os.path.join(
+        audio_output_dir, f"actual_bili_media_compliant{asr_audio_extension(audio_codec)}"
+    )
+    yt_dlp_command = _build_yt_dlp_command(bilibili_url, "-", settings.BILI_DOWNLOAD_MODE)
+    print(f"会话 {session_id}: 开始流式下载并提取音频: {' '.join(yt_dlp_command)} | ffmpeg -> {compliant_wav_path}")
+    _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_ACTIVE)
+
+    async with record_stage(session_id, MetricStage.STREAMED_ACQUISITION) as stage_metric:
+        # 流式模式同时占用一个yt-dlp槽位和一个ffmpeg槽位（固定先yt-dlp后ffmpeg的获取顺序）
+        async with get_resource_governor().acquire(YT_DLP), get_resource_governor().acquire(FFMPEG):
+            async with SessionProgressReporter(
+                session_id, MetricStage.STREAMED_ACQUISITION, settings.PROGRESS_UPDATE_INTERVAL_SECONDS
+            ) as progress_reporter:
+                try:
+                    download_ok, extraction_ok = await stream_audio_for_asr(
+                        yt_dlp_command,
+                        compliant_wav_path,
+                        audio_codec=audio_codec,
+                        audio_bitrate=audio_bitrate,
+                        timeout_seconds=settings.YT_DLP_TIMEOUT_SECONDS,
+                        source_stderr_handler=progress_line_handler(parse_yt_dlp_progress, progress_reporter)
+                    )
+                except FileNotFoundError as e:
+                    print(f"错误: 会话 {session_id}: 未找到 yt-dlp 或 ffmpeg: {e}")
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD)
+                    raise
+                except subprocess.TimeoutExpired as e:
+                    print(f"错误: 会话 {session_id}: 流式下载与音频提取超时（{e.timeout} 秒），进程已终止。")
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD)
+                    raise
+
+        if not download_ok:
+            _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD_YT_DLP_FAILED)
+            raise Exception("yt-dlp streaming download failed.")
+        if not extraction_ok:
+            _update_status_in_session(session_id, ProcessingStatus.ERROR_AUDIO_EXTRACTION)
+            raise Exception("Audio extraction from the yt-dlp stream failed.")
+        stage_metric.bytes_out = os.path.getsize(compliant_wav_path)
+
+    print(f"会话 {session_id}: 流式音频提取成功，音频文件: {compliant_wav_path}")
+    _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_SUCCESS)
+    _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_SUCCESS)
+    return compliant_wav_path
+
 async def process_learning_session(raw_transcript: str, video_title: str = None, source_description: str = None) -> dict:
     """
      处理学习会话的完整流程
@@ -96,6 +345,8 @@ async def start_session_processing_pipeline(
      然后将转录文本送入AI模块。否则，直接处理提供的原始转录文本。
      协调AI模块的处理流程，按顺序执行模块A.1（转录预处理）、
      模块A.2（关键信息提取）、模块B（笔记生成）和模块D（知识提示生成）。
+     每个阶段成功后保存检查点；重试或恢复时跳过已有检查点的阶段，从第一个未完成阶段继续。
+     会话被取消时终止子进程与ASR轮询，跳过剩余阶段并将状态置为cancelled。
      
      @param session_id 会话ID
      @param video_id 视频ID (由API层创建/管理)
@@ -107,6 +358,7 @@ async def start_session_processing_pipeline(
     
     parsed_segments_for_a1: List[Dict[str, Any]] = [] # Initialize for A1 input
     session_temp_base_dir: Optional[str] = None # For temporary file management and cleanup
+    media_probe_info: Optional[MediaProbeInfo] = None # Duration / codec / size probed before download
 
     # Extract initial values from learning_session_input
     raw_transcript_text_from_input = learning_session_input.rawTranscriptText
@@ -115,119 +367,241 @@ async def start_session_processing_pipeline(
     bilibili_url_pydantic_obj = learning_session_input.bilibili_video_url # Original Pydantic Url object
 
     processed_bilibili_url_str: Optional[str] = None # This will hold the normalized string URL
+    video_cache_key: Optional[str] = None # BV id + page, used for the cross-session content cache
 
     # Normalize the Bilibili URL if it exists and store it as a string
     if bilibili_url_pydantic_obj:
         bilibili_url_as_string = str(bilibili_url_pydantic_obj) # Convert Pydantic Url to string
-        processed_bilibili_url_str = normalize_bilibili_url(bilibili_url_as_string) # Pass string to normalizer
-        # normalize_bilibili_url already returns a string or an empty string.
+        # Normalized URL (empty string if unrecognized), keeping `p` so multi-part videos download the requested part
+        processed_bilibili_url_str = build_bilibili_download_url(bilibili_url_as_string)
+        video_cache_key = build_video_cache_key(bilibili_url_as_string)
+
+    # Cross-session cache of transcript and LLM outputs for the same Bilibili video (BV id + page)
+    input_fingerprint = build_input_fingerprint(initial_video_title, initial_source_description)
+    # LLM stages only reuse an entry built from the same user input and the same upstream output
+    cached_outputs: Dict[str, Any] = {}
+    if video_cache_key and settings.VIDEO_CACHE_ENABLED:
+        cached_outputs = await asyncio.to_thread(load_cached_stage_outputs, video_cache_key, settings)
+        if cached_outputs:
+            print(f"会话 {session_id}: 视频缓存 {video_cache_key} 有阶段 {sorted(cached_outputs.keys())} 的缓存（LLM阶段需输入指纹一致才会使用）。")
 
     # This will hold the transcript text to be processed by Module A1
     # transcript_for_a1: str = "" # No longer the primary way to pass transcript to A1 logic
     # session_temp_base_dir: Optional[str] = None # Defined earlier
 
+    # Load checkpoints of stages completed by a previous attempt (resume endpoint or re-queued job).
+    # Stages that already have a checkpoint are skipped and their saved outputs reused.
+    checkpoints: Dict[str, Any] = _load_checkpoints_in_session(session_id)
+    if checkpoints:
+        print(f"会话 {session_id}: 发现已完成阶段的检查点 {sorted(checkpoints.keys())}，将从第一个未完成阶段继续。")
+
+    # Register for cancellation: kills child processes, stops ASR polling and cancels this task
+    cancel_token = register_session(session_id)
+    cancel_token.attach_current_task()
+
     try:
-        if processed_bilibili_url_str:
+        if PipelineStage.TRANSCRIPT.value in checkpoints:
+            parsed_segments_for_a1 = checkpoints[PipelineStage.TRANSCRIPT.value] or []
+            print(f"会话 {session_id}: 使用检查点中的转录片段 ({len(parsed_segments_for_a1)} 个)，跳过下载/ASR/解析。")
+        elif processed_bilibili_url_str and cached_stage_output(cached_outputs, PipelineStage.TRANSCRIPT) is not None:
+            parsed_segments_for_a1 = cached_stage_output(cached_outputs, PipelineStage.TRANSCRIPT) or []
+            print(f"会话 {session_id}: 使用视频缓存 {video_cache_key} 中的转录片段 ({len(parsed_segments_for_a1)} 个)，跳过下载与ASR。")
+            _update_status_in_session(session_id, ProcessingStatus.BILI_ASR_SUCCESS)
+        elif processed_bilibili_url_str:
             print(f"会话 {session_id}: 检测到Bilibili URL: {processed_bilibili_url_str}。开始视频处理流程。")
             # Use helper for initial status update
             _update_status_in_session(session_id, ProcessingStatus.BILI_PROCESSING_STARTED)
 
-            # a. Video Download
+            # Probe duration/codec/size up front (usually already cached by the worker's lane routing)
+            media_probe_info = await asyncio.to_thread(load_cached_media_probe, video_cache_key) if video_cache_key else None
+            if media_probe_info is None and settings.MEDIA_PROBE_ENABLED:
+                async with record_stage(session_id, MetricStage.PROBE) as stage_metric:
+                    media_probe_info = await probe_bilibili_media(str(bilibili_url_pydantic_obj), settings)
+                    if media_probe_info is not None:
+                        stage_metric.bytes_out = media_probe_info.filesize_bytes
+
             print(f"会话 {session_id}: 创建临时目录用于视频处理...")
             session_temp_base_dir = tempfile.mkdtemp(prefix=f"session_{session_id}_")
-            download_dir = os.path.join(session_temp_base_dir, "video_download")
-            os.makedirs(download_dir, exist_ok=True)
+
+            # With VAD or chunking the audio is extracted as 16kHz PCM and compressed with ASR_AUDIO_CODEC only once,
+            # after trimming/cutting
+            if settings.VAD_ENABLED or settings.ASR_CHUNKING_ENABLED:
+                extraction_codec, extraction_bitrate = 'pcm', None
+            else:
+                extraction_codec, extraction_bitrate = settings.ASR_AUDIO_CODEC, settings.ASR_AUDIO_BITRATE
+
+            # Extracted audio (same codec/bitrate) cached by an earlier attempt for the same video skips download and extraction
+            asr_audio_cache_kind = asr_audio_kind(extraction_codec, extraction_bitrate)
+            compliant_wav_path = _fetch_from_media_cache(
+                video_cache_key, asr_audio_cache_kind, os.path.join(session_temp_base_dir, "asr_audio"), "actual_bili_media_compliant"
+            )
+            wav_from_media_cache = compliant_wav_path is not None
+            if wav_from_media_cache:
+                print(f"会话 {session_id}: 使用媒体缓存中的ASR音频，跳过下载与音频提取: {compliant_wav_path}")
+                _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_SUCCESS)
+            elif settings.BILI_STREAMING_ACQUISITION:
+                # a+b. Streamed download and audio extraction: yt-dlp stdout -> ffmpeg stdin, no media file on disk
+                compliant_wav_path = await _acquire_audio_streaming(
+                    session_id,
+                    processed_bilibili_url_str,
+                    os.path.join(session_temp_base_dir, "asr_audio"),
+                    settings,
+                    extraction_codec,
+                    extraction_bitrate
+                )
+            else:
+                # a. Video Download
+                download_dir = os.path.join(session_temp_base_dir, "video_download")
+                os.makedirs(download_dir, exist_ok=True)
             
-            # Use a fixed name for the downloaded video for simplicity in this context
-            downloaded_mp4_filename = "actual_bili_video.mp4"
-            downloaded_mp4_path = os.path.join(download_dir, downloaded_mp4_filename)
+                # Use a fixed base name for the download; the extension depends on the selected format
+                downloaded_media_name_no_ext = "actual_bili_media"
+                download_output_template = os.path.join(download_dir, f"{downloaded_media_name_no_ext}.%(ext)s")
             
-            print(f"会话 {session_id}: 开始使用 yt-dlp 下载视频: {processed_bilibili_url_str} 到 {downloaded_mp4_path}")
-            # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_ACTIVE)
+                downloaded_media_path = _fetch_from_media_cache(
+                    video_cache_key, MEDIA_KIND_SOURCE_AUDIO, download_dir, downloaded_media_name_no_ext
+                )
+                if downloaded_media_path is not None:
+                    print(f"会话 {session_id}: 使用媒体缓存中的音频，跳过 yt-dlp 下载: {downloaded_media_path}")
+                    _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_SUCCESS)
+                else:
+                    print(f"会话 {session_id}: 开始使用 yt-dlp 下载（模式 {settings.BILI_DOWNLOAD_MODE}）: {processed_bilibili_url_str} 到 {download_dir}")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_ACTIVE)
             
-            try:
-                # Construct yt-dlp command
-                # -o: output template
-                # --no-warnings: suppress warnings
-                # --quiet: suppress non-error output (optional, good for logs)
-                # --progress: show progress (might be noisy in logs, consider removing if too verbose)
-                # We want to ensure the video is downloaded as MP4. yt-dlp usually handles this well with -o *.mp4
-                # or by default if format is available. Adding --merge-output-format mp4 for robustness.
-                yt_dlp_command = [
-                    'yt-dlp',
-                    '--no-warnings', # Suppress common warnings
-                    # '--quiet', # Suppress non-error console output if too noisy for logs
-                    '--progress', # Show progress, can be verbose
-                    '-o', downloaded_mp4_path,
-                    '--merge-output-format', 'mp4', # Ensure MP4 output
-                    processed_bilibili_url_str # Use the processed string URL
-                ]
-                print(f"会话 {session_id}: 执行 yt-dlp 命令: {' '.join(yt_dlp_command)}")
+                    try:
+                        yt_dlp_command = _build_yt_dlp_command(
+                            processed_bilibili_url_str,
+                            download_output_template,
+                            settings.BILI_DOWNLOAD_MODE
+                        )
+                        print(f"会话 {session_id}: 执行 yt-dlp 命令: {' '.join(yt_dlp_command)}")
                 
-                import subprocess
-                process_result = await asyncio.to_thread(
-                    subprocess.run, yt_dlp_command, capture_output=True, text=True, check=False
-                )
+                        async with record_stage(session_id, MetricStage.DOWNLOAD) as stage_metric:
+                            async with get_resource_governor().acquire(YT_DLP):
+                                async with SessionProgressReporter(
+                                    session_id, MetricStage.DOWNLOAD, settings.PROGRESS_UPDATE_INTERVAL_SECONDS
+                                ) as progress_reporter:
+                                    try:
+                                        process_result = await run_process_async(
+                                            yt_dlp_command,
+                                            timeout_seconds=settings.YT_DLP_TIMEOUT_SECONDS,
+                                            line_handler=progress_line_handler(parse_yt_dlp_progress, progress_reporter)
+                                        )
+                                    except subprocess.TimeoutExpired as e:
+                                        raise Exception(f"yt-dlp did not finish within {e.timeout} seconds and was killed.") from e
 
-                if process_result.returncode != 0:
-                    # yt-dlp often exits with 0 even on some download issues if it gets *something*,
-                    # but a non-zero code is definitely an error.
-                    # Log stderr for details.
-                    print(f"错误: 会话 {session_id}: yt-dlp 下载失败。返回码: {process_result.returncode}")
-                    print(f"yt-dlp stderr: {process_result.stderr}")
-                    print(f"yt-dlp stdout: {process_result.stdout}") # Also log stdout for more context
-                    # Use helper for status update
-                    _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD_YT_DLP_FAILED)
-                    raise Exception(f"yt-dlp download failed with exit code {process_result.returncode}. stderr: {process_result.stderr}")
+                            if process_result.returncode != 0:
+                                # yt-dlp often exits with 0 even on some download issues if it gets *something*,
+                                # but a non-zero code is definitely an error.
+                                # Log stderr for details.
+                                print(f"错误: 会话 {session_id}: yt-dlp 下载失败。返回码: {process_result.returncode}")
+                                print(f"yt-dlp stderr: {process_result.stderr}")
+                                print(f"yt-dlp stdout: {process_result.stdout}") # Also log stdout for more context
+                                # Use helper for status update
+                                _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD_YT_DLP_FAILED)
+                                raise Exception(f"yt-dlp download failed with exit code {process_result.returncode}. stderr: {process_result.stderr}")
 
-                if not os.path.exists(downloaded_mp4_path) or os.path.getsize(downloaded_mp4_path) == 0:
-                    print(f"错误: 会话 {session_id}: yt-dlp 命令成功执行，但未找到输出文件或文件为空: {downloaded_mp4_path}")
-                    print(f"yt-dlp stdout (for context): {process_result.stdout}")
-                    print(f"yt-dlp stderr (for context): {process_result.stderr}")
-                    # Use helper for status update
-                    _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD_FILE_MISSING)
-                    raise Exception("yt-dlp executed but output file is missing or empty.")
+                            downloaded_media_path = find_media_file(download_dir, downloaded_media_name_no_ext)
+                            if downloaded_media_path is None:
+                                print(f"错误: 会话 {session_id}: yt-dlp 命令成功执行，但未找到输出文件或文件为空: {download_output_template}")
+                                print(f"yt-dlp stdout (for context): {process_result.stdout}")
+                                print(f"yt-dlp stderr (for context): {process_result.stderr}")
+                                # Use helper for status update
+                                _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD_FILE_MISSING)
+                                raise Exception("yt-dlp executed but output file is missing or empty.")
+                            stage_metric.bytes_out = os.path.getsize(downloaded_media_path)
                 
-                print(f"会话 {session_id}: yt-dlp 视频下载成功: {downloaded_mp4_path}")
-                # Use helper for status update
-                _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_SUCCESS)
-            except Exception as download_exc:
-                print(f"错误: 会话 {session_id}: 视频下载过程中发生错误: {download_exc}")
-                # Check current status before setting a general error
-                # Use helper to get session
-                current_status_obj = _get_session_in_session(session_id)
-                current_status_str = current_status_obj.status if current_status_obj else ""
-                if not current_status_str.startswith("error_bili_download"):
-                    # Use helper for status update
-                    _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD)
-                raise # Propagate to main error handler for pipeline
+                        print(f"会话 {session_id}: yt-dlp 下载成功: {downloaded_media_path}")
+                        # Use helper for status update
+                        _update_status_in_session(session_id, ProcessingStatus.BILI_DOWNLOAD_SUCCESS)
+                    except Exception as download_exc:
+                        print(f"错误: 会话 {session_id}: 视频下载过程中发生错误: {download_exc}")
+                        # Check current status before setting a general error
+                        # Use helper to get session
+                        current_status_obj = _get_session_in_session(session_id)
+                        current_status_str = current_status_obj.status if current_status_obj else ""
+                        if not current_status_str.startswith("error_bili_download"):
+                            # Use helper for status update
+                            _update_status_in_session(session_id, ProcessingStatus.ERROR_BILI_DOWNLOAD)
+                        raise # Propagate to main error handler for pipeline
+                    _store_in_media_cache(video_cache_key, MEDIA_KIND_SOURCE_AUDIO, downloaded_media_path)
 
-            # b. Audio Extraction
-            print(f"会话 {session_id}: 开始音频提取...")
-            # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_ACTIVE)
-            temp_audio_output_dir = os.path.join(session_temp_base_dir, "asr_audio")
-            os.makedirs(temp_audio_output_dir, exist_ok=True)
+                # b. Audio Extraction
+                print(f"会话 {session_id}: 开始音频提取...")
+                # Use helper for status update
+                _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_ACTIVE)
+                temp_audio_output_dir = os.path.join(session_temp_base_dir, "asr_audio")
+                os.makedirs(temp_audio_output_dir, exist_ok=True)
             
-            mp4_basename_no_ext = os.path.splitext(os.path.basename(downloaded_mp4_path))[0]
-
-            compliant_wav_path = await asyncio.to_thread(
-                prepare_audio_for_asr,
-                video_name_no_ext=mp4_basename_no_ext,
-                video_input_folder=os.path.dirname(downloaded_mp4_path),
-                audio_output_folder=temp_audio_output_dir,
-                output_filename_no_ext=f"{mp4_basename_no_ext}_compliant" 
-            )
+                async with record_stage(session_id, MetricStage.AUDIO_EXTRACTION) as stage_metric:
+                    stage_metric.bytes_in = os.path.getsize(downloaded_media_path)
+                    async with get_resource_governor().acquire(FFMPEG), SessionProgressReporter(
+                        session_id, MetricStage.AUDIO_EXTRACTION, settings.PROGRESS_UPDATE_INTERVAL_SECONDS
+                    ) as progress_reporter:
+                        compliant_wav_path = await prepare_audio_for_asr_async(
+                            video_name_no_ext=downloaded_media_name_no_ext,
+                            video_input_folder=download_dir,
+                            audio_output_folder=temp_audio_output_dir,
+                            output_filename_no_ext=f"{downloaded_media_name_no_ext}_compliant",
+                            audio_codec=extraction_codec,
+                            audio_bitrate=extraction_bitrate,
+                            timeout_seconds=settings.FFMPEG_TIMEOUT_SECONDS,
+                            progress_callback=progress_reporter
+                        )
 
-            if compliant_wav_path is None or not os.path.exists(compliant_wav_path):
-                print(f"错误: 会话 {session_id}: 音频提取失败。prepare_audio_for_asr 未返回有效路径或文件不存在。")
+                    if compliant_wav_path is None or not os.path.exists(compliant_wav_path):
+                        print(f"错误: 会话 {session_id}: 音频提取失败。prepare_audio_for_asr_async 未返回有效路径或文件不存在。")
+                        # Use helper for status update
+                        _update_status_in_session(session_id, ProcessingStatus.ERROR_AUDIO_EXTRACTION)
+                        raise Exception("Audio extraction failed.")
+                    stage_metric.bytes_out = os.path.getsize(compliant_wav_path)
+                print(f"会话 {session_id}: 音频提取成功，音频文件: {compliant_wav_path}")
                 # Use helper for status update
-                _update_status_in_session(session_id, ProcessingStatus.ERROR_AUDIO_EXTRACTION)
-                raise Exception("Audio extraction failed.")
-            print(f"会话 {session_id}: 音频提取成功，WAV文件: {compliant_wav_path}")
-            # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_SUCCESS)
+                _update_status_in_session(session_id, ProcessingStatus.BILI_AUDIO_EXTRACTION_SUCCESS)
+            if not wav_from_media_cache:
+                _store_in_media_cache(video_cache_key, asr_audio_cache_kind, compliant_wav_path)
+
+            # On the PCM: VAD cuts long silences so they are neither uploaded nor billed, and long audio is cut
+            # at quiet points into chunks transcribed as parallel ASR tasks; each file is compressed once.
+            # ASR timestamps are remapped onto the original timeline below
+            asr_offset_map: List[Any] = []
+            asr_audio_duration_seconds = media_probe_info.duration_seconds if media_probe_info else None
+            asr_audio_chunks: Optional[List[AsrAudioPart]] = None
+            if settings.VAD_ENABLED or settings.ASR_CHUNKING_ENABLED:
+                prepare_stage = MetricStage.SILENCE_TRIM if settings.VAD_ENABLED else MetricStage.AUDIO_CHUNKING
+                async with record_stage(session_id, prepare_stage) as stage_metric:
+                    stage_metric.bytes_in = os.path.getsize(compliant_wav_path)
+                    async with get_resource_governor().acquire(FFMPEG):
+                        upload_parts = await asyncio.to_thread(
+                            prepare_asr_upload_audio,
+                            compliant_wav_path,
+                            os.path.join(session_temp_base_dir, "asr_upload_audio"),
+                            "asr_audio",
+                            audio_codec=settings.ASR_AUDIO_CODEC,
+                            audio_bitrate=settings.ASR_AUDIO_BITRATE,
+                            vad_enabled=settings.VAD_ENABLED,
+                            silence_threshold_db=settings.VAD_SILENCE_THRESHOLD_DB,
+                            min_silence_ms=settings.VAD_MIN_SILENCE_MS,
+                            padding_ms=settings.VAD_PADDING_MS,
+                            chunking_enabled=settings.ASR_CHUNKING_ENABLED,
+                            target_chunk_seconds=settings.ASR_CHUNK_SECONDS,
+                            min_chunked_seconds=settings.ASR_CHUNK_MIN_AUDIO_SECONDS,
+                            search_window_seconds=settings.ASR_CHUNK_SEARCH_WINDOW_SECONDS,
+                            process_registry=cancel_token
+                        )
+                    if not upload_parts:
+                        print(f"错误: 会话 {session_id}: 静音剪除/切分或ASR音频编码失败: {compliant_wav_path}")
+                        _update_status_in_session(session_id, ProcessingStatus.ERROR_AUDIO_EXTRACTION)
+                        raise Exception("Preparing the ASR upload audio failed.")
+                    stage_metric.segment_count = len(upload_parts)
+                    stage_metric.bytes_out = sum(os.path.getsize(part.path) for part in upload_parts)
+                    if len(upload_parts) > 1:
+                        asr_audio_chunks = upload_parts
+                        print(f"会话 {session_id}: 音频已在静音处切分为 {len(upload_parts)} 段，将并行提交ASR。")
+                    else:
+                        compliant_wav_path, asr_offset_map, asr_audio_duration_seconds = upload_parts[0]
+                        print(f"会话 {session_id}: ASR音频已准备，保留 {len(asr_offset_map)} 段语音（{asr_audio_duration_seconds:.1f} 秒）: {compliant_wav_path}")
 
             # c. Speech-to-Text (Xunfei)
             print(f"会话 {session_id}: 开始讯飞语音转文字...")
@@ -240,21 +614,44 @@ async def start_session_processing_pipeline(
                 raise Exception("Xunfei ASR credentials not configured.")
 
             asr_client: AbstractAsrService = get_asr_service(settings)
-            transcription_result_list = await asr_client.transcribe(audio_file_path=compliant_wav_path)
+            async with record_stage(session_id, MetricStage.ASR) as stage_metric:
+                if asr_audio_chunks:
+                    stage_metric.bytes_in = sum(os.path.getsize(chunk.path) for chunk in asr_audio_chunks)
+                else:
+                    stage_metric.bytes_in = os.path.getsize(compliant_wav_path)
+                if asr_audio_chunks:
+                    transcription_result_list = await _transcribe_audio_chunks(
+                        session_id,
+                        asr_client,
+                        asr_audio_chunks,
+                        cancel_token.event,
+                        settings.ASR_CHUNK_MAX_PARALLEL
+                    )
+                else:
+                    async with _asr_provider_slot(asr_client):
+                        transcription_result_list = await asr_client.transcribe(
+                            audio_file_path=compliant_wav_path,
+                            cancel_event=cancel_token.event,
+                            audio_duration_seconds=asr_audio_duration_seconds,
+                            session_id=session_id
+                        )
 
-            if transcription_result_list is None: 
-                print(f"错误: 会话 {session_id}: 讯飞语音转文字失败 (transcribe返回None)。")
-                # Use helper for status update
-                _update_status_in_session(session_id, ProcessingStatus.ERROR_ASR_FAILED)
-                raise Exception("Xunfei ASR transcription failed (returned None).")
+                if transcription_result_list is None: 
+                    print(f"错误: 会话 {session_id}: 讯飞语音转文字失败 (transcribe返回None)。")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_ASR_FAILED)
+                    raise Exception("Xunfei ASR transcription failed (returned None).")
+                stage_metric.segment_count = len(transcription_result_list)
 
             # Attempt to convert ASR result list directly to structured segments
             _converted_segments = []
             if transcription_result_list: # Check if list is not None and potentially not empty
                 for segment_data in transcription_result_list:
                     try:
-                        start_ms = int(segment_data.get('bg', '0'))
-                        end_ms = int(segment_data.get('ed', '0'))
+                        # Map timestamps of the silence-trimmed audio back onto the original video timeline
+                        # (chunk results are already remapped, their asr_offset_map stays empty)
+                        start_ms = remap_asr_timestamp_ms(int(segment_data.get('bg', '0')), asr_offset_map)
+                        end_ms = remap_asr_timestamp_ms(int(segment_data.get('ed', '0')), asr_offset_map, is_end=True)
                         text = segment_data.get('onebest', '').strip()
                         speaker = segment_data.get('speaker', "1") # Default speaker
 
@@ -296,6 +693,8 @@ async def start_session_processing_pipeline(
             if transcription_result_list:
                  _log_full_transcript_text = " ".join([segment.get('onebest', '') for segment in transcription_result_list if segment.get('onebest')]).strip()
             print(f"会话 {session_id}: 讯飞语音转文字处理完成。(连接后文本长度: {len(_log_full_transcript_text)} 字)")
+            if parsed_segments_for_a1:
+                await _store_in_video_cache(video_cache_key, PipelineStage.TRANSCRIPT, parsed_segments_for_a1, None, settings)
 
             # transcript_for_a1 = full_transcript_text # This assignment is no longer the primary path for A1 input from Bili
             
@@ -303,7 +702,10 @@ async def start_session_processing_pipeline(
             print(f"会话 {session_id}: 检测到原始转录文本。开始直接处理。")
             # Use helper for status update
             _update_status_in_session(session_id, ProcessingStatus.TRANSCRIPT_PROCESSING_STARTED)
-            parsed_segments_for_a1 = parse_raw_transcript_to_segments(raw_transcript_text_from_input)
+            async with record_stage(session_id, MetricStage.TRANSCRIPT_PARSE) as stage_metric:
+                parsed_segments_for_a1 = parse_raw_transcript_to_segments(raw_transcript_text_from_input)
+                stage_metric.bytes_in = len(raw_transcript_text_from_input.encode("utf-8"))
+                stage_metric.segment_count = len(parsed_segments_for_a1)
             if not parsed_segments_for_a1:
                 print(f"错误: 会话 {session_id}: 提供的原始转录文本解析后为空或无效。")
                 # Consider a specific error status if needed, or let it fall to generic pipeline error
@@ -315,204 +717,301 @@ async def start_session_processing_pipeline(
             _update_status_in_session(session_id, ProcessingStatus.ERROR_NO_VALID_INPUT)
             raise ValueError("No valid input (Bilibili URL or raw transcript text) provided for the session.")
 
-        # Common check for empty segments before A1 call
-        if not parsed_segments_for_a1:
-            print(f"警告: 会话 {session_id}: 为模块A.1准备的解析片段列表为空。后续处理可能产生空结果或失败。")
-            # Module A1 should ideally handle an empty list gracefully.
-
-        print(f"会话 {session_id}: 开始模块A.1 (转录预处理与元数据生成)...")
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.A1_PREPROCESSING_ACTIVE)
-
-        try:
-            module_a1_output = await invoke_module_a1_llm(
-                parsed_transcript_segments=parsed_segments_for_a1, 
-                user_input_title=initial_video_title,
-                user_input_source_desc=initial_source_description,
-                settings=settings
-            )
-        except Exception as a1_exc:
-            print(f"错误: 会话 {session_id}: 模块A.1 LLM调用失败: {a1_exc}")
+        if PipelineStage.TRANSCRIPT.value not in checkpoints:
+            _save_checkpoint_in_session(session_id, PipelineStage.TRANSCRIPT, parsed_segments_for_a1)
+
+        if PipelineStage.A1.value in checkpoints:
+            module_a1_output = checkpoints[PipelineStage.A1.value]
+            print(f"会话 {session_id}: 使用检查点中的模块A.1输出，跳过A.1。")
+        else:
+            # Common check for empty segments before A1 call
+            if not parsed_segments_for_a1:
+                print(f"警告: 会话 {session_id}: 为模块A.1准备的解析片段列表为空。后续处理可能产生空结果或失败。")
+                # Module A1 should ideally handle an empty list gracefully.
+
+            print(f"会话 {session_id}: 开始模块A.1 (转录预处理与元数据生成)...")
             # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_A1_LLM)
-            raise 
-
-        # --- Database operations after Module A.1 ---
-        db_local: Session = SessionLocal()
-        try:
-            current_iso_timestamp = datetime.now().isoformat()
-            if module_a1_output.get("processingTimestamp") == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]":
-                module_a1_output["processingTimestamp"] = current_iso_timestamp
+            _update_status_in_session(session_id, ProcessingStatus.A1_PREPROCESSING_ACTIVE)
+
+            a1_fingerprint = build_stage_fingerprint(input_fingerprint, parsed_segments_for_a1)
+            cached_a1_output = cached_stage_output(cached_outputs, PipelineStage.A1, a1_fingerprint)
+            if cached_a1_output is not None:
+                module_a1_output = cached_a1_output
+                module_a1_output["videoId"] = video_id
+                print(f"会话 {session_id}: 使用视频缓存中的模块A.1输出，跳过LLM调用。")
             else:
-                print(f"警告: 会话 {session_id}: 模块A.1 LLM未按预期提供时间戳占位符。 使用当前时间。 LLM时间戳: {module_a1_output.get('processingTimestamp')}")
-                module_a1_output["processingTimestamp"] = current_iso_timestamp
-
-            if "videoId" in module_a1_output and module_a1_output["videoId"] != video_id:
-                print(f"警告: 会话 {session_id}: 模块A.1 LLM生成的videoId '{module_a1_output['videoId']}' 与系统中已有的videoId '{video_id}' 不符。将使用系统videoId.")
-
-            crud.update_learning_source_after_a1(
-                db=db_local, # Use local session
-                video_id=video_id, 
-                video_title_ai=module_a1_output["videoTitle"],
-                video_description_ai=module_a1_output["videoDescription"],
-                source_description_ai=module_a1_output["sourceDescription"],
-                total_duration_seconds_ai=module_a1_output.get("totalDurationSeconds"),
-                structured_transcript_segments_json=json.dumps(
-                    module_a1_output["transcriptSegments"],
-                    ensure_ascii=False
+                if media_probe_info is None and video_cache_key:
+                    media_probe_info = await asyncio.to_thread(load_cached_media_probe, video_cache_key)
+                try:
+                    async with record_stage(session_id, MetricStage.A1) as stage_metric:
+                        stage_metric.segment_count = len(parsed_segments_for_a1)
+                        module_a1_output = await invoke_module_a1_llm(
+                            parsed_transcript_segments=parsed_segments_for_a1, 
+                            user_input_title=initial_video_title,
+                            user_input_source_desc=initial_source_description,
+                            settings=settings,
+                            known_total_duration_seconds=media_probe_info.duration_seconds if media_probe_info else None
+                        )
+                except Exception as a1_exc:
+                    print(f"错误: 会话 {session_id}: 模块A.1 LLM调用失败: {a1_exc}")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_A1_LLM)
+                    raise 
+                await _store_in_video_cache(video_cache_key, PipelineStage.A1, module_a1_output, a1_fingerprint, settings)
+
+            # --- Database operations after Module A.1 ---
+            db_local: Session = SessionLocal()
+            try:
+                current_iso_timestamp = datetime.now().isoformat()
+                if module_a1_output.get("processingTimestamp") == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]":
+                    module_a1_output["processingTimestamp"] = current_iso_timestamp
+                else:
+                    print(f"警告: 会话 {session_id}: 模块A.1 LLM未按预期提供时间戳占位符。 使用当前时间。 LLM时间戳: {module_a1_output.get('processingTimestamp')}")
+                    module_a1_output["processingTimestamp"] = current_iso_timestamp
+
+                if "videoId" in module_a1_output and module_a1_output["videoId"] != video_id:
+                    print(f"警告: 会话 {session_id}: 模块A.1 LLM生成的videoId '{module_a1_output['videoId']}' 与系统中已有的videoId '{video_id}' 不符。将使用系统videoId.")
+
+                crud.update_learning_source_after_a1(
+                    db=db_local, # Use local session
+                    video_id=video_id, 
+                    video_title_ai=module_a1_output["videoTitle"],
+                    video_description_ai=module_a1_output["videoDescription"],
+                    source_description_ai=module_a1_output["sourceDescription"],
+                    total_duration_seconds_ai=module_a1_output.get("totalDurationSeconds"),
+                    structured_transcript_segments_json=json.dumps(
+                        module_a1_output["transcriptSegments"],
+                        ensure_ascii=False
+                    )
                 )
-            )
-            db_local.commit()
-            # Status update handled separately by helper
-            print(f"会话 {session_id}: 模块A.1处理完成，信息已保存。")
-        except Exception as e_db_a1:
-            print(f"错误: 会话 {session_id}: 保存模块A.1结果失败: {e_db_a1}")
-            db_local.rollback()
-            raise
-        finally:
-            db_local.close()
-
-        # Update status after A.1 DB operations are complete (even if A1 LLM failed, DB save could succeed if A1 output was mocked/partial)
-        # But the try...except above re-raises, so this status update only happens if DB save was attempted AND succeeded.
-        # To ensure status update happens even if DB save fails BUT LLM succeeded, need careful placement.
-        # Let's move status update outside the inner DB try/except but still after LLM call.
-        _update_status_in_session(session_id, ProcessingStatus.A1_PREPROCESSING_COMPLETE) # This will create its own session
-
-        print(f"会话 {session_id}: 开始模块A.2 (关键信息提取)...")
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.A2_EXTRACTION_ACTIVE)
-        
-        try:
-            module_a2_output = await invoke_module_a2_llm(
-                module_a1_llm_output=module_a1_output, 
-                settings=settings
-            )
-        except Exception as a2_exc:
-            print(f"错误: 会话 {session_id}: 模块A.2 LLM调用失败: {a2_exc}")
+                db_local.commit()
+                # Status update handled separately by helper
+                print(f"会话 {session_id}: 模块A.1处理完成，信息已保存。")
+            except Exception as e_db_a1:
+                print(f"错误: 会话 {session_id}: 保存模块A.1结果失败: {e_db_a1}")
+                db_local.rollback()
+                raise
+            finally:
+                db_local.close()
+
+            # Update status after A.1 DB operations are complete (even if A1 LLM failed, DB save could succeed if A1 output was mocked/partial)
+            # But the try...except above re-raises, so this status update only happens if DB save was attempted AND succeeded.
+            # To ensure status update happens even if DB save fails BUT LLM succeeded, need careful placement.
+            # Let's move status update outside the inner DB try/except but still after LLM call.
+            _update_status_in_session(session_id, ProcessingStatus.A1_PREPROCESSING_COMPLETE) # This will create its own session
+            _save_checkpoint_in_session(session_id, PipelineStage.A1, module_a1_output)
+
+        if PipelineStage.A2.value in checkpoints:
+            module_a2_output = checkpoints[PipelineStage.A2.value]
+            print(f"会话 {session_id}: 使用检查点中的模块A.2输出，跳过A.2。")
+        else:
+            print(f"会话 {session_id}: 开始模块A.2 (关键信息提取)...")
             # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_A2_LLM)
-            raise
-
-        # --- Database operations after Module A.2 ---
-        db_local: Session = SessionLocal()
-        try:
-            a2_processing_timestamp = module_a2_output.get("processingTimestamp")
-            if a2_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not a2_processing_timestamp:
-                print(f"会话 {session_id}: 模块A.2 LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {a2_processing_timestamp}")
-                module_a2_output["processingTimestamp"] = datetime.now().isoformat()
-
-            crud.update_learning_source_after_a2(
-                db=db_local, # Use local session
-                video_id=video_id, 
-                extracted_key_information_json=json.dumps(
-                    module_a2_output["extractedKeyInformation"],
-                    ensure_ascii=False
-                )
-            )
-            db_local.commit()
-            # Status update handled separately by helper
-            print(f"会话 {session_id}: 模块A.2处理完成，信息已保存。")
-        except Exception as e_db_a2:
-            print(f"错误: 会话 {session_id}: 保存模块A.2结果失败: {e_db_a2}")
-            db_local.rollback()
-            raise
-        finally:
-            db_local.close()
-
-        # Update status after A.2 DB operations are complete
-        _update_status_in_session(session_id, ProcessingStatus.A2_EXTRACTION_COMPLETE)
-        print(f"会话 {session_id}: 模块A.2处理完成。")
-        
-        print(f"会话 {session_id}: 开始模块B (笔记生成)...")
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.NOTE_GENERATION_ACTIVE)
+            _update_status_in_session(session_id, ProcessingStatus.A2_EXTRACTION_ACTIVE)
         
-        real_module_b_output: Dict[str, Any]
-        try:
-            real_module_b_output = await invoke_module_b_llm(
-                module_a1_output=module_a1_output,
-                module_a2_output=module_a2_output,
-                settings=settings
-            )
-        except Exception as b_exc:
-            print(f"错误: 会话 {session_id}: 模块B LLM调用失败: {b_exc}")
+            a2_fingerprint = build_stage_fingerprint(input_fingerprint, module_a1_output)
+            cached_a2_output = cached_stage_output(cached_outputs, PipelineStage.A2, a2_fingerprint)
+            if cached_a2_output is not None:
+                module_a2_output = cached_a2_output
+                module_a2_output["videoId"] = video_id
+                print(f"会话 {session_id}: 使用视频缓存中的模块A.2输出，跳过LLM调用。")
+            else:
+                try:
+                    async with record_stage(session_id, MetricStage.A2):
+                        module_a2_output = await invoke_module_a2_llm(
+                            module_a1_llm_output=module_a1_output, 
+                            settings=settings
+                        )
+                except Exception as a2_exc:
+                    print(f"错误: 会话 {session_id}: 模块A.2 LLM调用失败: {a2_exc}")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_A2_LLM)
+                    raise
+                await _store_in_video_cache(video_cache_key, PipelineStage.A2, module_a2_output, a2_fingerprint, settings)
+
+            # --- Database operations after Module A.2 ---
+            db_local: Session = SessionLocal()
+            try:
+                a2_processing_timestamp = module_a2_output.get("processingTimestamp")
+                if a2_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not a2_processing_timestamp:
+                    print(f"会话 {session_id}: 模块A.2 LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {a2_processing_timestamp}")
+                    module_a2_output["processingTimestamp"] = datetime.now().isoformat()
+
+                crud.update_learning_source_after_a2(
+                    db=db_local, # Use local session
+                    video_id=video_id, 
+                    extracted_key_information_json=json.dumps(
+                        module_a2_output["extractedKeyInformation"],
+                        ensure_ascii=False
+                    )
+                )
+                db_local.commit()
+                # Status update handled separately by helper
+                print(f"会话 {session_id}: 模块A.2处理完成，信息已保存。")
+            except Exception as e_db_a2:
+                print(f"错误: 会话 {session_id}: 保存模块A.2结果失败: {e_db_a2}")
+                db_local.rollback()
+                raise
+            finally:
+                db_local.close()
+
+            # Update status after A.2 DB operations are complete
+            _update_status_in_session(session_id, ProcessingStatus.A2_EXTRACTION_COMPLETE)
+            print(f"会话 {session_id}: 模块A.2处理完成。")
+            _save_checkpoint_in_session(session_id, PipelineStage.A2, module_a2_output)
+
+        db_note: db_models.GeneratedNote
+        b_checkpoint = checkpoints.get(PipelineStage.NOTE_GENERATION.value)
+        if b_checkpoint:
+            db_note = _get_note_in_session(b_checkpoint["noteId"])
+            if db_note is None:
+                print(f"警告: 会话 {session_id}: 检查点中的笔记 {b_checkpoint['noteId']} 不存在，将重新执行模块B。")
+                b_checkpoint = None
+            else:
+                print(f"会话 {session_id}: 使用检查点中的笔记 {db_note.note_id}，跳过模块B。")
+        if not b_checkpoint:
+            print(f"会话 {session_id}: 开始模块B (笔记生成)...")
             # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_B_LLM)
-            raise
-
-        b_processing_timestamp = real_module_b_output.get("generationTimestamp")
-        if b_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not b_processing_timestamp:
-            print(f"会话 {session_id}: 模块B LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {b_processing_timestamp}")
-            real_module_b_output["generationTimestamp"] = datetime.now().isoformat()
-
-        db_note = crud.create_generated_note(
-            db=db_local,
-            video_id=video_id, 
-            session_id=session_id,
-            note_markdown_content=real_module_b_output["noteMarkdownContent"],
-            estimated_reading_time_seconds=real_module_b_output.get("estimatedReadingTimeSeconds"),
-            key_concepts_mentioned=real_module_b_output.get("keyConceptsMentioned"),
-            summary_of_note=real_module_b_output.get("summaryOfNote"),
-            user_id=None 
-        )
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.NOTE_GENERATION_COMPLETE)
-        print(f"会话 {session_id}: 模块B处理完成。笔记ID: {db_note.note_id}")
-        
-        print(f"会话 {session_id}: 开始模块D (知识提示生成)...")
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.KNOWLEDGE_CUES_GENERATION_ACTIVE)
+            _update_status_in_session(session_id, ProcessingStatus.NOTE_GENERATION_ACTIVE)
         
-        real_d_output: Dict[str, Any]
-        try:
-            real_d_output = await invoke_module_d_llm(
-                note_markdown_content=db_note.markdown_content,
-                key_concepts_list=db_note.key_concepts_mentioned, 
-                note_summary=db_note.summary_of_note,
-                video_id=video_id, 
-                note_id=db_note.note_id, 
-                settings=settings
-            )
-        except Exception as d_exc:
-            print(f"错误: 会话 {session_id}: 模块D LLM调用失败: {d_exc}")
+            real_module_b_output: Dict[str, Any]
+            b_fingerprint = build_stage_fingerprint(input_fingerprint, [module_a1_output, module_a2_output])
+            cached_b_output = cached_stage_output(cached_outputs, PipelineStage.NOTE_GENERATION, b_fingerprint)
+            if cached_b_output is not None:
+                real_module_b_output = cached_b_output
+                print(f"会话 {session_id}: 使用视频缓存中的模块B输出，跳过LLM调用。")
+            else:
+                try:
+                    async with record_stage(session_id, MetricStage.NOTE_GENERATION):
+                        real_module_b_output = await invoke_module_b_llm(
+                            module_a1_output=module_a1_output,
+                            module_a2_output=module_a2_output,
+                            settings=settings
+                        )
+                except Exception as b_exc:
+                    print(f"错误: 会话 {session_id}: 模块B LLM调用失败: {b_exc}")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_B_LLM)
+                    raise
+                await _store_in_video_cache(video_cache_key, PipelineStage.NOTE_GENERATION, real_module_b_output, b_fingerprint, settings)
+
+            b_processing_timestamp = real_module_b_output.get("generationTimestamp")
+            if b_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not b_processing_timestamp:
+                print(f"会话 {session_id}: 模块B LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {b_processing_timestamp}")
+                real_module_b_output["generationTimestamp"] = datetime.now().isoformat()
+
+            db_local: Session = SessionLocal()
+            try:
+                db_note = crud.create_generated_note(
+                    db=db_local,
+                    video_id=video_id, 
+                    session_id=session_id,
+                    note_markdown_content=real_module_b_output["noteMarkdownContent"],
+                    estimated_reading_time_seconds=real_module_b_output.get("estimatedReadingTimeSeconds"),
+                    key_concepts_mentioned=real_module_b_output.get("keyConceptsMentioned"),
+                    summary_of_note=real_module_b_output.get("summaryOfNote"),
+                    user_id=None 
+                )
+            finally:
+                db_local.close()
+            # Use helper for status update
+            _update_status_in_session(session_id, ProcessingStatus.NOTE_GENERATION_COMPLETE)
+            print(f"会话 {session_id}: 模块B处理完成。笔记ID: {db_note.note_id}")
+            _save_checkpoint_in_session(session_id, PipelineStage.NOTE_GENERATION, {"noteId": db_note.note_id})
+
+        d_checkpoint = checkpoints.get(PipelineStage.KNOWLEDGE_CUES.value)
+        if d_checkpoint and d_checkpoint.get("noteId") == db_note.note_id:
+            # The cues of this note were already written by a previous attempt
+            print(f"会话 {session_id}: 使用检查点中笔记 {db_note.note_id} 的知识提示，跳过模块D。")
+        else:
+            print(f"会话 {session_id}: 开始模块D (知识提示生成)...")
             # Use helper for status update
-            _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_D_LLM)
-            raise
+            _update_status_in_session(session_id, ProcessingStatus.KNOWLEDGE_CUES_GENERATION_ACTIVE)
+        
+            real_d_output: Dict[str, Any]
+            # Module D is built from the stored note, which may come from a checkpoint rather than this run's B output
+            d_fingerprint = build_stage_fingerprint(input_fingerprint, {
+                "noteMarkdownContent": db_note.markdown_content,
+                "keyConceptsMentioned": db_note.key_concepts_mentioned,
+                "summaryOfNote": db_note.summary_of_note,
+            })
+            cached_d_output = cached_stage_output(cached_outputs, PipelineStage.KNOWLEDGE_CUES, d_fingerprint)
+            if cached_d_output is not None:
+                real_d_output = cached_d_output
+                print(f"会话 {session_id}: 使用视频缓存中的模块D输出，跳过LLM调用。")
+            else:
+                try:
+                    async with record_stage(session_id, MetricStage.KNOWLEDGE_CUES):
+                        real_d_output = await invoke_module_d_llm(
+                            note_markdown_content=db_note.markdown_content,
+                            key_concepts_list=db_note.key_concepts_mentioned, 
+                            note_summary=db_note.summary_of_note,
+                            video_id=video_id, 
+                            note_id=db_note.note_id, 
+                            settings=settings
+                        )
+                except Exception as d_exc:
+                    print(f"错误: 会话 {session_id}: 模块D LLM调用失败: {d_exc}")
+                    # Use helper for status update
+                    _update_status_in_session(session_id, ProcessingStatus.ERROR_IN_D_LLM)
+                    raise
+                await _store_in_video_cache(video_cache_key, PipelineStage.KNOWLEDGE_CUES, real_d_output, d_fingerprint, settings)
 
-        d_processing_timestamp = real_d_output.get("generationTimestamp")
-        if d_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not d_processing_timestamp:
-            print(f"会话 {session_id}: 模块D LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {d_processing_timestamp}")
+            d_processing_timestamp = real_d_output.get("generationTimestamp")
+            if d_processing_timestamp == "[SYSTEM_GENERATED_TIMESTAMP_YYYY-MM-DDTHH:MM:SSZ]" or not d_processing_timestamp:
+                print(f"会话 {session_id}: 模块D LLM未提供有效时间戳或使用了占位符。使用当前时间。 LLM时间戳: {d_processing_timestamp}")
             
-        knowledge_cues_from_d = real_d_output.get("knowledgeCues", [])
-        if not isinstance(knowledge_cues_from_d, list):
-            print(f"警告: 会话 {session_id}: 模块D LLM 返回的 'knowledgeCues' 不是列表，而是一个 {type(knowledge_cues_from_d)}。将使用空列表。")
-            knowledge_cues_from_d = []
-
-        for cue_data in knowledge_cues_from_d:
-            if not all(k in cue_data for k in ["questionText", "answerText", "difficultyLevel"]):
-                print(f"警告: 会话 {session_id}: 模块D LLM 返回的 cue_data 缺少必要字段: {cue_data}。跳过此提示。")
-                continue
-                
-            crud.create_knowledge_cue(
-                db=db_local, # Use the local session
-                note_id=db_note.note_id, # Use note_id from the ORM object
-                question_text=cue_data["questionText"],
-                answer_text=cue_data["answerText"],
-                difficulty_level=cue_data["difficultyLevel"],
-                source_reference_in_note=cue_data.get("sourceReferenceInNote")
-            )
-            print(f"会话 {session_id}: 已从模块D生成知识提示: {cue_data['questionText'][:50]}...")
+            knowledge_cues_from_d = real_d_output.get("knowledgeCues", [])
+            if not isinstance(knowledge_cues_from_d, list):
+                print(f"警告: 会话 {session_id}: 模块D LLM 返回的 'knowledgeCues' 不是列表，而是一个 {type(knowledge_cues_from_d)}。将使用空列表。")
+                knowledge_cues_from_d = []
+
+            db_local: Session = SessionLocal()
+            try:
+                # A previous attempt may have failed after writing some cues; start from a clean slate
+                removed_cue_count = crud.delete_knowledge_cues_by_note_id(db_local, db_note.note_id)
+                if removed_cue_count:
+                    print(f"会话 {session_id}: 已清理上次尝试遗留的 {removed_cue_count} 条知识提示。")
+
+                for cue_data in knowledge_cues_from_d:
+                    if not all(k in cue_data for k in ["questionText", "answerText", "difficultyLevel"]):
+                        print(f"警告: 会话 {session_id}: 模块D LLM 返回的 cue_data 缺少必要字段: {cue_data}。跳过此提示。")
+                        continue
+                    
+                    crud.create_knowledge_cue(
+                        db=db_local, # Use the local session
+                        note_id=db_note.note_id, # Use note_id from the ORM object
+                        question_text=cue_data["questionText"],
+                        answer_text=cue_data["answerText"],
+                        difficulty_level=cue_data["difficultyLevel"],
+                        source_reference_in_note=cue_data.get("sourceReferenceInNote")
+                    )
+                    print(f"会话 {session_id}: 已从模块D生成知识提示: {cue_data['questionText'][:50]}...")
+            finally:
+                db_local.close()
         
-        # Use helper for status update
-        _update_status_in_session(session_id, ProcessingStatus.KNOWLEDGE_CUES_GENERATION_COMPLETE)
-        print(f"会话 {session_id}: 模块D处理完成。")
+            # Use helper for status update
+            _update_status_in_session(session_id, ProcessingStatus.KNOWLEDGE_CUES_GENERATION_COMPLETE)
+            print(f"会话 {session_id}: 模块D处理完成。")
+            _save_checkpoint_in_session(session_id, PipelineStage.KNOWLEDGE_CUES, {"noteId": db_note.note_id})
         
         # Final Status Update (Success)
         # Use helper for final status update
         _update_status_in_session(session_id, ProcessingStatus.ALL_PROCESSING_COMPLETE)
         print(f"会话 {session_id}: 所有处理步骤成功完成。")
 
+    except asyncio.CancelledError:
+        if not cancel_token.is_cancelled:
+            raise # Worker pool shutdown, not a user cancellation
+        _update_status_in_session(session_id, ProcessingStatus.CANCELLED)
+        print(f"会话 {session_id}: 管道已被取消，剩余阶段已跳过。")
+
     except Exception as e:
+        if cancel_token.is_cancelled:
+            # A killed subprocess or stopped ASR poll surfaced as an ordinary failure
+            _update_status_in_session(session_id, ProcessingStatus.CANCELLED)
+            print(f"会话 {session_id}: 管道已被取消，剩余阶段已跳过。")
+            return
         print(f"错误: 会话 {session_id}: 处理管道中发生未捕获的异常: {e}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
@@ -530,6 +1029,7 @@ async def start_session_processing_pipeline(
 
     finally:
         # This outer finally only handles cleanup like temporary files
+        unregister_session(session_id, cancel_token)
         if session_temp_base_dir and os.path.exists(session_temp_base_dir):
             try:
                 await asyncio.to_thread(shutil.rmtree, session_temp_base_dir)
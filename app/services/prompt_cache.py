@@ -0,0 +1,230 @@
+"""
+ 系统提示的服务端上下文缓存
+
+ A.1、A.2、B、D 的系统提示各有 10～14 KB，每次调用都随请求重新发送。启用后，每个模块的系统提示在提供方
+ 创建一份缓存内容（Gemini 的 cachedContents），调用只发送用户消息并引用缓存名称：
+ - 首次调用该模块时在后台创建缓存，缓存就绪前的调用照常内联发送系统提示（不在热路径上等待创建）；
+ - 缓存距过期不足 refresh_margin_seconds 时在后台延长有效期；已过期或提供方报告缓存不存在时作废并重新创建；
+ - 创建失败（如提示低于模型的最小缓存令牌数、模型不支持缓存）时内联发送，retry_seconds 后再尝试。
+
+ 提供方通过 PromptCacheProvider 抽象，GeminiPromptCacheProvider 调用 genai.caching。
+ Gemini 只缓存不少于模型最小令牌数的内容（gemini-1.5 系列为 32768 个令牌），且只有带版本后缀的模型
+（如 gemini-1.5-flash-002）支持缓存；默认不启用，确认模型与提示长度满足要求后再开启。
+"""
+import asyncio
+import datetime
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+# 缓存剩余有效期低于该秒数时不再使用（避免请求到达时缓存恰好过期）
+CACHE_EXPIRY_GUARD_SECONDS = 15
+
+@dataclass
+class CachedPrompt:
+    """
+     提供方上的一份缓存内容
+
+     @param name 缓存名称（请求中引用，例如 cachedContents/abc123）
+     @param model_name 缓存所属的模型（引用缓存的请求必须使用该模型）
+     @param prompt_sha256 被缓存的系统提示的 SHA-256
+     @param expires_at 过期时间（time.time() 时间戳）
+    """
+    name: str
+    model_name: str
+    prompt_sha256: str
+    expires_at: float
+
+class PromptCacheProvider(ABC):
+    """缓存内容提供方"""
+
+    @abstractmethod
+    async def create(self, model_name: str, system_prompt: str, ttl_seconds: int, display_name: str) -> CachedPrompt:
+        """
+         创建缓存内容
+
+         @param model_name 模型名称
+         @param system_prompt 要缓存的系统提示
+         @param ttl_seconds 有效期（秒）
+         @param display_name 便于在控制台识别的名称
+         @return 创建的缓存
+        """
+
+    @abstractmethod
+    async def refresh(self, cached_prompt: CachedPrompt, ttl_seconds: int) -> CachedPrompt:
+        """
+         从现在起延长缓存的有效期
+
+         @param cached_prompt 缓存
+         @param ttl_seconds 新的有效期（秒）
+         @return 更新后的缓存
+        """
+
+    @abstractmethod
+    async def delete(self, cached_prompt: CachedPrompt) -> None:
+        """
+         删除缓存（缓存已不存在时忽略）
+
+         @param cached_prompt 缓存
+        """
+
+def _prompt_sha256(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+class GeminiPromptCacheProvider(PromptCacheProvider):
+    """
+     Gemini cachedContents（genai.caching 是同步接口，放到线程中执行；依赖已执行的 genai.configure）
+    """
+
+    def __init__(self):
+        # 缓存名称 -> CachedContent，刷新与删除时不必再按名称获取一次
+        self._cached_contents: Dict[str, genai.caching.CachedContent] = {}
+
+    async def create(self, model_name: str, system_prompt: str, ttl_seconds: int, display_name: str) -> CachedPrompt:
+        cached_content = await asyncio.to_thread(
+            genai.caching.CachedContent.create,
+            model=model_name,
+            display_name=display_name,
+            system_instruction=system_prompt,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        self._cached_contents[cached_content.name] = cached_content
+        return CachedPrompt(
+            name=cached_content.name,
+            model_name=cached_content.model,
+            prompt_sha256=_prompt_sha256(system_prompt),
+            expires_at=cached_content.expire_time.timestamp(),
+        )
+
+    async def refresh(self, cached_prompt: CachedPrompt, ttl_seconds: int) -> CachedPrompt:
+        cached_content = self._cached_contents.get(cached_prompt.name)
+        if cached_content is None:
+            cached_content = await asyncio.to_thread(genai.caching.CachedContent.get, cached_prompt.name)
+            self._cached_contents[cached_prompt.name] = cached_content
+        await asyncio.to_thread(cached_content.update, ttl=datetime.timedelta(seconds=ttl_seconds))
+        return CachedPrompt(
+            name=cached_prompt.name,
+            model_name=cached_prompt.model_name,
+            prompt_sha256=cached_prompt.prompt_sha256,
+            expires_at=cached_content.expire_time.timestamp(),
+        )
+
+    async def delete(self, cached_prompt: CachedPrompt) -> None:
+        cached_content = self._cached_contents.pop(cached_prompt.name, None)
+        try:
+            if cached_content is None:
+                cached_content = await asyncio.to_thread(genai.caching.CachedContent.get, cached_prompt.name)
+            await asyncio.to_thread(cached_content.delete)
+        except (google_exceptions.NotFound, google_exceptions.PermissionDenied):
+            pass
+
+class PromptCacheManager:
+    """
+     管理各模块系统提示的缓存（创建、到期前刷新、失败回退），绑定在创建它的事件循环上
+
+     @param provider 缓存内容提供方
+     @param ttl_seconds 缓存有效期（秒）
+     @param refresh_margin_seconds 剩余有效期低于该秒数时在后台刷新
+     @param retry_seconds 创建或刷新失败后，该模块内联发送提示多久再重试
+    """
+
+    def __init__(self, provider: PromptCacheProvider, ttl_seconds: int = 3600,
+                 refresh_margin_seconds: int = 300, retry_seconds: int = 1800):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        # 刷新窗口至少要比使用保护期长，否则缓存会在刷新前就停止使用
+        self.refresh_margin_seconds = max(refresh_margin_seconds, CACHE_EXPIRY_GUARD_SECONDS + 1)
+        self.retry_seconds = retry_seconds
+        self._cached_prompts: Dict[str, CachedPrompt] = {}
+        self._retry_after: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._deleting: Set[asyncio.Task] = set()
+        self._closed = False
+
+    def cached_prompt(self, module: str, model_name: str, system_prompt: str) -> Optional[CachedPrompt]:
+        """
+         获取模块可用的缓存（不等待网络；需要时在后台创建或刷新）
+
+         @param module 模块名称
+         @param model_name 当前使用的模型名称
+         @param system_prompt 模块当前的系统提示
+         @return 可用的缓存；没有可用缓存时返回 None（调用方内联发送提示）
+        """
+        if self._closed:
+            return None
+        now = time.time()
+        cached_prompt = self._cached_prompts.get(module)
+        if cached_prompt is not None and cached_prompt.prompt_sha256 != _prompt_sha256(system_prompt):
+            # 提示已修改（新版本），旧缓存作废
+            self.invalidate(module)
+            cached_prompt = None
+        if cached_prompt is not None and cached_prompt.expires_at - now <= CACHE_EXPIRY_GUARD_SECONDS:
+            self._cached_prompts.pop(module, None)
+            cached_prompt = None
+
+        if module not in self._pending and now >= self._retry_after.get(module, 0):
+            if cached_prompt is None:
+                self._start(module, self._create(module, model_name, system_prompt))
+            elif cached_prompt.expires_at - now <= self.refresh_margin_seconds:
+                self._start(module, self._refresh(module, cached_prompt))
+        return cached_prompt
+
+    def invalidate(self, module: str) -> None:
+        """
+         作废模块的缓存（提供方报告缓存不存在或提示已变化时调用），下次调用时重新创建
+
+         @param module 模块名称
+        """
+        cached_prompt = self._cached_prompts.pop(module, None)
+        if cached_prompt is not None and not self._closed:
+            task = asyncio.get_running_loop().create_task(self._delete_quietly(cached_prompt))
+            self._deleting.add(task)
+            task.add_done_callback(self._deleting.discard)
+
+    async def close(self) -> None:
+        """取消进行中的创建/刷新并删除已创建的缓存（停止提供方的存储计费）"""
+        self._closed = True
+        pending = list(self._pending.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, *self._deleting, return_exceptions=True)
+        cached_prompts = list(self._cached_prompts.values())
+        self._cached_prompts.clear()
+        await asyncio.gather(*(self._delete_quietly(cached_prompt) for cached_prompt in cached_prompts))
+
+    def _start(self, module: str, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._pending[module] = task
+        task.add_done_callback(lambda _task: self._pending.pop(module, None))
+
+    async def _create(self, module: str, model_name: str, system_prompt: str) -> None:
+        try:
+            cached_prompt = await self.provider.create(model_name, system_prompt, self.ttl_seconds, f"system-prompt-{module}")
+        except Exception as e:
+            self._retry_after[module] = time.time() + self.retry_seconds
+            print(f"模块 {module} 的系统提示缓存创建失败，{self.retry_seconds} 秒内内联发送提示：{type(e).__name__}: {e}")
+            return
+        self._cached_prompts[module] = cached_prompt
+        print(f"已创建模块 {module} 的系统提示缓存 {cached_prompt.name}（有效期 {self.ttl_seconds} 秒）。")
+
+    async def _refresh(self, module: str, cached_prompt: CachedPrompt) -> None:
+        try:
+            refreshed = await self.provider.refresh(cached_prompt, self.ttl_seconds)
+        except Exception as e:
+            # 刷新失败时旧缓存仍可用到过期，之后下一次调用重新创建
+            self._retry_after[module] = min(time.time() + self.retry_seconds, cached_prompt.expires_at)
+            print(f"模块 {module} 的系统提示缓存 {cached_prompt.name} 刷新失败：{type(e).__name__}: {e}")
+            return
+        if self._cached_prompts.get(module) is cached_prompt:
+            self._cached_prompts[module] = refreshed
+
+    async def _delete_quietly(self, cached_prompt: CachedPrompt) -> None:
+        try:
+            await self.provider.delete(cached_prompt)
+        except Exception as e:
+            print(f"删除系统提示缓存 {cached_prompt.name} 失败：{type(e).__name__}: {e}")
@@ -0,0 +1,223 @@
+"""
+ 资源调度模块
+
+ 集中管理跨会话共享的外部资源：Gemini API、讯飞ASR任务、yt-dlp下载进程和ffmpeg转码进程。
+ 每种资源由一个并发信号量和若干令牌桶（如Gemini的RPM/TPM）组成，
+ 管道各阶段通过 `async with governor.acquire(...)` 获取槽位，并记录排队等待时间供监控使用
+（同时计入当前管道步骤的 session_stage_metrics 记录）。
+"""
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import Settings, get_settings
+from app.services.stage_metrics import record_queue_wait
+
+# 资源名称
+GEMINI = "gemini"
+XUNFEI = "xunfei"
+YT_DLP = "yt_dlp"
+FFMPEG = "ffmpeg"
+
+class TokenBucket:
+    """
+     令牌桶限速器
+
+     @param name 令牌桶名称（如 "rpm"、"tpm"）
+     @param capacity 桶容量，即每分钟允许的令牌数
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_per_second = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    async def take(self, amount: float) -> None:
+        """
+         取出令牌，不足时等待补充
+
+         @param amount 需要的令牌数（超过桶容量时按桶容量计，避免永久等待）
+        """
+        amount = min(float(amount), self.capacity)
+        # 持锁等待保证先到先得，后来者不会插队饿死大请求
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.refill_per_second)
+
+class ResourceLimiter:
+    """
+     单个资源的限制器：并发信号量 + 可选令牌桶，并统计排队等待指标
+
+     @param name 资源名称
+     @param max_concurrency 最大并发数（小于等于0表示不限制）
+     @param buckets 令牌桶列表，按 TokenBucket.name 区分
+    """
+
+    def __init__(self, name: str, max_concurrency: int, buckets: Optional[List[TokenBucket]] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._buckets: Dict[str, TokenBucket] = {bucket.name: bucket for bucket in (buckets or [])}
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def acquire(self, **bucket_amounts: float) -> AsyncIterator[float]:
+        """
+         获取一个槽位，退出上下文时释放
+
+         @param bucket_amounts 各令牌桶需要的令牌数，例如 rpm=1, tpm=1200；未指定的桶不消耗
+         @return 本次排队等待的秒数
+        """
+        started_at = time.monotonic()
+        self.waiting += 1
+        try:
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+            try:
+                for bucket_name, amount in bucket_amounts.items():
+                    bucket = self._buckets.get(bucket_name)
+                    if bucket is not None and amount > 0:
+                        await bucket.take(amount)
+            except BaseException:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        wait_seconds = time.monotonic() - started_at
+        self._record_wait(wait_seconds)
+        self.in_use += 1
+        try:
+            yield wait_seconds
+        finally:
+            self.in_use -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def _record_wait(self, wait_seconds: float) -> None:
+        self.acquired_count += 1
+        self.total_wait_seconds += wait_seconds
+        self.last_wait_seconds = wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        if wait_seconds >= 5.0:
+            print(f"资源调度: {self.name} 排队等待 {wait_seconds:.2f} 秒后获得槽位。")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+         导出当前指标
+
+         @return 指标字典
+        """
+        return {
+            "maxConcurrency": self.max_concurrency if self.max_concurrency > 0 else None,
+            "inUse": self.in_use,
+            "waiting": self.waiting,
+            "acquiredCount": self.acquired_count,
+            "totalQueueWaitSeconds": round(self.total_wait_seconds, 3),
+            "avgQueueWaitSeconds": round(self.total_wait_seconds / self.acquired_count, 3) if self.acquired_count else 0.0,
+            "maxQueueWaitSeconds": round(self.max_wait_seconds, 3),
+            "lastQueueWaitSeconds": round(self.last_wait_seconds, 3),
+            "rateLimitsPerMinute": {name: int(bucket.capacity) for name, bucket in self._buckets.items()},
+        }
+
+class ResourceGovernor:
+    """
+     进程内资源调度器
+
+     asyncio 原语绑定到事件循环，调度器在首次使用时按当前事件循环创建限制器，
+     事件循环变化（如脚本多次调用 asyncio.run）时自动重建。
+
+     @param settings 配置设置
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._limiters: Dict[str, ResourceLimiter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _build_limiters(self) -> Dict[str, ResourceLimiter]:
+        settings = self.settings
+        gemini_buckets = []
+        if settings.GEMINI_RPM_LIMIT > 0:
+            gemini_buckets.append(TokenBucket("rpm", settings.GEMINI_RPM_LIMIT))
+        if settings.GEMINI_TPM_LIMIT > 0:
+            gemini_buckets.append(TokenBucket("tpm", settings.GEMINI_TPM_LIMIT))
+        return {
+            GEMINI: ResourceLimiter(GEMINI, settings.GEMINI_MAX_CONCURRENCY, gemini_buckets),
+            XUNFEI: ResourceLimiter(XUNFEI, settings.XUNFEI_MAX_CONCURRENT_TASKS),
+            YT_DLP: ResourceLimiter(YT_DLP, settings.YT_DLP_MAX_CONCURRENCY),
+            FFMPEG: ResourceLimiter(FFMPEG, settings.FFMPEG_MAX_CONCURRENCY),
+        }
+
+    def _ensure_limiters(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._limiters = self._build_limiters()
+            self._loop = loop
+
+    def _get_limiter(self, resource: str) -> ResourceLimiter:
+        self._ensure_limiters()
+        limiter = self._limiters.get(resource)
+        if limiter is None:
+            raise ValueError(f"Unknown resource '{resource}'.")
+        return limiter
+
+    @asynccontextmanager
+    async def acquire(self, resource: str, tokens: int = 0) -> AsyncIterator[float]:
+        """
+         获取资源槽位
+
+         @param resource 资源名称（GEMINI / XUNFEI / YT_DLP / FFMPEG）
+         @param tokens 预估消耗的LLM令牌数，仅对Gemini的TPM令牌桶生效
+         @return 本次排队等待的秒数
+        """
+        limiter = self._get_limiter(resource)
+        bucket_amounts = {"rpm": 1, "tpm": tokens} if resource == GEMINI else {}
+        async with limiter.acquire(**bucket_amounts) as wait_seconds:
+            record_queue_wait(wait_seconds)
+            yield wait_seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+         导出所有资源的排队与占用指标（需在事件循环中调用）
+
+         @return 资源名称 -> 指标字典
+        """
+        self._ensure_limiters()
+        return {name: limiter.snapshot() for name, limiter in self._limiters.items()}
+
+@functools.lru_cache()
+def get_resource_governor() -> ResourceGovernor:
+    return ResourceGovernor(get_settings())
+
+def estimate_llm_tokens(*texts: str) -> int:
+    """
+     粗略估算LLM请求的令牌数，用于TPM限速
+
+     中文约每字一个令牌、英文约每4个字符一个令牌，这里统一按每2个字符一个令牌估算。
+
+     @param texts 请求中的文本片段（系统提示、用户消息等）
+     @return 预估令牌数
+    """
+    total_chars = sum(len(text) for text in texts if text)
+    return max(1, total_chars // 2)
@@ -0,0 +1,88 @@
+"""
+ 会话进度上报模块
+
+ 长时间运行的管道步骤（yt-dlp 下载、ffmpeg 音频提取）把子进程输出解析出的完成百分比
+ 通过 SessionProgressReporter 写入 session_progress 表。子进程每秒可能输出多行进度，
+ 上报按 PROGRESS_UPDATE_INTERVAL_SECONDS 节流，步骤开始（0%）和完成（100%）总是写入。
+ 回调在事件循环中被同步调用，写库交给后台协程通过 asyncio.to_thread 执行，只写入最新的百分比，
+ 不阻塞事件循环。
+"""
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.database import SessionLocal
+from app.core.enums import MetricStage
+
+class SessionProgressReporter:
+    """
+     单个管道步骤的进度上报器，可直接作为 progress_parsers.ProgressCallback 使用；
+ 以 async with 包住步骤，进入时写入0%，退出时等待剩余的进度写入完成
+
+     @param session_id 会话ID
+     @param stage 管道步骤
+     @param min_interval_seconds 两次写库的最小间隔（秒）
+    """
+
+    def __init__(self, session_id: str, stage: MetricStage, min_interval_seconds: float = 2.0):
+        self.session_id = session_id
+        self.stage = stage
+        self.min_interval_seconds = min_interval_seconds
+        self._last_written_at: Optional[float] = None
+        self._last_percent: Optional[float] = None
+        self._pending_percent: Optional[float] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "SessionProgressReporter":
+        """
+         把进度重置为当前步骤的0%
+
+         @return 上报器本身
+        """
+        self._write(0.0)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        """
+         等待尚未写入的进度落库，避免与下一个步骤的进度写入交错
+        """
+        if self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+
+    def __call__(self, percent: float) -> None:
+        percent = round(max(0.0, min(100.0, percent)), 1)
+        if percent == self._last_percent:
+            return
+        now = time.monotonic()
+        if (
+            percent < 100.0
+            and self._last_written_at is not None
+            and now - self._last_written_at < self.min_interval_seconds
+        ):
+            return
+        self._write(percent)
+
+    def _write(self, percent: float) -> None:
+        self._last_written_at = time.monotonic()
+        self._last_percent = percent
+        self._pending_percent = percent
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        while self._pending_percent is not None:
+            percent, self._pending_percent = self._pending_percent, None
+            await asyncio.to_thread(self._save, percent)
+
+    def _save(self, percent: float) -> None:
+        db_local: Session = SessionLocal()
+        try:
+            crud.upsert_session_progress(db_local, self.session_id, self.stage, percent)
+        except Exception as e:
+            db_local.rollback()
+            print(f"错误: 会话 {self.session_id}: 保存步骤 {self.stage.value} 进度失败: {e}")
+        finally:
+            db_local.close()
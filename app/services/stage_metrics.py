@@ -0,0 +1,153 @@
+"""
+ 阶段耗时记录模块
+
+ 管道用 `async with record_stage(session_id, MetricStage.X) as stage_metric:` 包裹每个步骤，
+ 退出时在工作线程中把开始/结束时间、耗时、字节数、片段数与LLM令牌用量写入 session_stage_metrics 表。
+ 资源调度器的排队等待时间和LLM调用的令牌用量通过上下文变量自动归入当前步骤。
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.database import SessionLocal
+from app.core.enums import MetricStage, StageOutcome
+
+class StageMetric:
+    """
+     单个管道步骤的度量数据，由调用方在步骤内部按需填写
+
+     @param session_id 会话ID
+     @param stage 管道步骤
+    """
+
+    def __init__(self, session_id: str, stage: MetricStage):
+        self.session_id = session_id
+        self.stage = stage
+        self.started_at = datetime.now()
+        self.started_monotonic = time.monotonic()
+        self.queue_wait_seconds = 0.0
+        self.bytes_in: Optional[int] = None
+        self.bytes_out: Optional[int] = None
+        self.segment_count: Optional[int] = None
+        self.prompt_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+
+_current_stage_metric: ContextVar[Optional[StageMetric]] = ContextVar("current_stage_metric", default=None)
+
+@asynccontextmanager
+async def record_stage(session_id: str, stage: MetricStage) -> AsyncIterator[StageMetric]:
+    """
+     计时一个管道步骤并在结束时通过 asyncio.to_thread 写入数据库，不阻塞事件循环（写入失败只记录日志）
+
+     @param session_id 会话ID
+     @param stage 管道步骤
+     @return 可供填写字节数/片段数等的度量对象
+    """
+    stage_metric = StageMetric(session_id, stage)
+    context_token = _current_stage_metric.set(stage_metric)
+    outcome = StageOutcome.SUCCEEDED
+    try:
+        yield stage_metric
+    except asyncio.CancelledError:
+        outcome = StageOutcome.CANCELLED
+        raise
+    except BaseException:
+        outcome = StageOutcome.FAILED
+        raise
+    finally:
+        _current_stage_metric.reset(context_token)
+        duration_ms = int((time.monotonic() - stage_metric.started_monotonic) * 1000)
+        await asyncio.to_thread(_save_stage_metric, stage_metric, outcome, datetime.now(), duration_ms)
+
+def _save_stage_metric(stage_metric: StageMetric, outcome: StageOutcome, finished_at: datetime, duration_ms: int) -> None:
+    db_local: Session = SessionLocal()
+    try:
+        crud.create_stage_metric(
+            db_local,
+            session_id=stage_metric.session_id,
+            stage=stage_metric.stage,
+            outcome=outcome,
+            started_at=stage_metric.started_at,
+            finished_at=finished_at,
+            duration_ms=duration_ms,
+            queue_wait_ms=int(stage_metric.queue_wait_seconds * 1000),
+            bytes_in=stage_metric.bytes_in,
+            bytes_out=stage_metric.bytes_out,
+            segment_count=stage_metric.segment_count,
+            prompt_tokens=stage_metric.prompt_tokens,
+            output_tokens=stage_metric.output_tokens
+        )
+        print(f"会话 {stage_metric.session_id}: 步骤 {stage_metric.stage.value} 耗时 {duration_ms} 毫秒 ({outcome.value})。")
+    except Exception as e:
+        db_local.rollback()
+        print(f"错误: 会话 {stage_metric.session_id}: 保存步骤 {stage_metric.stage.value} 耗时记录失败: {e}")
+    finally:
+        db_local.close()
+
+def record_queue_wait(wait_seconds: float) -> None:
+    """
+     把资源槽位的排队等待时间计入当前步骤（不在步骤内时忽略）
+
+     @param wait_seconds 排队等待秒数
+    """
+    stage_metric = _current_stage_metric.get()
+    if stage_metric is not None:
+        stage_metric.queue_wait_seconds += wait_seconds
+
+def record_llm_usage(response: Any) -> None:
+    """
+     把Gemini响应中的令牌用量计入当前步骤（不在步骤内或响应没有用量信息时忽略）
+
+     @param response generate_content 返回的响应对象
+    """
+    stage_metric = _current_stage_metric.get()
+    usage = getattr(response, "usage_metadata", None)
+    if stage_metric is None or usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens is not None:
+        stage_metric.prompt_tokens = (stage_metric.prompt_tokens or 0) + prompt_tokens
+    if output_tokens is not None:
+        stage_metric.output_tokens = (stage_metric.output_tokens or 0) + output_tokens
+
+def _percentile(sorted_values: List[int], percent: float) -> int:
+    # 最近秩法
+    rank = max(1, int(-(-percent * len(sorted_values) // 100)))
+    return sorted_values[rank - 1]
+
+def summarize_stage_durations(rows: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """
+     按步骤汇总耗时分位数
+
+     @param rows (阶段, 耗时毫秒, 排队等待毫秒) 列表
+     @return 阶段 -> {count, p50Ms, p95Ms, p99Ms, maxMs, p50QueueWaitMs, p95QueueWaitMs}
+    """
+    durations: Dict[str, List[int]] = {}
+    queue_waits: Dict[str, List[int]] = {}
+    for stage, duration_ms, queue_wait_ms in rows:
+        durations.setdefault(stage, []).append(duration_ms)
+        queue_waits.setdefault(stage, []).append(queue_wait_ms or 0)
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    for stage in [s.value for s in MetricStage]:
+        if stage not in durations:
+            continue
+        stage_durations = sorted(durations[stage])
+        stage_waits = sorted(queue_waits[stage])
+        summary[stage] = {
+            "count": len(stage_durations),
+            "p50Ms": _percentile(stage_durations, 50),
+            "p95Ms": _percentile(stage_durations, 95),
+            "p99Ms": _percentile(stage_durations, 99),
+            "maxMs": stage_durations[-1],
+            "p50QueueWaitMs": _percentile(stage_waits, 50),
+            "p95QueueWaitMs": _percentile(stage_waits, 95),
+        }
+    return summary
@@ -8,6 +8,10 @@ import logging
 import math
 import json
 import asyncio
+import threading
+import io
+import mmap
+import uuid
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
 
@@ -23,12 +27,102 @@ BYTES_PER_MB = 1024 * 1024
 DEFAULT_REQUEST_TIMEOUT = 60
 PROGRESS_POLL_INTERVAL = 30
 MAX_PROGRESS_POLLS = 120
+# Poll sizing when the audio duration is known: roughly 120 polls per audio length, bounded
+# to [MIN_PROGRESS_POLL_INTERVAL, PROGRESS_POLL_INTERVAL], and a total wait of at least
+# PROGRESS_POLL_INTERVAL * MAX_PROGRESS_POLLS or twice the audio length, whichever is longer.
+MIN_PROGRESS_POLL_INTERVAL = 5
+
+# Audio containers accepted by LFASR. The service detects the format from the file_name
+# extension sent to /prepare, so the extension must match the actual encoding.
+SUPPORTED_AUDIO_EXTENSIONS = {'.wav', '.flac', '.opus', '.m4a', '.mp3'}
 
 # Define known status codes for clarity in _poll_progress
 KNOWN_IN_PROGRESS_STATUSES = {0, 1, 2, 3, 4, 5}
 KNOWN_FAILURE_STATUSES = {-1, 6, 7, 8}
 SUCCESS_STATUS = 9
 
+def map_audio_file(audio_file_path: str) -> mmap.mmap:
+    """
+    Maps the audio file read-only. Slices are then served as memoryviews of the mapping,
+    backed by the page cache instead of per-slice bytes buffers. The mapping stays valid
+    after the file descriptor is closed; the caller closes it.
+    """
+    with open(audio_file_path, 'rb') as audio_file:
+        return mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+class BufferChainReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a sequence of buffers (e.g. multipart framing around a
+    memoryview slice of a mapped audio file). Each read copies at most the requested chunk
+    straight out of the buffers, so an HTTP client streaming a request body from it never
+    holds more than one chunk of the payload. Close it to release the underlying views.
+    """
+
+    def __init__(self, *buffers):
+        self._views = [memoryview(buffer).cast('B') for buffer in buffers]
+        self._size = sum(len(view) for view in self._views)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer).cast('B') as target:
+            written = 0
+            view_start = 0
+            for view in self._views:
+                view_end = view_start + len(view)
+                if written < len(target) and view_start <= self._position < view_end:
+                    count = min(len(target) - written, view_end - self._position)
+                    target[written:written + count] = view[self._position - view_start:self._position - view_start + count]
+                    written += count
+                    self._position += count
+                view_start = view_end
+            return written
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._size = 0
+        super().close()
+
+def generate_lfasr_signa(appid: str, secret_key: str, ts: str) -> str:
+    """
+    Generates the LFASR API signature: base64(HmacSHA1(secret_key, md5(appid + ts))).
+
+    Args:
+        appid (str): The application ID from iFlytek open platform.
+        secret_key (str): The secret key associated with the application.
+        ts (str): The current timestamp string.
+
+    Returns:
+        str: The base64 encoded signature string.
+    """
+    md5_val = hashlib.md5((appid + ts).encode('utf-8')).hexdigest()
+    signature_bytes = hmac.new(secret_key.encode('utf-8'), md5_val.encode('utf-8'), hashlib.sha1).digest()
+    return base64.b64encode(signature_bytes).decode('utf-8')
+
 class XunfeiLfasrClient(AbstractAsrService):
     """
     A client for interacting with the iFlytek Long Form ASR (LFASR) API
@@ -96,24 +190,19 @@ class XunfeiLfasrClient(AbstractAsrService):
         Returns:
             str: The base64 encoded signature string.
         """
-        base_string = self.appid + ts
-        md5_hasher = hashlib.md5()
-        md5_hasher.update(base_string.encode('utf-8'))
-        md5_val = md5_hasher.hexdigest()
-
-        hmac_sha1 = hmac.new(self.secret_key.encode('utf-8'), md5_val.encode('utf-8'), hashlib.sha1)
-        signature_bytes = hmac_sha1.digest()
-        
-        signa = base64.b64encode(signature_bytes).decode('utf-8')
-        return signa
+        return generate_lfasr_signa(self.appid, self.secret_key, ts)
 
     def _perform_synchronous_transcription(self, audio_file_path: str, language: str = "cn", 
                    has_participle: bool = False, speaker_number: int = 0, 
                    slice_size_mb: int = DEFAULT_SLICE_SIZE_MB, 
+                   cancel_event: Optional[threading.Event] = None,
+                   audio_duration_seconds: Optional[float] = None,
                    **other_prepare_params) -> Optional[List[Dict[str, Any]]]:
         """
         Synchronously transcribes the given audio file using the iFlytek LFASR service.
         This is the original implementation of the transcription logic.
+        If cancel_event is set, uploading/polling stops at the next check and None is returned.
+        A known audio_duration_seconds sizes the progress poll interval and limit (see _poll_schedule).
         """
         logger.info(f"Starting transcription process for: {audio_file_path}")
         if not os.path.exists(audio_file_path):
@@ -128,12 +217,18 @@ class XunfeiLfasrClient(AbstractAsrService):
                 logger.error(f"Audio file is empty: {audio_file_path}")
                 return None
 
+            audio_extension = os.path.splitext(file_name)[1].lower()
+            if audio_extension not in SUPPORTED_AUDIO_EXTENSIONS:
+                logger.error(f"Unsupported audio format '{audio_extension}' for LFASR: {audio_file_path}. "
+                             f"Supported: {', '.join(sorted(SUPPORTED_AUDIO_EXTENSIONS))}")
+                return None
+
             slice_data_size = slice_size_mb * BYTES_PER_MB
             slice_num = math.ceil(file_len / slice_data_size)
             if slice_num == 0 and file_len > 0:
                 slice_num = 1
             
-            logger.info(f"File: {file_name}, Size: {file_len} bytes, Slices: {slice_num} (slice_size_mb: {slice_size_mb})")
+            logger.info(f"File: {file_name}, Format: {audio_extension}, Size: {file_len} bytes, Slices: {slice_num} (slice_size_mb: {slice_size_mb})")
 
             task_id = self._call_prepare(
                 file_len=file_len,
@@ -154,7 +249,8 @@ class XunfeiLfasrClient(AbstractAsrService):
                 task_id=task_id,
                 file_len=file_len,
                 slice_num=int(slice_num),
-                slice_data_size=slice_data_size
+                slice_data_size=slice_data_size,
+                cancel_event=cancel_event
             )
             if not upload_success:
                 logger.error(f"Upload slices failed for task_id: {task_id}. Aborting transcription.")
@@ -167,7 +263,14 @@ class XunfeiLfasrClient(AbstractAsrService):
                 return None
             logger.info(f"Merge call successful for task_id: {task_id}.")
 
-            progress_complete = self._poll_progress(task_id=task_id)
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info(f"Transcription cancelled before merge for task_id: {task_id}.")
+                return None
+
+            poll_interval, max_polls = self._poll_schedule(audio_duration_seconds)
+            progress_complete = self._poll_progress(
+                task_id=task_id, cancel_event=cancel_event, poll_interval=poll_interval, max_polls=max_polls
+            )
             if not progress_complete:
                 logger.error(f"Polling progress did not complete successfully or timed out for task_id: {task_id}. Aborting.")
                 return None
@@ -185,13 +288,22 @@ class XunfeiLfasrClient(AbstractAsrService):
             logger.exception(f"An unexpected error occurred during the transcription process for {audio_file_path}: {e}")
             return None
 
-    async def transcribe(self, audio_file_path: str) -> Optional[List[Dict[str, Any]]]:
+    async def transcribe(
+        self,
+        audio_file_path: str,
+        cancel_event: Optional[threading.Event] = None,
+        audio_duration_seconds: Optional[float] = None,
+        session_id: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
         """
         Asynchronously transcribes the audio file using Xunfei Lfasr service.
         This method implements the AbstractAsrService interface.
 
         Args:
             audio_file_path: The path to the audio file to be transcribed.
+            cancel_event: Optional event; once set, the worker thread stops uploading/polling.
+            audio_duration_seconds: Optional audio length used to size progress polling.
+            session_id: Accepted for interface compatibility; not used by this client.
 
         Returns:
             A list of segment dictionaries if transcription is successful,
@@ -203,7 +315,9 @@ class XunfeiLfasrClient(AbstractAsrService):
             # to avoid blocking the asyncio event loop
             result = await asyncio.to_thread(
                 self._perform_synchronous_transcription,
-                audio_file_path
+                audio_file_path,
+                cancel_event=cancel_event,
+                audio_duration_seconds=audio_duration_seconds
             )
             return result
         except Exception as e:
@@ -261,6 +375,8 @@ class XunfeiLfasrClient(AbstractAsrService):
                       **other_params) -> str | None:
         """
         Calls the /prepare API endpoint.
+        file_name must carry the extension of the uploaded encoding (e.g. .wav, .mp3, .opus);
+        LFASR uses it to decode the merged slices.
         Returns task_id on success, None otherwise.
         """
         endpoint = "/prepare"
@@ -316,7 +432,8 @@ class XunfeiLfasrClient(AbstractAsrService):
             return None
     
     def _upload_slices(self, audio_file_path: str, task_id: str, 
-                       file_len: int, slice_num: int, slice_data_size: int) -> bool:
+                       file_len: int, slice_num: int, slice_data_size: int,
+                       cancel_event: Optional[threading.Event] = None) -> bool:
         """
         Uploads audio file in slices to the /upload endpoint.
         Returns True on success, False otherwise.
@@ -328,24 +445,35 @@ class XunfeiLfasrClient(AbstractAsrService):
         logger.info(f"Starting to upload {slice_num} slices for task_id: {task_id} from file: {audio_file_path}")
 
         try:
-            with open(audio_file_path, 'rb') as audio_file:
+            mapped_file = map_audio_file(audio_file_path)
+        except FileNotFoundError:
+            logger.error(f"Audio file not found during slice upload: {audio_file_path}")
+            return False
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not map audio file {audio_file_path} for task_id {task_id}: {e}")
+            return False
+
+        try:
+            with mapped_file:
+                if len(mapped_file) < file_len:
+                    logger.error(f"Audio file {audio_file_path} is shorter than expected for task_id: {task_id}. "
+                                 f"Mapped: {len(mapped_file)} bytes, File_len: {file_len}")
+                    return False
                 for i in range(slice_num):
+                    if cancel_event is not None and cancel_event.is_set():
+                        logger.info(f"Slice upload cancelled for task_id: {task_id} after {i}/{slice_num} slices.")
+                        return False
                     slice_id = slice_id_gen.get_next_id()
                     
-                    # Determine the actual size of data to read for this slice
+                    # Determine the actual size of data to send for this slice
                     # This is important for the last slice which might be smaller
-                    current_slice_max_size = min(slice_data_size, file_len - bytes_uploaded)
-                    slice_data = audio_file.read(current_slice_max_size)
+                    slice_size = min(slice_data_size, file_len - bytes_uploaded)
 
-                    if not slice_data:
-                        if bytes_uploaded < file_len:
-                            logger.error(f"Read empty slice prematurely for task_id: {task_id}, slice_id: {slice_id}. "
-                                         f"Expected more data. Bytes uploaded: {bytes_uploaded}, File_len: {file_len}")
-                            return False
-                        else: # All data read, loop should have ended or slice_num was miscalculated
-                            logger.warning(f"Read empty slice but all data seems uploaded for task_id: {task_id}. "
-                                           f"Iteration {i+1}/{slice_num}. This might indicate slice_num mismatch if not the last slice.")
-                            break # Exit loop if no more data
+                    if slice_size <= 0:
+                        # All data uploaded, loop should have ended or slice_num was miscalculated
+                        logger.warning(f"No data left to upload for task_id: {task_id}. "
+                                       f"Iteration {i+1}/{slice_num}. This might indicate slice_num mismatch if not the last slice.")
+                        break # Exit loop if no more data
 
                     ts = self._generate_ts()
                     signa = self._generate_signa(ts)
@@ -358,15 +486,22 @@ class XunfeiLfasrClient(AbstractAsrService):
                         "slice_id": slice_id
                     }
 
-                    files_payload = {'content': (slice_id, slice_data, 'application/octet-stream')}
+                    # The multipart body is streamed from the mapping: requests would otherwise
+                    # read a `files` payload fully into memory and copy it into the encoded body.
+                    boundary = uuid.uuid4().hex
+                    body_head = (f'--{boundary}\r\nContent-Disposition: form-data; name="content"; filename="{slice_id}"\r\n'
+                                 f'Content-Type: application/octet-stream\r\n\r\n').encode()
+                    body_tail = f'\r\n--{boundary}--\r\n'.encode()
                     
-                    logger.info(f"Uploading slice {i+1}/{slice_num} (ID: {slice_id}, Size: {len(slice_data)} bytes) for task_id: {task_id}")
+                    logger.info(f"Uploading slice {i+1}/{slice_num} (ID: {slice_id}, Size: {slice_size} bytes) for task_id: {task_id}")
 
                     # _make_request's `params` argument handles URL query parameters
-                    # `files` handles the multipart file upload
-                    # `data_payload` should be None here for a pure file upload with query params.
-                    response = self._make_request(method="POST", endpoint=endpoint, 
-                                                  params=query_params, files=files_payload)
+                    # `data_payload` is the streamed multipart body.
+                    slice_view = memoryview(mapped_file)[bytes_uploaded:bytes_uploaded + slice_size]
+                    with BufferChainReader(body_head, slice_view, body_tail) as body:
+                        slice_view.release()
+                        response = self._make_request(method="POST", endpoint=endpoint, params=query_params, data_payload=body,
+                                                      custom_headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
 
                     if response is None:
                         logger.error(f"Upload failed for task_id: {task_id}, slice_id: {slice_id} (network/request error).")
@@ -378,7 +513,7 @@ class XunfeiLfasrClient(AbstractAsrService):
                             logger.debug(f"/upload response for slice {slice_id}: {response_json}")
                             if response_json.get("ok") == 0 and response_json.get("err_no") == 0:
                                 logger.info(f"Successfully uploaded slice {slice_id} for task_id: {task_id}")
-                                bytes_uploaded += len(slice_data)
+                                bytes_uploaded += slice_size
                             else:
                                 err_no = response_json.get("err_no")
                                 failed_msg = response_json.get("failed")
@@ -466,26 +601,49 @@ class XunfeiLfasrClient(AbstractAsrService):
             logger.error(f"/merge request for task_id {task_id} failed with status code {response.status_code}. Response: {response.text}")
             return False
 
-    def _poll_progress(self, task_id: str) -> bool:
+    @staticmethod
+    def _poll_schedule(audio_duration_seconds: Optional[float]) -> tuple[int, int]:
+        """
+        Returns (poll interval seconds, max polls) for an audio of the given duration.
+        Short audio is polled more often; long audio gets a proportionally longer overall limit.
+        Without a duration the fixed PROGRESS_POLL_INTERVAL / MAX_PROGRESS_POLLS are used.
+        """
+        if not audio_duration_seconds or audio_duration_seconds <= 0:
+            return PROGRESS_POLL_INTERVAL, MAX_PROGRESS_POLLS
+        poll_interval = int(min(PROGRESS_POLL_INTERVAL, max(MIN_PROGRESS_POLL_INTERVAL, audio_duration_seconds / 120)))
+        max_wait_seconds = max(PROGRESS_POLL_INTERVAL * MAX_PROGRESS_POLLS, 2 * audio_duration_seconds)
+        return poll_interval, math.ceil(max_wait_seconds / poll_interval)
+
+    def _poll_progress(self, task_id: str, cancel_event: Optional[threading.Event] = None,
+                       poll_interval: int = PROGRESS_POLL_INTERVAL, max_polls: int = MAX_PROGRESS_POLLS) -> bool:
         """
         Polls the /getProgress API endpoint until the task is complete or fails.
-        Uses constants PROGRESS_POLL_INTERVAL and MAX_PROGRESS_POLLS.
+        Waits poll_interval seconds between at most max_polls polls
+        (defaults: PROGRESS_POLL_INTERVAL and MAX_PROGRESS_POLLS).
 
         Args:
             task_id (str): The task ID to poll.
+            cancel_event (threading.Event, optional): Interrupts the wait between polls when set.
+            poll_interval (int): Seconds between polls.
+            max_polls (int): Maximum number of polls before giving up.
 
         Returns:
             bool: True if task completed successfully (status 9), False otherwise.
         """
         endpoint = "/getProgress"
-        logger.info(f"Starting to poll progress for task_id: {task_id} every {PROGRESS_POLL_INTERVAL}s for max {MAX_PROGRESS_POLLS} attempts.")
+        logger.info(f"Starting to poll progress for task_id: {task_id} every {poll_interval}s for max {max_polls} attempts.")
 
-        for attempt in range(MAX_PROGRESS_POLLS):
+        for attempt in range(max_polls):
             if attempt > 0: # No sleep for the first attempt
-                logger.debug(f"Polling attempt {attempt + 1}/{MAX_PROGRESS_POLLS} for task_id {task_id}. Sleeping for {PROGRESS_POLL_INTERVAL}s.")
-                time.sleep(PROGRESS_POLL_INTERVAL)
+                logger.debug(f"Polling attempt {attempt + 1}/{max_polls} for task_id {task_id}. Sleeping for {poll_interval}s.")
+                if cancel_event is not None:
+                    if cancel_event.wait(poll_interval):
+                        logger.info(f"Polling cancelled for task_id {task_id}.")
+                        return False
+                else:
+                    time.sleep(poll_interval)
             else:
-                logger.debug(f"Polling attempt {attempt + 1}/{MAX_PROGRESS_POLLS} for task_id {task_id}.")
+                logger.debug(f"Polling attempt {attempt + 1}/{max_polls} for task_id {task_id}.")
 
             ts = self._generate_ts()
             signa = self._generate_signa(ts)
@@ -526,7 +684,7 @@ class XunfeiLfasrClient(AbstractAsrService):
                     status = inner_data_json.get("status")
                     status_desc = inner_data_json.get("desc", "N/A") # Get description if available
 
-                    logger.info(f"Progress for task_id {task_id}: Status {status} ('{status_desc}'). Attempt {attempt + 1}/{MAX_PROGRESS_POLLS}.")
+                    logger.info(f"Progress for task_id {task_id}: Status {status} ('{status_desc}'). Attempt {attempt + 1}/{max_polls}.")
 
                     # Status Interpretation (iFlytek LFASR Task Status Codes)
                     # 0:任务创建                (Task Created)
@@ -569,7 +727,7 @@ class XunfeiLfasrClient(AbstractAsrService):
                 # Depending on policy, some HTTP errors might be retried. For now, fail fast on non-200 during polling.
                 return False 
 
-        logger.error(f"Polling for task_id {task_id} timed out after {MAX_PROGRESS_POLLS} attempts.")
+        logger.error(f"Polling for task_id {task_id} timed out after {max_polls} attempts.")
         return False
 
     def _call_get_result(self, task_id: str) -> list | None:
@@ -0,0 +1,856 @@
+"""
+Asynchronous iFlytek LFASR client.
+
+Implements the same prepare -> upload -> merge -> getProgress -> getResult flow as
+XunfeiLfasrClient, but every API call is a coroutine on a shared, pooled httpx.AsyncClient
+(keep-alive connections are reused across tasks). No thread is held while a task waits for
+the server, so many in-flight ASR tasks can share one event loop. Slices are uploaded with
+bounded parallelism and per-slice retries; /merge is only called once every slice is acknowledged.
+Merged tasks are handed to the central AsrTaskPoller (app/services/asr/task_poller.py) by default.
+Each phase (prepared/uploaded/merged/polling), the acknowledged slice ids and the result are
+persisted in asr_tasks, so a restarted process resumes a task instead of paying for it twice.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from sqlalchemy.orm import Session
+
+from app.core.enums import AsrTaskStatus
+from app.db import crud
+from app.db.database import SessionLocal
+from app.services.asr.base import AbstractAsrService
+from app.services.asr.poll_schedule import AdaptivePollSchedule, TurnaroundRatioEstimator
+from app.services.asr.task_poller import TransientPollError, get_asr_task_poller
+from app.services.resource_governor import XUNFEI, get_resource_governor
+from app.services.xunfei_asr_service import (
+    BYTES_PER_MB,
+    BufferChainReader,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_SLICE_SIZE_MB,
+    KNOWN_FAILURE_STATUSES,
+    KNOWN_IN_PROGRESS_STATUSES,
+    SUCCESS_STATUS,
+    SUPPORTED_AUDIO_EXTENSIONS,
+    XunfeiLfasrClient,
+    generate_lfasr_signa,
+    map_audio_file,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LFASR_HOST = "https://raasr.xfyun.cn/api/"
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_UPLOAD_PARALLELISM = 4
+DEFAULT_UPLOAD_MAX_RETRIES = 3
+DEFAULT_UPLOAD_RETRY_BASE_DELAY = 1.0
+DEFAULT_POLL_MIN_INTERVAL = 5.0
+DEFAULT_POLL_MAX_INTERVAL = 60.0
+DEFAULT_EXPECTED_TURNAROUND_RATIO = 0.3
+DEFAULT_POLL_MAX_CONSECUTIVE_ERRORS = 5
+# Granularity of cancel_event checks while sleeping between polls
+CANCEL_CHECK_INTERVAL = 1.0
+
+# Background tasks collecting results of tasks reattached after a restart
+_recovery_tasks: Set[asyncio.Task] = set()
+
+@dataclass
+class _SharedTranscription:
+    """A transcription submitted once and awaited by every session that transcribes the same audio."""
+    task: asyncio.Task
+    cancel_event: threading.Event
+    waiters: int = 0
+
+# In-flight transcriptions per event loop, keyed by audio SHA-256 and /prepare parameters
+_inflight_transcriptions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, _SharedTranscription]]" = weakref.WeakKeyDictionary()
+
+# httpx.AsyncClient instances are bound to the event loop that created them, so one pool is kept per loop
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_lfasr_http_client(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+) -> httpx.AsyncClient:
+    """
+    Returns the pooled HTTP client shared by all LFASR calls on the running event loop.
+
+    Args:
+        max_connections: Upper bound of open connections in the pool (used when the pool is created).
+        max_keepalive_connections: Idle keep-alive connections kept in the pool (used when the pool is created).
+
+    Returns:
+        The shared httpx.AsyncClient for the current loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DEFAULT_REQUEST_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections
+            )
+        )
+        _http_clients[loop] = client
+        logger.info(f"Created pooled LFASR HTTP client (max_connections={max_connections}, keepalive={max_keepalive_connections}).")
+    return client
+
+async def close_lfasr_http_client() -> None:
+    """Closes the pooled HTTP client of the running event loop, if any (call on shutdown)."""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+async def _sleep_unless_cancelled(seconds: float, cancel_event: Optional[threading.Event]) -> bool:
+    """
+    Sleeps for the given time, waking early if cancel_event is set.
+
+    Returns:
+        True if cancel_event was set, False otherwise.
+    """
+    deadline = time.monotonic() + seconds
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(remaining, CANCEL_CHECK_INTERVAL) if cancel_event is not None else remaining)
+
+class LfasrTransientError(TransientPollError):
+    """A network error or HTTP 429/5xx response that is worth retrying."""
+
+@functools.lru_cache()
+def get_turnaround_estimator(initial_ratio: float) -> TurnaroundRatioEstimator:
+    """Returns the process-wide LFASR turnaround ratio estimate seeded with initial_ratio."""
+    return TurnaroundRatioEstimator(initial_ratio)
+
+def _forget_shared_transcription(inflight: Dict[Tuple, _SharedTranscription], key: Tuple,
+                                 shared: _SharedTranscription, _task: asyncio.Task) -> None:
+    """Removes a finished shared transcription from the in-flight registry (task done callback)."""
+    if inflight.get(key) is shared:
+        del inflight[key]
+    if not _task.cancelled():
+        # Mark a failure as retrieved even when every waiting session has already given up
+        _task.exception()
+
+def _file_sha256(audio_file_path: str) -> str:
+    """Hashes the audio file (runs in a worker thread)."""
+    hasher = hashlib.sha256()
+    with open(audio_file_path, 'rb') as audio_file:
+        for block in iter(lambda: audio_file.read(BYTES_PER_MB), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _link_or_copy(source_path: str, target_path: str) -> None:
+    """Hard-links the file, copying it where linking is not possible (e.g. across file systems)."""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+def _run_db(operation: Callable[[Session], Any], description: str) -> Any:
+    """
+    Runs a crud operation in its own DB session; failures are logged and return None.
+    Blocking: call it through asyncio.to_thread so the event loop is not held up by the database.
+    """
+    db_local: Session = SessionLocal()
+    try:
+        return operation(db_local)
+    except Exception as e:
+        db_local.rollback()
+        logger.error(f"Failed to {description}: {e}")
+        return None
+    finally:
+        db_local.close()
+
+class XunfeiLfasrAsyncClient(AbstractAsrService):
+    """
+    Coroutine-based client for the iFlytek Long Form ASR (LFASR) API.
+    Based on documentation at: https://www.xfyun.cn/doc/asr/lfasr/API.html
+    The resource governor's Xunfei slot is taken around the provider work itself, so sessions that
+    only wait for a shared in-flight transcription do not hold a slot.
+    """
+
+    manages_provider_slots = True
+
+    def __init__(self, appid: str, secret_key: str, host: str = DEFAULT_LFASR_HOST,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 upload_parallelism: int = DEFAULT_UPLOAD_PARALLELISM,
+                 upload_max_retries: int = DEFAULT_UPLOAD_MAX_RETRIES,
+                 upload_retry_base_delay: float = DEFAULT_UPLOAD_RETRY_BASE_DELAY,
+                 poll_min_interval: float = DEFAULT_POLL_MIN_INTERVAL,
+                 poll_max_interval: float = DEFAULT_POLL_MAX_INTERVAL,
+                 expected_turnaround_ratio: float = DEFAULT_EXPECTED_TURNAROUND_RATIO,
+                 poll_max_consecutive_errors: int = DEFAULT_POLL_MAX_CONSECUTIVE_ERRORS,
+                 use_central_poller: bool = True,
+                 poller_tick_seconds: float = 1.0,
+                 poller_batch_size: int = 20,
+                 dedupe_inflight: bool = True,
+                 live_job_stale_seconds: Optional[float] = None):
+        """
+        Initializes the XunfeiLfasrAsyncClient.
+
+        Args:
+            appid (str): The application ID from iFlytek open platform.
+            secret_key (str): The secret key associated with the application.
+            host (str, optional): The API host URL. Defaults to DEFAULT_LFASR_HOST.
+            max_connections (int, optional): Pool size of the shared HTTP client.
+            max_keepalive_connections (int, optional): Idle keep-alive connections of the shared HTTP client.
+            upload_parallelism (int, optional): Slices of one task uploaded at the same time.
+            upload_max_retries (int, optional): Retries per slice before the upload is abandoned.
+            upload_retry_base_delay (float, optional): First retry delay in seconds, doubled on each further retry.
+            poll_min_interval (float, optional): Poll interval around the expected completion time.
+            poll_max_interval (float, optional): Upper bound of the poll interval.
+            expected_turnaround_ratio (float, optional): Initial guess of processing time / audio duration,
+                refined with every completed task (see app/services/asr/poll_schedule.py).
+            poll_max_consecutive_errors (int, optional): Consecutive network/5xx errors tolerated while polling.
+            use_central_poller (bool, optional): Hand merged tasks to the shared AsrTaskPoller instead of
+                polling each one in its own coroutine.
+            poller_tick_seconds (float, optional): Tick of the central poller (used when it is created).
+            poller_batch_size (int, optional): Tasks polled concurrently per tick (used when the poller is created).
+            dedupe_inflight (bool, optional): Let a transcription of audio that is already being transcribed in
+                this process wait for that task's result instead of submitting a new task.
+            live_job_stale_seconds (float, optional): If given, an unfinished task for the same audio content
+                recorded under another session (a shared transcription only records its first session) is
+                resumed too, unless that session's pipeline job is running with a heartbeat within this many seconds.
+        """
+        self.appid = appid
+        self.secret_key = secret_key
+        self.host = host.rstrip('/')
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.upload_parallelism = max(1, upload_parallelism)
+        self.upload_max_retries = max(0, upload_max_retries)
+        self.upload_retry_base_delay = upload_retry_base_delay
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self.turnaround_estimator = get_turnaround_estimator(expected_turnaround_ratio)
+        self.poll_max_consecutive_errors = max(1, poll_max_consecutive_errors)
+        self.use_central_poller = use_central_poller
+        self.poller_tick_seconds = poller_tick_seconds
+        self.poller_batch_size = poller_batch_size
+        self.dedupe_inflight = dedupe_inflight
+        self.live_job_stale_seconds = live_job_stale_seconds
+        logger.info(f"XunfeiLfasrAsyncClient initialized for appid: {appid[:5]}... host: {self.host}")
+
+    def _signed_params(self, **extra: str) -> Dict[str, str]:
+        """Returns app_id/ts/signa plus the given fields."""
+        ts = str(int(time.time()))
+        params = {"app_id": self.appid, "signa": generate_lfasr_signa(self.appid, self.secret_key, ts), "ts": ts}
+        params.update(extra)
+        return params
+
+    async def _post(self, endpoint: str, data: Optional[Dict[str, str]] = None,
+                    params: Optional[Dict[str, str]] = None, files: Optional[Dict[str, Any]] = None,
+                    context: str = "", raise_transient: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        POSTs to an LFASR endpoint and checks the common response envelope.
+
+        Args:
+            endpoint: API path such as "/prepare".
+            data: Form fields (application/x-www-form-urlencoded unless files are given).
+            params: URL query parameters.
+            files: Multipart file fields.
+            context: Short description (task/slice id) used in log messages.
+            raise_transient: Raise LfasrTransientError for network errors and HTTP 429/5xx
+                             instead of returning None, so the caller can retry them.
+
+        Returns:
+            The decoded response JSON when HTTP 200 and ok == 0 and err_no == 0, None otherwise.
+        """
+        client = get_lfasr_http_client(self.max_connections, self.max_keepalive_connections)
+        try:
+            response = await client.post(self.host + endpoint, data=data, params=params, files=files)
+        except httpx.HTTPError as e:
+            logger.error(f"{endpoint} request failed{context} (network/request error): {e!r}")
+            if raise_transient:
+                raise LfasrTransientError(f"{endpoint}: {e!r}") from e
+            return None
+
+        if raise_transient and (response.status_code == 429 or response.status_code >= 500):
+            logger.error(f"{endpoint} request failed{context} with status code {response.status_code}. Response: {response.text[:500]}")
+            raise LfasrTransientError(f"{endpoint}: HTTP {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"{endpoint} request failed{context} with status code {response.status_code}. Response: {response.text[:500]}")
+            return None
+        try:
+            response_json = response.json()
+        except json.JSONDecodeError:
+            logger.error(f"Failed to decode JSON response from {endpoint}{context}: {response.text[:500]}")
+            return None
+        logger.debug(f"{endpoint} response JSON{context}: {response_json}")
+        if not (response_json.get("ok") == 0 and response_json.get("err_no") == 0):
+            logger.error(f"{endpoint} API error{context}. err_no: {response_json.get('err_no')}, message: {response_json.get('failed')}")
+            return None
+        return response_json
+
+    async def _call_prepare(self, file_len: int, file_name: str, slice_num: int,
+                            language: str, has_participle: bool, speaker_number: int,
+                            **other_params) -> Optional[str]:
+        """
+        Calls /prepare. file_name must carry the extension of the uploaded encoding.
+        Returns task_id on success, None otherwise.
+        """
+        payload = self._signed_params(
+            file_len=str(file_len),
+            file_name=file_name,
+            slice_num=str(slice_num),
+            language=language,
+            has_participle="true" if has_participle else "false",
+            speaker_number=str(speaker_number),
+            lfasr_type="0"
+        )
+        payload.update({str(k): str(v) for k, v in other_params.items()})
+        response_json = await self._post("/prepare", data=payload)
+        if response_json is None:
+            return None
+        task_id = response_json.get("data")
+        if not task_id:
+            logger.error(f"/prepare successful but task_id (data) is missing in response: {response_json}")
+            return None
+        logger.info(f"/prepare call successful. Task ID: {task_id}")
+        return task_id
+
+    async def _upload_slice(self, mapped_file: mmap.mmap, task_id: str, slice_index: int, slice_num: int,
+                            slice_id: str, offset: int, size: int,
+                            cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        Uploads one slice, retrying failed attempts with exponential backoff
+        (upload_retry_base_delay * 2**attempt seconds, at most upload_max_retries retries).
+        The slice is streamed into the multipart body from a memoryview of mapped_file in
+        64 KB chunks, so no slice-sized buffer is allocated on any attempt.
+        Returns True once the server acknowledged the slice, False otherwise.
+        """
+        context = f" for task_id: {task_id}, slice_id: {slice_id}"
+        for attempt in range(self.upload_max_retries + 1):
+            if attempt > 0:
+                delay = self.upload_retry_base_delay * (2 ** (attempt - 1))
+                logger.warning(f"Retrying slice {slice_index+1}/{slice_num}{context} in {delay:.1f}s (retry {attempt}/{self.upload_max_retries}).")
+                if await _sleep_unless_cancelled(delay, cancel_event):
+                    return False
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            slice_view = memoryview(mapped_file)[offset:offset + size]
+            with BufferChainReader(slice_view) as slice_body:
+                slice_view.release()
+                response_json = await self._post(
+                    "/upload",
+                    params=self._signed_params(task_id=task_id, slice_id=slice_id),
+                    files={'content': (slice_id, slice_body, 'application/octet-stream')},
+                    context=context
+                )
+            if response_json is not None:
+                logger.info(f"Uploaded slice {slice_index+1}/{slice_num} (ID: {slice_id}, Size: {size} bytes) for task_id: {task_id}")
+                return True
+        logger.error(f"Giving up on slice {slice_index+1}/{slice_num}{context} after {self.upload_max_retries + 1} attempts.")
+        return False
+
+    async def _upload_slices(self, audio_file_path: str, task_id: str,
+                             file_len: int, slice_num: int, slice_data_size: int,
+                             cancel_event: Optional[threading.Event] = None,
+                             already_uploaded: Optional[Set[str]] = None) -> bool:
+        """
+        Uploads the audio file to /upload in slices of slice_data_size bytes, at most
+        upload_parallelism slices at a time. Slice ids come from _SliceIdGenerator in file order,
+        so slice N always carries the N-th id regardless of completion order.
+        Each acknowledged slice id is recorded in asr_tasks; slices listed in already_uploaded
+        (acknowledged before a restart) are skipped.
+        Returns True only when every slice has been acknowledged; on the first slice that
+        exhausts its retries the remaining uploads are cancelled and False is returned.
+        """
+        slice_id_gen = XunfeiLfasrClient._SliceIdGenerator()
+        slice_plan = []
+        for index in range(slice_num):
+            offset = index * slice_data_size
+            size = min(slice_data_size, file_len - offset)
+            if size <= 0:
+                break
+            slice_plan.append((index, slice_id_gen.get_next_id(), offset, size))
+        if sum(size for _, _, _, size in slice_plan) != file_len:
+            logger.error(f"Slice plan for task_id: {task_id} does not cover the file: {slice_num} slices of {slice_data_size} bytes for {file_len} bytes.")
+            return False
+
+        pending_plan = [planned_slice for planned_slice in slice_plan if planned_slice[1] not in (already_uploaded or set())]
+        if not pending_plan:
+            logger.info(f"All {len(slice_plan)} slices were already uploaded for task_id: {task_id}.")
+            return True
+        logger.info(f"Starting to upload {len(pending_plan)}/{len(slice_plan)} slices for task_id: {task_id} from file: {audio_file_path} "
+                    f"(parallelism: {self.upload_parallelism})")
+        try:
+            mapped_file = await asyncio.to_thread(map_audio_file, audio_file_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not map audio file {audio_file_path} for task_id: {task_id}: {e}")
+            return False
+        semaphore = asyncio.Semaphore(self.upload_parallelism)
+
+        async def upload_one(index: int, slice_id: str, offset: int, size: int) -> None:
+            async with semaphore:
+                if not await self._upload_slice(mapped_file, task_id, index, len(slice_plan), slice_id, offset, size, cancel_event):
+                    raise RuntimeError(f"slice {index + 1}/{len(slice_plan)} (ID: {slice_id}) was not uploaded")
+            await asyncio.to_thread(_run_db, lambda db: crud.add_asr_task_uploaded_slice(db, task_id, slice_id), f"record uploaded slice {slice_id} of task {task_id}")
+
+        # Every upload task must have finished (releasing its view of the mapping) before the mapping is closed
+        with mapped_file:
+            if len(mapped_file) < file_len:
+                logger.error(f"Audio file {audio_file_path} is shorter than expected for task_id: {task_id}: {len(mapped_file)} of {file_len} bytes.")
+                return False
+            tasks = [asyncio.create_task(upload_one(*planned_slice)) for planned_slice in pending_plan]
+            try:
+                await asyncio.gather(*tasks)
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            except Exception as e:
+                logger.error(f"Slice upload failed for task_id: {task_id}: {e}. Cancelling remaining uploads.")
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                return False
+        logger.info(f"All {len(slice_plan)} slices uploaded successfully for task_id: {task_id}.")
+        return True
+
+    async def _call_merge(self, task_id: str) -> bool:
+        """Calls /merge so the server merges the slices and starts transcription."""
+        response_json = await self._post("/merge", data=self._signed_params(task_id=task_id), context=f" for task_id: {task_id}")
+        if response_json is None:
+            return False
+        logger.info(f"/merge call successful for task_id: {task_id}.")
+        return True
+
+    async def _fetch_task_state(self, task_id: str) -> Optional[bool]:
+        """
+        Calls /getProgress once.
+
+        Returns:
+            True once the task succeeded (status 9), False if it failed or the response is unusable,
+            None while it is still in progress.
+
+        Raises:
+            LfasrTransientError: on network errors and HTTP 429/5xx, which are worth retrying.
+        """
+        response_json = await self._post(
+            "/getProgress", data=self._signed_params(task_id=task_id),
+            context=f" for task_id: {task_id}", raise_transient=True
+        )
+        if response_json is None:
+            return False
+        data_str = response_json.get("data")
+        if not data_str:
+            logger.error(f"/getProgress response for task_id {task_id} is missing 'data' field. Response: {response_json}")
+            return False
+        try:
+            inner_data_json = json.loads(data_str)
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Failed to decode /getProgress data for task_id {task_id}: {data_str!r}. Error: {e}")
+            return None
+        status = inner_data_json.get("status")
+        status_desc = inner_data_json.get("desc", "N/A")
+        logger.info(f"Progress for task_id {task_id}: Status {status} ('{status_desc}').")
+        if status == SUCCESS_STATUS:
+            return True
+        if status in KNOWN_FAILURE_STATUSES:
+            logger.error(f"Task {task_id} failed with status {status}. Desc: '{status_desc}'.")
+            return False
+        if status not in KNOWN_IN_PROGRESS_STATUSES:
+            logger.error(f"Encountered unknown/unexpected status {status} for task_id {task_id}. Desc: '{status_desc}'.")
+            return False
+        return None
+
+    async def _poll_progress(self, task_id: str, cancel_event: Optional[threading.Event] = None,
+                             audio_duration_seconds: Optional[float] = None) -> bool:
+        """
+        Polls /getProgress in this coroutine until the task succeeds, fails or the schedule gives up
+        (used when the central poller is disabled).
+        Poll timing follows AdaptivePollSchedule: exponential backoff at first, then polls that
+        tighten towards the expected completion time (audio duration x observed turnaround ratio).
+        Network errors and HTTP 429/5xx are retried on the same schedule, up to
+        poll_max_consecutive_errors in a row.
+        Returns True if the task completed successfully (status 9), False otherwise.
+        """
+        schedule = self._build_poll_schedule(task_id, audio_duration_seconds)
+        started_at = time.monotonic()
+        consecutive_errors = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                task_state = await self._fetch_task_state(task_id)
+            except LfasrTransientError:
+                consecutive_errors += 1
+                if consecutive_errors >= self.poll_max_consecutive_errors:
+                    logger.error(f"Giving up polling task_id {task_id} after {consecutive_errors} consecutive request errors.")
+                    return False
+            else:
+                consecutive_errors = 0
+                if task_state is not None:
+                    return task_state
+
+            delay = schedule.next_delay(time.monotonic() - started_at)
+            if delay is None:
+                logger.error(f"Polling for task_id {task_id} timed out after {attempt} attempts ({schedule.max_wait_seconds:.0f}s).")
+                return False
+            logger.debug(f"Next /getProgress for task_id {task_id} in {delay:.1f}s.")
+            if await _sleep_unless_cancelled(delay, cancel_event):
+                logger.info(f"Polling cancelled for task_id {task_id}.")
+                return False
+
+    def _build_poll_schedule(self, task_id: str, audio_duration_seconds: Optional[float]) -> AdaptivePollSchedule:
+        schedule = AdaptivePollSchedule(
+            audio_duration_seconds, self.turnaround_estimator.ratio, self.poll_min_interval, self.poll_max_interval
+        )
+        logger.info(f"Polling progress for task_id: {task_id} (audio duration: {audio_duration_seconds}s, "
+                    f"expected completion after: {schedule.expected_seconds}s, max wait: {schedule.max_wait_seconds:.0f}s).")
+        return schedule
+
+    async def _wait_for_task(self, task_id: str, cancel_event: Optional[threading.Event],
+                             audio_duration_seconds: Optional[float], session_id: Optional[str]) -> bool:
+        """
+        Waits for a merged task, through the central poller when enabled, and feeds the observed
+        turnaround time into the shared ratio estimate.
+        Returns True if the task completed successfully, False otherwise.
+        """
+        started_at = time.monotonic()
+        if self.use_central_poller:
+            poller = get_asr_task_poller(self.poller_tick_seconds, self.poller_batch_size, self.poll_max_consecutive_errors)
+            succeeded = await poller.wait_for_completion(
+                task_id,
+                self._fetch_task_state,
+                self._build_poll_schedule(task_id, audio_duration_seconds),
+                cancel_event=cancel_event,
+                session_id=session_id,
+                audio_duration_seconds=audio_duration_seconds
+            )
+        else:
+            await asyncio.to_thread(
+                _run_db,
+                lambda db: crud.set_asr_task_status(db, task_id, AsrTaskStatus.POLLING, session_id, audio_duration_seconds),
+                f"mark task {task_id} as polling"
+            )
+            succeeded = await self._poll_progress(task_id, cancel_event, audio_duration_seconds)
+            if not succeeded:
+                await self._mark_task_ended(task_id, cancel_event, "Polling did not complete successfully.")
+        if succeeded:
+            turnaround_seconds = time.monotonic() - started_at
+            self.turnaround_estimator.observe(audio_duration_seconds, turnaround_seconds)
+            logger.info(f"Task {task_id} completed after {turnaround_seconds:.1f}s.")
+        return succeeded
+
+    async def _call_get_result(self, task_id: str) -> Optional[list]:
+        """Calls /getResult and returns the decoded list of segments, None on failure."""
+        response_json = await self._post("/getResult", data=self._signed_params(task_id=task_id), context=f" for task_id: {task_id}")
+        if response_json is None:
+            return None
+        data_str = response_json.get("data")
+        if data_str is None:
+            logger.error(f"/getResult response for task_id {task_id} is missing 'data' field or it is null. Response: {response_json}")
+            return None
+        try:
+            transcription_list = json.loads(data_str)
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Failed to decode /getResult data for task_id {task_id}: {data_str!r}. Error: {e}")
+            return None
+        logger.info(f"Fetched transcription results for task_id: {task_id}. Count: {len(transcription_list) if isinstance(transcription_list, list) else 'N/A'}")
+        return transcription_list
+
+    async def _upload_and_merge(self, task_id: str, audio_file_path: str, file_len: int, slice_num: int,
+                                slice_data_size: int, cancel_event: Optional[threading.Event],
+                                already_uploaded: Optional[Set[str]] = None) -> bool:
+        """Uploads the remaining slices and calls /merge, recording each phase in asr_tasks."""
+        if not await self._upload_slices(audio_file_path, task_id, file_len, slice_num, slice_data_size,
+                                         cancel_event, already_uploaded):
+            logger.error(f"Upload slices failed for task_id: {task_id}. Aborting transcription.")
+            await self._mark_task_ended(task_id, cancel_event, "Slice upload failed.")
+            return False
+        await asyncio.to_thread(_run_db, lambda db: crud.set_asr_task_status(db, task_id, AsrTaskStatus.UPLOADED), f"mark task {task_id} as uploaded")
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info(f"Transcription cancelled before merge for task_id: {task_id}.")
+            await self._mark_task_ended(task_id, cancel_event, None)
+            return False
+        if not await self._call_merge(task_id):
+            logger.error(f"Merge call failed for task_id: {task_id}. Aborting transcription.")
+            await self._mark_task_ended(task_id, cancel_event, "Merge failed.")
+            return False
+        await asyncio.to_thread(_run_db, lambda db: crud.set_asr_task_status(db, task_id, AsrTaskStatus.MERGED), f"mark task {task_id} as merged")
+        return True
+
+    async def _finish_task(self, task_id: str, cancel_event: Optional[threading.Event],
+                           audio_duration_seconds: Optional[float], session_id: Optional[str],
+                           wait: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """Waits for a merged task (unless wait is False), fetches its result and stores it in asr_tasks."""
+        if wait and not await self._wait_for_task(task_id, cancel_event, audio_duration_seconds, session_id):
+            logger.error(f"Polling progress did not complete successfully for task_id: {task_id}. Aborting.")
+            return None
+        transcription_result = await self._call_get_result(task_id)
+        if not transcription_result:
+            logger.error(f"Get result call failed for task_id: {task_id}.")
+            await self._mark_task_ended(task_id, cancel_event, "getResult failed.")
+            return None
+        await asyncio.to_thread(_run_db, lambda db: crud.save_asr_task_result(db, task_id, transcription_result), f"store result of task {task_id}")
+        logger.info(f"Transcription successful for task_id: {task_id}.")
+        return transcription_result
+
+    async def _resume_task(self, db_task: Any, audio_file_path: str, file_len: int, audio_sha256: str,
+                           cancel_event: Optional[threading.Event], audio_duration_seconds: Optional[float],
+                           session_id: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Continues a task recorded in asr_tasks from its last persisted phase: returns a stored result,
+        fetches the result of a finished task, waits for a merged one, or uploads the missing slices
+        of a prepared one. db_task was looked up by the audio's hash and length, so it belongs to this exact audio.
+        Returns the transcription, or None if the task cannot be resumed (it is then marked failed).
+        """
+        task_id = db_task.task_id
+        status = AsrTaskStatus(db_task.status)
+        logger.info(f"Resuming LFASR task {task_id} for {db_task.file_name} from phase '{status.value}'.")
+        if status == AsrTaskStatus.SUCCEEDED:
+            if db_task.result:
+                return db_task.result
+            return await self._finish_task(task_id, cancel_event, audio_duration_seconds, session_id, wait=False)
+        if status in (AsrTaskStatus.PREPARED, AsrTaskStatus.UPLOADED):
+            if status == AsrTaskStatus.PREPARED:
+                already_uploaded = set(db_task.uploaded_slice_ids or [])
+                if not await self._upload_and_merge(task_id, audio_file_path, file_len, db_task.slice_num,
+                                                    db_task.slice_size_bytes, cancel_event, already_uploaded):
+                    return None
+            else:
+                if not await self._call_merge(task_id):
+                    await self._mark_task_ended(task_id, cancel_event, "Merge failed on resume.")
+                    return None
+                await asyncio.to_thread(_run_db, lambda db: crud.set_asr_task_status(db, task_id, AsrTaskStatus.MERGED), f"mark task {task_id} as merged")
+        return await self._finish_task(task_id, cancel_event, audio_duration_seconds or db_task.audio_duration_seconds, session_id)
+
+    async def _mark_task_ended(self, task_id: str, cancel_event: Optional[threading.Event], error: Optional[str]) -> None:
+        status = AsrTaskStatus.CANCELLED if cancel_event is not None and cancel_event.is_set() else AsrTaskStatus.FAILED
+        await asyncio.to_thread(_run_db, lambda db: crud.finish_asr_tasks(db, [(task_id, status, error)]), f"mark task {task_id} as {status.value}")
+
+    async def resume_pending_tasks(self, max_age_seconds: float, stale_seconds: Optional[float] = None) -> int:
+        """
+        Reattaches to tasks that were merged (or finished without a stored result) before a restart,
+        waiting for them in the background and storing their results in asr_tasks, where the
+        re-queued session pipeline picks them up. Prepared/uploaded tasks need the audio file
+        and are resumed by the pipeline itself.
+
+        Args:
+            max_age_seconds: Only tasks created within this many seconds are resumed.
+            stale_seconds: If given, tasks whose session's pipeline job is still running with a heartbeat
+                           within this many seconds are skipped; a live worker (possibly in another
+                           process) is already waiting for them.
+
+        Returns:
+            The number of tasks reattached.
+        """
+        db_tasks = await asyncio.to_thread(
+            _run_db,
+            lambda db: crud.get_unfinished_asr_tasks(
+                db, [AsrTaskStatus.MERGED, AsrTaskStatus.POLLING, AsrTaskStatus.SUCCEEDED],
+                datetime.now() - timedelta(seconds=max_age_seconds),
+                live_heartbeat_after=datetime.now() - timedelta(seconds=stale_seconds) if stale_seconds is not None else None
+            ),
+            "load unfinished tasks"
+        ) or []
+        resumed = 0
+        for db_task in db_tasks:
+            if db_task.status == AsrTaskStatus.SUCCEEDED.value and db_task.result:
+                continue
+            collector = asyncio.create_task(self._finish_task(
+                db_task.task_id, None, db_task.audio_duration_seconds, db_task.session_id,
+                wait=db_task.status != AsrTaskStatus.SUCCEEDED.value
+            ))
+            _recovery_tasks.add(collector)
+            collector.add_done_callback(_recovery_tasks.discard)
+            resumed += 1
+        if resumed:
+            logger.info(f"Reattached to {resumed} unfinished LFASR task(s).")
+        return resumed
+
+    async def _submit_task(self, audio_file_path: str, file_name: str, file_len: int, audio_sha256: str,
+                           slice_num: int, slice_data_size: int, cancel_event: Optional[threading.Event],
+                           audio_duration_seconds: Optional[float], session_id: Optional[str],
+                           prepare_params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Runs a new LFASR task end to end: prepare, upload, merge, wait and fetch the result."""
+        task_id = await self._call_prepare(file_len=file_len, file_name=file_name, slice_num=slice_num, **prepare_params)
+        if not task_id:
+            logger.error("Prepare call failed. Aborting transcription.")
+            return None
+        await asyncio.to_thread(
+            _run_db,
+            lambda db: crud.create_asr_task(db, task_id, session_id, file_name, file_len, audio_sha256,
+                                            slice_num, slice_data_size, audio_duration_seconds),
+            f"record prepared task {task_id}"
+        )
+        if not await self._upload_and_merge(task_id, audio_file_path, file_len, slice_num, slice_data_size, cancel_event):
+            return None
+        return await self._finish_task(task_id, cancel_event, audio_duration_seconds, session_id)
+
+    async def _transcribe_audio(self, audio_file_path: str, file_name: str, file_len: int, audio_sha256: str,
+                                slice_num: int, slice_data_size: int, cancel_event: Optional[threading.Event],
+                                audio_duration_seconds: Optional[float], session_id: Optional[str],
+                                prepare_params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Resumes the session's unfinished task for this audio, or submits a new one, holding one Xunfei
+        slot of the resource governor for the whole provider task (also when it is shared between sessions).
+        """
+        async with get_resource_governor().acquire(XUNFEI):
+            if session_id:
+                other_sessions_idle_after = (datetime.now() - timedelta(seconds=self.live_job_stale_seconds)
+                                             if self.live_job_stale_seconds is not None else None)
+                db_task = await asyncio.to_thread(
+                    _run_db,
+                    lambda db: crud.get_resumable_asr_task(db, session_id, file_name, audio_sha256, file_len,
+                                                           other_sessions_idle_after=other_sessions_idle_after),
+                    f"look up resumable task for {file_name}"
+                )
+                if db_task is not None:
+                    resumed_result = await self._resume_task(db_task, audio_file_path, file_len, audio_sha256,
+                                                             cancel_event, audio_duration_seconds, session_id)
+                    if resumed_result is not None:
+                        return resumed_result
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    logger.warning(f"Could not resume task {db_task.task_id} for {file_name}; submitting a new task.")
+            return await self._submit_task(audio_file_path, file_name, file_len, audio_sha256, slice_num, slice_data_size,
+                                           cancel_event, audio_duration_seconds, session_id, prepare_params)
+
+    async def _transcribe_shared_audio(self, audio_file_path: str, file_name: str, file_len: int, audio_sha256: str,
+                                       slice_num: int, slice_data_size: int, cancel_event: Optional[threading.Event],
+                                       audio_duration_seconds: Optional[float], session_id: Optional[str],
+                                       prepare_params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Runs a transcription shared between sessions on its own hard link (or copy) of the audio, so the
+        task keeps its input when the session that started it is cancelled and its temp directory removed.
+        """
+        shared_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="lfasr_shared_")
+        try:
+            shared_path = os.path.join(shared_dir, file_name)
+            await asyncio.to_thread(_link_or_copy, audio_file_path, shared_path)
+            return await self._transcribe_audio(shared_path, file_name, file_len, audio_sha256, slice_num, slice_data_size,
+                                                cancel_event, audio_duration_seconds, session_id, prepare_params)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, shared_dir, True)
+
+    async def _await_shared_transcription(self, shared: _SharedTranscription,
+                                          cancel_event: Optional[threading.Event]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Waits for a shared transcription on behalf of one session. A session whose cancel_event is set
+        stops waiting and gets None; the shared task itself is only stopped once no session waits for it
+        (through its own cancel event, or by cancelling it when the last waiter is cancelled).
+        """
+        shared.waiters += 1
+        waiter_cancelled = False
+        try:
+            while True:
+                done, _ = await asyncio.wait({shared.task}, timeout=CANCEL_CHECK_INTERVAL if cancel_event is not None else None)
+                if done:
+                    return shared.task.result()
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+        except asyncio.CancelledError:
+            waiter_cancelled = True
+            raise
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.task.done():
+                shared.cancel_event.set()
+                if waiter_cancelled:
+                    shared.task.cancel()
+
+    async def transcribe(
+        self,
+        audio_file_path: str,
+        cancel_event: Optional[threading.Event] = None,
+        audio_duration_seconds: Optional[float] = None,
+        session_id: Optional[str] = None,
+        language: str = "cn",
+        has_participle: bool = False,
+        speaker_number: int = 0,
+        slice_size_mb: int = DEFAULT_SLICE_SIZE_MB,
+        **other_prepare_params
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Transcribes the audio file with LFASR without blocking a thread.
+
+        Args:
+            audio_file_path: The path to the audio file to be transcribed.
+            cancel_event: Optional event; once set, uploading/polling stops and None is returned.
+                          Cancelling the awaiting task also stops it immediately.
+            audio_duration_seconds: Optional audio length; sets the expected completion time for polling.
+            session_id: Optional session the task belongs to. Task phases are recorded in asr_tasks, and an
+                        unfinished task of the same session, file name and audio content (SHA-256 and length) is resumed instead of resubmitted
+                        (with live_job_stale_seconds, also one of another session that is no longer being worked on).
+
+        While a task for the same audio content (SHA-256) and /prepare parameters is in flight in this
+        process, further calls wait for its result instead of submitting another task (see dedupe_inflight).
+
+        Returns:
+            A list of segment dictionaries on success, None otherwise.
+        """
+        logger.info(f"Starting async transcription for: {audio_file_path}")
+        try:
+            file_len = os.path.getsize(audio_file_path)
+        except OSError as e:
+            logger.error(f"Audio file not accessible: {audio_file_path}: {e}")
+            return None
+        if file_len == 0:
+            logger.error(f"Audio file is empty: {audio_file_path}")
+            return None
+        file_name = os.path.basename(audio_file_path)
+        audio_extension = os.path.splitext(file_name)[1].lower()
+        if audio_extension not in SUPPORTED_AUDIO_EXTENSIONS:
+            logger.error(f"Unsupported audio format '{audio_extension}' for LFASR: {audio_file_path}. "
+                         f"Supported: {', '.join(sorted(SUPPORTED_AUDIO_EXTENSIONS))}")
+            return None
+
+        slice_data_size = slice_size_mb * BYTES_PER_MB
+        slice_num = max(1, math.ceil(file_len / slice_data_size))
+        logger.info(f"File: {file_name}, Format: {audio_extension}, Size: {file_len} bytes, Slices: {slice_num} (slice_size_mb: {slice_size_mb})")
+
+        try:
+            audio_sha256 = await asyncio.to_thread(_file_sha256, audio_file_path)
+            prepare_params = dict(language=language, has_participle=has_participle, speaker_number=speaker_number,
+                                  **other_prepare_params)
+            if not self.dedupe_inflight:
+                return await self._transcribe_audio(audio_file_path, file_name, file_len, audio_sha256, slice_num, slice_data_size,
+                                                    cancel_event, audio_duration_seconds, session_id, prepare_params)
+
+            dedup_key = (audio_sha256, file_len) + tuple(sorted((key, str(value)) for key, value in prepare_params.items()))
+            inflight = _inflight_transcriptions.setdefault(asyncio.get_running_loop(), {})
+            shared = inflight.get(dedup_key)
+            if shared is None:
+                shared_cancel_event = threading.Event()
+                shared = _SharedTranscription(
+                    task=asyncio.create_task(self._transcribe_shared_audio(
+                        audio_file_path, file_name, file_len, audio_sha256, slice_num, slice_data_size,
+                        shared_cancel_event, audio_duration_seconds, session_id, prepare_params
+                    )),
+                    cancel_event=shared_cancel_event
+                )
+                inflight[dedup_key] = shared
+                shared.task.add_done_callback(functools.partial(_forget_shared_transcription, inflight, dedup_key, shared))
+            else:
+                logger.info(f"Audio {audio_sha256[:12]} ({file_name}) is already being transcribed in this process; "
+                            f"session {session_id} waits for that task instead of submitting a new one.")
+            return await self._await_shared_transcription(shared, cancel_event)
+        except asyncio.CancelledError:
+            logger.info(f"Async transcription of {audio_file_path} cancelled.")
+            raise
+        except Exception as e:
+            logger.exception(f"An unexpected error occurred during async transcription of {audio_file_path}: {e}")
+            return None
@@ -1,52 +1,122 @@
 import subprocess
 import os
+import glob
 import time
 import logging
+import wave
+import bisect
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.utils.process_runner import ProcessRegistry, OutputLineHandler, run_process, run_process_async, run_piped_processes
+from app.utils.progress_parsers import FfmpegProgressParser, ProgressCallback, progress_line_handler
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def extract_audio_with_ffmpeg(video_path: str, output_wav_path: str) -> bool:
+# Output codecs for the ASR upload: codec name -> (file extension, ffmpeg codec arguments).
+# All variants are 16kHz mono; compressed codecs use the configured speech bitrate.
+ASR_AUDIO_CODECS = {
+    'pcm': ('.wav', ['-acodec', 'pcm_s16le']),
+    'mp3': ('.mp3', ['-acodec', 'libmp3lame']),
+    'opus': ('.opus', ['-acodec', 'libopus', '-application', 'voip']),
+}
+DEFAULT_ASR_AUDIO_CODEC = 'pcm'
+ASR_SAMPLE_RATE = 16000
+
+def asr_audio_extension(audio_codec: str = DEFAULT_ASR_AUDIO_CODEC) -> str:
     """
-    Extracts audio from a video file using ffmpeg and converts it to a
-    single WAV file with specified ASR-friendly parameters (16kHz, mono, 16-bit PCM).
+    Returns the file extension (including the dot) for an ASR output codec.
+
+    Raises:
+        ValueError: If the codec is not one of ASR_AUDIO_CODECS.
+    """
+    if audio_codec not in ASR_AUDIO_CODECS:
+        raise ValueError(f"Unsupported ASR audio codec '{audio_codec}'. Expected one of: {', '.join(ASR_AUDIO_CODECS)}.")
+    return ASR_AUDIO_CODECS[audio_codec][0]
+
+def build_asr_ffmpeg_command(input_path: str, output_wav_path: str,
+                             audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                             audio_bitrate: Optional[str] = None,
+                             raw_pcm_input: bool = False,
+                             report_progress: bool = False) -> List[str]:
+    """
+    Builds the ffmpeg command that converts any input to ASR-friendly audio
+    (16kHz, mono; 16-bit PCM WAV by default, or MP3/Opus at a speech bitrate).
 
     Args:
-        video_path (str): The full path to the input video file.
-        output_wav_path (str): The desired full path for the output WAV file.
+        input_path (str): The input file path, or 'pipe:0' to read the media from stdin.
+        output_wav_path (str): The desired full path for the output file (extension should match the codec).
+        audio_codec (str): One of ASR_AUDIO_CODECS ('pcm', 'mp3', 'opus').
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'. Ignored for 'pcm'.
+        raw_pcm_input (bool): The input is headerless 16kHz mono s16le PCM (as written by encode_pcm_stretches).
+        report_progress (bool): Write machine-readable progress to stdout (-progress pipe:1) and log input
+                                info (including 'Duration:') to stderr, for FfmpegProgressParser.
 
     Returns:
-        bool: True if extraction was successful, False otherwise.
+        List[str]: The ffmpeg command and its arguments.
     """
-    if not os.path.exists(video_path):
-        logging.error(f"Input video file not found: {video_path}")
-        return False
-
+    asr_audio_extension(audio_codec)  # validates the codec
+    codec_args = list(ASR_AUDIO_CODECS[audio_codec][1])
+    if audio_codec != 'pcm' and audio_bitrate:
+        codec_args += ['-b:a', audio_bitrate]
     # ffmpeg command construction
     # -i: input file
     # -y: overwrite output files without asking
     # -hide_banner: suppress printing banner
     # -loglevel error: show only errors
     # -vn: disable video recording (extract audio only)
-    # -acodec pcm_s16le: audio codec, PCM signed 16-bit little-endian (standard for WAV)
+    # -acodec ...: output codec, e.g. pcm_s16le (PCM signed 16-bit little-endian, standard for WAV)
     # -ar 16000: audio sample rate 16kHz
     # -ac 1: audio channels, 1 for mono
-    command = [
+    # -progress pipe:1 -nostats: key=value progress blocks on stdout instead of the stderr status line
+    input_format_args = ['-f', 's16le', '-ar', str(ASR_SAMPLE_RATE), '-ac', '1'] if raw_pcm_input else []
+    progress_args = ['-progress', 'pipe:1', '-nostats'] if report_progress else []
+    return [
         'ffmpeg',
-        '-i', video_path,
+        *input_format_args,
+        '-i', input_path,
         '-y',
         '-hide_banner',
-        '-loglevel', 'error',
+        '-loglevel', 'info' if report_progress else 'error',
+        *progress_args,
         '-vn',
-        '-acodec', 'pcm_s16le',
-        '-ar', '16000',
+        *codec_args,
+        '-ar', str(ASR_SAMPLE_RATE),
         '-ac', '1',
         output_wav_path
     ]
 
+def extract_audio_with_ffmpeg(video_path: str, output_wav_path: str,
+                              process_registry: Optional[ProcessRegistry] = None,
+                              audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                              audio_bitrate: Optional[str] = None) -> bool:
+    """
+    Extracts audio from a video file using ffmpeg and converts it to a
+    single file with specified ASR-friendly parameters (16kHz, mono; 16-bit PCM WAV by default).
+
+    Args:
+        video_path (str): The full path to the input video file.
+        output_wav_path (str): The desired full path for the output audio file.
+        process_registry (ProcessRegistry, optional): Registers the ffmpeg process so it can be
+                                                      terminated when the session is cancelled.
+        audio_codec (str): Output codec, one of ASR_AUDIO_CODECS.
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'.
+
+    Returns:
+        bool: True if extraction was successful, False otherwise.
+    """
+    if not os.path.exists(video_path):
+        logging.error(f"Input video file not found: {video_path}")
+        return False
+
+    command = build_asr_ffmpeg_command(video_path, output_wav_path, audio_codec, audio_bitrate)
+
     logging.info(f"Executing ffmpeg command: {' '.join(command)}")
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=False)
+        result = run_process(command, process_registry)
         if result.returncode == 0:
             logging.info(f"ffmpeg successfully extracted audio to: {output_wav_path}")
             return True
@@ -62,27 +132,155 @@ def extract_audio_with_ffmpeg(video_path: str, output_wav_path: str) -> bool:
         logging.error(f"ffmpeg stderr: {result.stderr.strip() if 'result' in locals() else 'N/A'}")
         return False
 
+async def extract_audio_with_ffmpeg_async(video_path: str, output_wav_path: str,
+                                          audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                                          audio_bitrate: Optional[str] = None,
+                                          timeout_seconds: Optional[float] = None,
+                                          progress_callback: Optional[ProgressCallback] = None) -> bool:
+    """
+    Asynchronous variant of extract_audio_with_ffmpeg: runs ffmpeg on the event loop (no worker thread),
+    reports percent-complete parsed from `-progress pipe:1` and kills ffmpeg after timeout_seconds.
+    Cancelling the calling task kills ffmpeg as well.
+
+    Args:
+        video_path (str): The full path to the input video file.
+        output_wav_path (str): The desired full path for the output audio file.
+        audio_codec (str): Output codec, one of ASR_AUDIO_CODECS.
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'.
+        timeout_seconds (float, optional): Upper bound on the ffmpeg run time; no limit if empty.
+        progress_callback (ProgressCallback, optional): Receives percent-complete (0-100).
+
+    Returns:
+        bool: True if extraction was successful, False otherwise (including timeouts).
+    """
+    if not os.path.exists(video_path):
+        logging.error(f"Input video file not found: {video_path}")
+        return False
+
+    command = build_asr_ffmpeg_command(video_path, output_wav_path, audio_codec, audio_bitrate,
+                                       report_progress=progress_callback is not None)
+    line_handler: Optional[OutputLineHandler] = None
+    if progress_callback is not None:
+        line_handler = progress_line_handler(FfmpegProgressParser(), progress_callback)
+
+    logging.info(f"Executing ffmpeg command: {' '.join(command)}")
+    try:
+        result = await run_process_async(command, timeout_seconds, line_handler)
+    except FileNotFoundError:
+        logging.error("ffmpeg command not found. Please ensure ffmpeg is installed and in your system PATH.")
+        return False
+    except subprocess.TimeoutExpired:
+        logging.error(f"ffmpeg did not finish within {timeout_seconds} seconds and was killed: {video_path}")
+        return False
+    if result.returncode != 0:
+        logging.error(f"ffmpeg command failed with return code {result.returncode}")
+        logging.error(f"ffmpeg stderr: {result.stderr.strip()}")
+        return False
+    logging.info(f"ffmpeg successfully extracted audio to: {output_wav_path}")
+    return True
+
+# Suffixes of incomplete/auxiliary files that yt-dlp may leave next to the media file
+_PARTIAL_DOWNLOAD_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp')
+
+def find_media_file(media_folder: str, media_name_no_ext: str) -> str | None:
+    """
+    Locates a media file by its base name regardless of container extension
+    (e.g. .mp4 for merged video downloads, .m4a/.webm/.mp3 for audio-only downloads).
+
+    Args:
+        media_folder (str): The directory to search.
+        media_name_no_ext (str): The base name of the media file (without extension).
+
+    Returns:
+        str | None: The path to the largest matching non-empty file (preferring .mp4 for
+                    backward compatibility), or None if nothing was found.
+    """
+    preferred_path = os.path.join(media_folder, f"{media_name_no_ext}.mp4")
+    if os.path.isfile(preferred_path) and os.path.getsize(preferred_path) > 0:
+        return preferred_path
+
+    candidates = [
+        path for path in glob.glob(os.path.join(glob.escape(media_folder), f"{glob.escape(media_name_no_ext)}.*"))
+        if os.path.isfile(path)
+        and not path.endswith(_PARTIAL_DOWNLOAD_SUFFIXES)
+        and os.path.getsize(path) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getsize)
+
 def prepare_audio_for_asr(video_name_no_ext: str, 
                           video_input_folder: str = 'bilibili_video', 
                           audio_output_folder: str = "audio/full_audio",
-                          output_filename_no_ext: str = "") -> str | None:
+                          output_filename_no_ext: str = "",
+                          process_registry: Optional[ProcessRegistry] = None,
+                          audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                          audio_bitrate: Optional[str] = None) -> str | None:
     """
     Processes a video file to extract a single, ASR-compliant WAV audio file using ffmpeg.
 
     Args:
-        video_name_no_ext (str): The base name of the video file (without extension).
-                                 It's assumed the video is an MP4 file or other ffmpeg-compatible format.
+        video_name_no_ext (str): The base name of the input media file (without extension).
+                                 Any ffmpeg-compatible container is accepted (merged .mp4 video or
+                                 audio-only .m4a/.webm/.mp3 etc.), see find_media_file.
         video_input_folder (str): The directory where the input video file is located.
         audio_output_folder (str): The directory where the final WAV audio file will be saved.
         output_filename_no_ext (str): The base name of the output file (without extension).
+        process_registry (ProcessRegistry, optional): Registers the ffmpeg process for cancellation.
+        audio_codec (str): Output codec, one of ASR_AUDIO_CODECS ('pcm' WAV by default; 'mp3'/'opus'
+                           cut upload size by roughly an order of magnitude).
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'.
+
+    Returns:
+        str | None: The path to the generated compliant audio file, or None if an error occurs.
+    """
+    paths = _resolve_asr_audio_paths(video_name_no_ext, video_input_folder, audio_output_folder,
+                                     output_filename_no_ext, audio_codec)
+    if paths is None:
+        return None
+    input_video_path, output_wav_path = paths
+
+    success = extract_audio_with_ffmpeg(input_video_path, output_wav_path, process_registry, audio_codec, audio_bitrate)
+    return _finish_asr_audio_preparation(success, video_name_no_ext, input_video_path, output_wav_path)
+
+async def prepare_audio_for_asr_async(video_name_no_ext: str,
+                                      video_input_folder: str,
+                                      audio_output_folder: str,
+                                      output_filename_no_ext: str = "",
+                                      audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                                      audio_bitrate: Optional[str] = None,
+                                      timeout_seconds: Optional[float] = None,
+                                      progress_callback: Optional[ProgressCallback] = None) -> str | None:
+    """
+    Asynchronous variant of prepare_audio_for_asr built on extract_audio_with_ffmpeg_async
+    (live progress, per-process timeout, no worker thread held while ffmpeg runs).
+
+    Args:
+        video_name_no_ext, video_input_folder, audio_output_folder, output_filename_no_ext,
+        audio_codec, audio_bitrate: As for prepare_audio_for_asr.
+        timeout_seconds (float, optional): Upper bound on the ffmpeg run time; no limit if empty.
+        progress_callback (ProgressCallback, optional): Receives percent-complete (0-100).
 
     Returns:
-        str | None: The path to the generated compliant WAV audio file, or None if an error occurs.
+        str | None: The path to the generated compliant audio file, or None if an error occurs.
     """
-    input_video_path = os.path.join(video_input_folder, f"{video_name_no_ext}.mp4") # Assuming .mp4, adjust if needed
+    paths = _resolve_asr_audio_paths(video_name_no_ext, video_input_folder, audio_output_folder,
+                                     output_filename_no_ext, audio_codec)
+    if paths is None:
+        return None
+    input_video_path, output_wav_path = paths
+
+    success = await extract_audio_with_ffmpeg_async(input_video_path, output_wav_path, audio_codec, audio_bitrate,
+                                                    timeout_seconds, progress_callback)
+    return _finish_asr_audio_preparation(success, video_name_no_ext, input_video_path, output_wav_path)
 
-    if not os.path.exists(input_video_path):
-        logging.error(f"Video file not found for processing: {input_video_path}")
+def _resolve_asr_audio_paths(video_name_no_ext: str, video_input_folder: str, audio_output_folder: str,
+                             output_filename_no_ext: str, audio_codec: str) -> Tuple[str, str] | None:
+    """Returns (input media path, output audio path) for prepare_audio_for_asr*, or None if the input is missing."""
+    input_video_path = find_media_file(video_input_folder, video_name_no_ext)
+
+    if input_video_path is None:
+        logging.error(f"Media file not found for processing: {os.path.join(video_input_folder, video_name_no_ext)}.*")
         return None
 
     try:
@@ -93,14 +291,17 @@ def prepare_audio_for_asr(video_name_no_ext: str,
         return None
 
     timestamp = time.strftime('%Y%m%d%H%M%S')
-    output_filename = f"{output_filename_no_ext}_{timestamp}.wav" if output_filename_no_ext else f"{video_name_no_ext}_{timestamp}.wav"
+    extension = asr_audio_extension(audio_codec)
+    output_filename = f"{output_filename_no_ext}_{timestamp}{extension}" if output_filename_no_ext else f"{video_name_no_ext}_{timestamp}{extension}"
     output_wav_path = os.path.join(audio_output_folder, output_filename)
 
     logging.info(f"Preparing audio for ASR from video: {input_video_path}")
     logging.info(f"Target output WAV path: {output_wav_path}")
+    return input_video_path, output_wav_path
 
-    success = extract_audio_with_ffmpeg(input_video_path, output_wav_path)
-
+def _finish_asr_audio_preparation(success: bool, video_name_no_ext: str,
+                                  input_video_path: str, output_wav_path: str) -> str | None:
+    """Logs the outcome of prepare_audio_for_asr* and removes an empty output file on failure."""
     if success:
         logging.info(f"ASR-compliant audio successfully prepared at: {output_wav_path}")
         return output_wav_path
@@ -116,6 +317,416 @@ def prepare_audio_for_asr(video_name_no_ext: str,
                 logging.warning(f"Could not remove potentially corrupt output file {output_wav_path}: {e_remove}")
         return None
 
+async def stream_audio_for_asr(source_command: List[str], output_wav_path: str,
+                              audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                              audio_bitrate: Optional[str] = None,
+                              timeout_seconds: Optional[float] = None,
+                              source_stderr_handler: Optional[OutputLineHandler] = None) -> Tuple[bool, bool]:
+    """
+    Pipes the stdout of a media source process (e.g. `yt-dlp -o -`) straight into ffmpeg and
+    writes ASR-compliant audio (WAV, or MP3/Opus per audio_codec). Download and transcoding overlap and no intermediate media
+    file is written to disk.
+
+    Args:
+        source_command (List[str]): The command that writes the media stream to stdout.
+        output_wav_path (str): The desired full path for the output audio file.
+        audio_codec (str): Output codec, one of ASR_AUDIO_CODECS.
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'.
+        timeout_seconds (float, optional): Upper bound on the run time of the pair; no limit if empty.
+        source_stderr_handler (OutputLineHandler, optional): Receives each stderr line of the source
+                                                             command (e.g. yt-dlp download progress).
+
+    Returns:
+        Tuple[bool, bool]: (source succeeded, ffmpeg succeeded). The WAV is usable only if both are True.
+
+    Raises:
+        subprocess.TimeoutExpired: If the pair did not finish within timeout_seconds (both were killed).
+    """
+    output_folder = os.path.dirname(output_wav_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    ffmpeg_command = build_asr_ffmpeg_command('pipe:0', output_wav_path, audio_codec, audio_bitrate)
+    logging.info(f"Streaming: {' '.join(source_command)} | {' '.join(ffmpeg_command)}")
+    try:
+        source_result, ffmpeg_result = await run_piped_processes(
+            source_command, ffmpeg_command, timeout_seconds, source_stderr_handler
+        )
+    except subprocess.TimeoutExpired:
+        logging.error(f"Streaming did not finish within {timeout_seconds} seconds; both processes were killed.")
+        if os.path.exists(output_wav_path):
+            os.remove(output_wav_path)
+        raise
+
+    source_ok = source_result.returncode == 0
+    ffmpeg_ok = ffmpeg_result.returncode == 0 and os.path.exists(output_wav_path) and os.path.getsize(output_wav_path) > 0
+    if not source_ok:
+        logging.error(f"Source command failed with return code {source_result.returncode}: {source_result.stderr.strip()}")
+    if not ffmpeg_ok:
+        logging.error(f"ffmpeg streaming conversion failed or produced no output (return code {ffmpeg_result.returncode}): {ffmpeg_result.stderr.strip()}")
+    if not (source_ok and ffmpeg_ok) and os.path.exists(output_wav_path):
+        try:
+            os.remove(output_wav_path)
+        except OSError as e_remove:
+            logging.warning(f"Could not remove incomplete output file {output_wav_path}: {e_remove}")
+    return source_ok, ffmpeg_ok
+
+# --- Voice activity detection / silence trimming --- #
+
+VAD_FRAME_MS = 30
+# Frame levels are computed and PCM is copied in blocks of this many frames / samples, so memory use
+# does not grow with the length of the audio (a 3-hour track is ~345MB of int16 samples)
+VAD_LEVEL_BLOCK_FRAMES = 2000
+PCM_COPY_BLOCK_SAMPLES = 1 << 20
+
+# One kept stretch of audio: (start in trimmed audio ms, start in original audio ms, duration ms)
+OffsetMapEntry = Tuple[int, int, int]
+
+class AsrAudioPart(NamedTuple):
+    """An audio file to upload for ASR, with the offset map from its timeline onto the original audio."""
+    path: str
+    offset_map: List[OffsetMapEntry]
+    duration_seconds: float
+
+def open_pcm_wav_samples(wav_path: str) -> np.memmap:
+    """
+    Memory-maps the samples of a 16kHz mono 16-bit PCM WAV file (as written for the 'pcm' codec)
+    without reading them into memory.
+
+    Raises:
+        ValueError: If the file is not a 16kHz mono 16-bit PCM WAV file.
+    """
+    with open(wav_path, 'rb') as wav_file:
+        riff_header = wav_file.read(12)
+        if len(riff_header) < 12 or riff_header[:4] != b'RIFF' or riff_header[8:12] != b'WAVE':
+            raise ValueError(f"Not a WAV file: {wav_path}")
+        format_ok = False
+        while True:
+            chunk_header = wav_file.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"WAV file has no data chunk: {wav_path}")
+            chunk_id = chunk_header[:4]
+            chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = wav_file.read(chunk_size)
+                audio_format, channels, sample_rate = struct.unpack('<HHI', fmt[:8])
+                bits_per_sample = struct.unpack('<H', fmt[14:16])[0]
+                # 0xFFFE is WAVE_FORMAT_EXTENSIBLE, which ffmpeg may write for plain PCM
+                format_ok = (audio_format in (1, 0xFFFE) and channels == 1
+                             and sample_rate == ASR_SAMPLE_RATE and bits_per_sample == 16)
+                wav_file.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if not format_ok:
+                    raise ValueError(f"Expected 16kHz mono 16-bit PCM WAV: {wav_path}")
+                data_offset = wav_file.tell()
+                # The size field can be wrong (e.g. 0xFFFFFFFF) if the writer could not seek back to fix it
+                data_bytes = min(chunk_size, os.path.getsize(wav_path) - data_offset)
+                break
+            else:
+                wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    if data_bytes < 2:
+        return np.zeros(0, dtype='<i2')
+    return np.memmap(wav_path, dtype='<i2', mode='r', offset=data_offset, shape=(data_bytes // 2,))
+
+def compute_frame_levels_db(samples: np.ndarray, frame_len: int,
+                            block_frames: int = VAD_LEVEL_BLOCK_FRAMES) -> np.ndarray:
+    """
+    Returns the RMS level (dBFS) of each complete frame of frame_len int16 samples, processing
+    block_frames frames at a time so a memory-mapped input is never copied as a whole.
+    """
+    frame_count = len(samples) // frame_len
+    level_db = np.empty(frame_count, dtype=np.float32)
+    for first_frame in range(0, frame_count, block_frames):
+        last_frame = min(first_frame + block_frames, frame_count)
+        block = np.asarray(samples[first_frame * frame_len:last_frame * frame_len], dtype=np.float32)
+        frames = block.reshape(last_frame - first_frame, frame_len) / 32768.0
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        level_db[first_frame:last_frame] = 20.0 * np.log10(np.maximum(rms, 1e-10))
+    return level_db
+
+def detect_speech_intervals(level_db: np.ndarray,
+                            total_samples: int,
+                            sample_rate: int = ASR_SAMPLE_RATE,
+                            silence_threshold_db: float = -45.0,
+                            min_silence_ms: int = 1500,
+                            padding_ms: int = 300) -> List[Tuple[int, int]]:
+    """
+    Finds the stretches of audio to keep using frame-energy voice activity detection.
+
+    The signal is split into VAD_FRAME_MS frames; a frame is silent when its RMS level is below
+    silence_threshold_db (dBFS). Only silent runs of at least min_silence_ms are removed, and
+    padding_ms of the silence is kept on each side so word onsets and tails are not clipped.
+
+    Args:
+        level_db (np.ndarray): Level of each complete VAD_FRAME_MS frame, from compute_frame_levels_db.
+        total_samples (int): Number of samples in the audio (including a trailing partial frame).
+        sample_rate (int): Sample rate of the samples.
+        silence_threshold_db (float): Frame level (dBFS) below which a frame counts as silence.
+        min_silence_ms (int): Minimum silence length worth removing.
+        padding_ms (int): Silence kept next to speech on each side of a removed run.
+
+    Returns:
+        List[Tuple[int, int]]: Sorted, non-overlapping [start, end) sample ranges to keep.
+    """
+    frame_len = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    frame_count = len(level_db)
+    if frame_count == 0:
+        return [(0, total_samples)] if total_samples else []
+
+    silent = level_db < silence_threshold_db
+    # A trailing partial frame is treated like its predecessor
+    silent = np.append(silent, silent[-1])
+    frame_bounds = [min(i * frame_len, total_samples) for i in range(frame_count + 1)] + [total_samples]
+
+    # Start/end frame indices of each silent run
+    padded = np.concatenate(([False], silent, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    run_starts, run_ends = changes[0::2], changes[1::2]
+
+    min_silence_frames = max(1, min_silence_ms // VAD_FRAME_MS)
+    padding_samples = sample_rate * padding_ms // 1000
+    keep: List[Tuple[int, int]] = []
+    cursor = 0
+    for run_start, run_end in zip(run_starts, run_ends):
+        if run_end - run_start < min_silence_frames:
+            continue
+        cut_start = frame_bounds[run_start] + (padding_samples if run_start > 0 else 0)
+        cut_end = frame_bounds[run_end] - (padding_samples if run_end < len(silent) else 0)
+        if cut_end <= cut_start:
+            continue
+        if cut_start > cursor:
+            keep.append((cursor, cut_start))
+        cursor = cut_end
+    if cursor < total_samples:
+        keep.append((cursor, total_samples))
+    return keep
+
+def _build_offset_map(stretches: List[Tuple[int, int]]) -> List[OffsetMapEntry]:
+    """Offset map for audio made of the given [start, end) sample ranges of the original, in order."""
+    offset_map: List[OffsetMapEntry] = []
+    output_cursor = 0
+    for start, end in stretches:
+        offset_map.append((
+            output_cursor * 1000 // ASR_SAMPLE_RATE,
+            start * 1000 // ASR_SAMPLE_RATE,
+            (end - start) * 1000 // ASR_SAMPLE_RATE
+        ))
+        output_cursor += end - start
+    return offset_map
+
+def encode_pcm_stretches(samples: np.ndarray, stretches: List[Tuple[int, int]], output_path: str,
+                         audio_codec: str, audio_bitrate: Optional[str], scratch_pcm_path: str,
+                         process_registry: Optional[ProcessRegistry] = None) -> bool:
+    """
+    Writes the given [start, end) sample ranges of 16kHz mono int16 samples, back to back, as an ASR
+    upload file: WAV directly for 'pcm', otherwise one ffmpeg encode from a scratch raw PCM file
+    (removed afterwards). Samples are copied in blocks. A failed output file is removed.
+    """
+    def copy_stretches(write) -> None:
+        for start, end in stretches:
+            for block_start in range(start, end, PCM_COPY_BLOCK_SAMPLES):
+                write(np.asarray(samples[block_start:min(block_start + PCM_COPY_BLOCK_SAMPLES, end)], dtype='<i2').tobytes())
+
+    if audio_codec == 'pcm':
+        with wave.open(output_path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(ASR_SAMPLE_RATE)
+            copy_stretches(wav_file.writeframesraw)
+        return True
+    try:
+        with open(scratch_pcm_path, 'wb') as scratch_file:
+            copy_stretches(scratch_file.write)
+        command = build_asr_ffmpeg_command(scratch_pcm_path, output_path, audio_codec, audio_bitrate, raw_pcm_input=True)
+        result = run_process(command, process_registry)
+    finally:
+        if os.path.exists(scratch_pcm_path):
+            os.remove(scratch_pcm_path)
+    if result.returncode != 0:
+        logging.error(f"ffmpeg encoding of {output_path} failed with return code {result.returncode}: {result.stderr.strip()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    return True
+
+def choose_chunk_cuts(level_db: np.ndarray,
+                      keep_intervals: List[Tuple[int, int]],
+                      target_chunk_seconds: int = 900,
+                      search_window_seconds: int = 60) -> List[int]:
+    """
+    Picks the cut points for splitting audio into chunks of roughly target_chunk_seconds of kept audio.
+    Each cut is placed at the quietest VAD frame within search_window_seconds of the nominal cut point,
+    so words are not split across chunks. The remainder is merged into the last chunk once it would be
+    shorter than half a chunk.
+
+    Args:
+        level_db (np.ndarray): Frame levels of the original audio, from compute_frame_levels_db.
+        keep_intervals (List[Tuple[int, int]]): Kept [start, end) sample ranges (from detect_speech_intervals,
+                                                or the whole audio when nothing is trimmed).
+        target_chunk_seconds (int): Nominal chunk length, counted in kept audio.
+        search_window_seconds (int): How far (each side) from the nominal cut point to look for silence.
+
+    Returns:
+        List[int]: Cut positions in original samples, starting with the start of the first kept stretch
+        and ending with the end of the last one.
+    """
+    frame_len = ASR_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    kept_starts: List[int] = []  # position of each kept stretch within the kept audio
+    kept_total = 0
+    for start, end in keep_intervals:
+        kept_starts.append(kept_total)
+        kept_total += end - start
+
+    def kept_to_original(kept_position: int) -> int:
+        index = max(0, bisect.bisect_right(kept_starts, kept_position) - 1)
+        start, end = keep_intervals[index]
+        return min(start + kept_position - kept_starts[index], end)
+
+    def original_to_kept(original_position: int) -> int:
+        index = bisect.bisect_right([start for start, _ in keep_intervals], original_position) - 1
+        if index < 0:
+            return 0
+        start, end = keep_intervals[index]
+        return kept_starts[index] + min(original_position, end) - start
+
+    chunk_samples = target_chunk_seconds * ASR_SAMPLE_RATE
+    window_frames = search_window_seconds * 1000 // VAD_FRAME_MS
+    cut_points = [keep_intervals[0][0]]
+    nominal_kept_cut = chunk_samples
+    while kept_total - nominal_kept_cut > chunk_samples // 2:
+        nominal_frame = kept_to_original(nominal_kept_cut) // frame_len
+        first_frame = max(nominal_frame - window_frames, cut_points[-1] // frame_len + 1)
+        last_frame = min(nominal_frame + window_frames, len(level_db) - 1)
+        if first_frame <= last_frame:
+            quietest_frame = first_frame + int(np.argmin(level_db[first_frame:last_frame + 1]))
+            cut = quietest_frame * frame_len + frame_len // 2
+        else:
+            cut = kept_to_original(nominal_kept_cut)
+        cut_points.append(cut)
+        nominal_kept_cut = original_to_kept(cut) + chunk_samples
+    cut_points.append(keep_intervals[-1][1])
+    return cut_points
+
+def prepare_asr_upload_audio(pcm_wav_path: str,
+                             output_folder: str,
+                             output_filename_no_ext: str,
+                             audio_codec: str = DEFAULT_ASR_AUDIO_CODEC,
+                             audio_bitrate: Optional[str] = None,
+                             vad_enabled: bool = True,
+                             silence_threshold_db: float = -45.0,
+                             min_silence_ms: int = 1500,
+                             padding_ms: int = 300,
+                             min_saving_ratio: float = 0.05,
+                             chunking_enabled: bool = False,
+                             target_chunk_seconds: int = 900,
+                             min_chunked_seconds: int = 1800,
+                             search_window_seconds: int = 60,
+                             process_registry: Optional[ProcessRegistry] = None) -> List[AsrAudioPart] | None:
+    """
+    Prepares the ASR upload files from the extracted 16kHz PCM: optionally cuts long silent stretches (VAD)
+    and splits long audio into chunks at quiet points, then encodes each file with the upload codec in a
+    single step (the audio is compressed only once). The WAV is memory-mapped and processed in blocks.
+
+    Args:
+        pcm_wav_path (str): The extracted 16kHz mono 16-bit PCM WAV file (codec 'pcm').
+        output_folder (str): Where the upload files are written.
+        output_filename_no_ext (str): Base name of the upload files (chunks are suffixed with their index;
+                                      the extension follows the codec).
+        audio_codec (str): Upload codec, one of ASR_AUDIO_CODECS.
+        audio_bitrate (str, optional): Bitrate for compressed codecs, e.g. '32k'.
+        vad_enabled (bool): Cut long silent stretches.
+        silence_threshold_db, min_silence_ms, padding_ms: See detect_speech_intervals.
+        min_saving_ratio (float): Keep the whole audio when less than this fraction would be removed.
+        chunking_enabled (bool): Split long audio into chunks to be transcribed as independent ASR tasks.
+        target_chunk_seconds, search_window_seconds: See choose_chunk_cuts.
+        min_chunked_seconds (int): Audio (after trimming) shorter than this is not split.
+        process_registry (ProcessRegistry, optional): Registers the ffmpeg processes for cancellation.
+
+    Returns:
+        List[AsrAudioPart] | None: The upload files in timeline order (one unless the audio was split),
+        each with its offset map for remap_asr_timestamp_ms and its duration, or None if the audio
+        is empty or encoding fails.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    extension = asr_audio_extension(audio_codec)
+    scratch_pcm_path = os.path.join(output_folder, f"{output_filename_no_ext}_scratch.pcm")
+    written_paths: List[str] = []
+    try:
+        samples = open_pcm_wav_samples(pcm_wav_path)
+        total_samples = len(samples)
+        if total_samples == 0:
+            logging.warning(f"Extracted audio is empty: {pcm_wav_path}")
+            return None
+
+        level_db = compute_frame_levels_db(samples, ASR_SAMPLE_RATE * VAD_FRAME_MS // 1000)
+        keep_intervals = [(0, total_samples)]
+        if vad_enabled:
+            speech_intervals = detect_speech_intervals(level_db, total_samples, ASR_SAMPLE_RATE,
+                                                       silence_threshold_db, min_silence_ms, padding_ms)
+            kept_samples = sum(end - start for start, end in speech_intervals)
+            removed_ratio = 1.0 - kept_samples / total_samples
+            logging.info(f"VAD: keeping {len(speech_intervals)} stretches, removing {removed_ratio:.1%} of {total_samples / ASR_SAMPLE_RATE:.1f}s")
+            if kept_samples > 0 and removed_ratio >= min_saving_ratio:
+                keep_intervals = speech_intervals
+        kept_samples = sum(end - start for start, end in keep_intervals)
+
+        # Each part is the kept stretches between two cut points
+        part_stretches = [keep_intervals]
+        if (chunking_enabled and kept_samples >= min_chunked_seconds * ASR_SAMPLE_RATE
+                and kept_samples >= 2 * target_chunk_seconds * ASR_SAMPLE_RATE):
+            cut_points = choose_chunk_cuts(level_db, keep_intervals, target_chunk_seconds, search_window_seconds)
+            part_stretches = []
+            for cut_start, cut_end in zip(cut_points[:-1], cut_points[1:]):
+                stretches = [(max(start, cut_start), min(end, cut_end)) for start, end in keep_intervals
+                             if start < cut_end and end > cut_start]
+                if stretches:
+                    part_stretches.append(stretches)
+
+        parts: List[AsrAudioPart] = []
+        for index, stretches in enumerate(part_stretches):
+            part_name = f"{output_filename_no_ext}_{index:03d}" if len(part_stretches) > 1 else output_filename_no_ext
+            output_path = os.path.join(output_folder, f"{part_name}{extension}")
+            written_paths.append(output_path)
+            if not encode_pcm_stretches(samples, stretches, output_path, audio_codec, audio_bitrate,
+                                        scratch_pcm_path, process_registry):
+                return None
+            part_samples = sum(end - start for start, end in stretches)
+            parts.append(AsrAudioPart(output_path, _build_offset_map(stretches), part_samples / ASR_SAMPLE_RATE))
+        if len(parts) > 1:
+            logging.info(f"Split {kept_samples / ASR_SAMPLE_RATE:.1f}s of audio into {len(parts)} chunks: {pcm_wav_path}")
+        written_paths = []  # success: keep the upload files
+        return parts
+    except Exception as e:
+        logging.error(f"Preparing ASR upload audio failed for {pcm_wav_path}: {e}")
+        return None
+    finally:
+        for written_path in written_paths:
+            if os.path.exists(written_path):
+                os.remove(written_path)
+
+def remap_asr_timestamp_ms(timestamp_ms: int, offset_map: List[OffsetMapEntry], is_end: bool = False) -> int:
+    """
+    Maps a timestamp in the trimmed audio back onto the original timeline.
+
+    Args:
+        timestamp_ms (int): Time in the trimmed audio (e.g. an LFASR 'bg' or 'ed' value).
+        offset_map (List[OffsetMapEntry]): The offset map of an AsrAudioPart from prepare_asr_upload_audio.
+        is_end (bool): Treat the timestamp as a segment end, so a value exactly on a cut boundary
+                       maps to the end of the preceding stretch instead of the start of the next one.
+
+    Returns:
+        int: Time in the original audio, in milliseconds.
+    """
+    if not offset_map:
+        return timestamp_ms
+    trimmed_starts = [entry[0] for entry in offset_map]
+    if is_end:
+        index = bisect.bisect_left(trimmed_starts, timestamp_ms) - 1
+    else:
+        index = bisect.bisect_right(trimmed_starts, timestamp_ms) - 1
+    index = max(0, index)
+    trimmed_start, original_start, duration = offset_map[index]
+    return original_start + min(max(timestamp_ms - trimmed_start, 0), duration)
+
 if __name__ == '__main__':
     logging.info("--- Running exAudio.py Test (ffmpeg version) ---")
     logging.info("IMPORTANT: This test requires ffmpeg to be installed and accessible in your system PATH.")
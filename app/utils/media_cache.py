@@ -0,0 +1,206 @@
+"""
+ 磁盘媒体缓存
+
+ 在共享目录中按 B站 BV号+分P 缓存下载得到的压缩音频和转码后的ASR音频，重试或重复提交同一视频时
+ 跳过下载与转码。缓存有字节预算，超出时按最近访问时间（LRU）淘汰。
+
+ 并发安全：
+ - 写入先落到缓存目录内的临时文件，再通过 os.replace 原子改名，读者不会看到半写的文件；
+ - 读取时把缓存文件硬链接（跨设备时复制）到会话自己的临时目录，之后即使条目被淘汰也不受影响；
+ - 写入与淘汰在目录锁（POSIX上为 fcntl.flock，可跨进程）内串行执行。
+"""
+import functools
+import glob
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from app.core.config import get_settings
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台仅保证进程内互斥
+    fcntl = None
+
+# 缓存条目类型
+MEDIA_KIND_SOURCE_AUDIO = "source" # yt-dlp 下载的原始（压缩）音频/媒体文件
+MEDIA_KIND_ASR_WAV = "asr_wav" # 转码后的ASR音频（16kHz单声道PCM WAV）
+
+_LOCK_FILE_NAME = ".lock"
+_TEMP_PREFIX = ".tmp-"
+
+def asr_audio_kind(audio_codec: str, audio_bitrate: Optional[str] = None) -> str:
+    """
+     ASR音频条目的类型名，编码格式/码率不同的转码结果互不混用
+
+     @param audio_codec ASR音频编码（"pcm"、"mp3"、"opus"）
+     @param audio_bitrate 压缩编码的码率（如 "32k"），PCM忽略
+     @return 条目类型
+    """
+    if audio_codec == "pcm":
+        return MEDIA_KIND_ASR_WAV
+    return f"asr_{audio_codec}_{audio_bitrate or 'default'}"
+
+class MediaCache:
+    """
+     按视频缓存媒体文件的磁盘LRU缓存
+
+     @param cache_dir 缓存目录（多个工作进程可共享）
+     @param max_bytes 缓存总字节预算
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._thread_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, cache_key: str, kind: str, dest_dir: str, dest_name_no_ext: str) -> Optional[str]:
+        """
+         查找缓存条目，命中时将其链接/复制到调用方目录
+
+         @param cache_key 视频缓存键（如 "BV1GF411p722:p2"）
+         @param kind 条目类型（MEDIA_KIND_*）
+         @param dest_dir 目标目录（通常是会话临时目录）
+         @param dest_name_no_ext 目标文件名（不含扩展名，扩展名沿用缓存条目）
+         @return 目标文件路径；未命中时返回None
+        """
+        for entry_path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{glob.escape(self._entry_stem(cache_key, kind))}.*")):
+            extension = os.path.splitext(entry_path)[1]
+            dest_path = os.path.join(dest_dir, f"{dest_name_no_ext}{extension}")
+            try:
+                os.makedirs(dest_dir, exist_ok=True)
+                _link_or_copy(entry_path, dest_path)
+                # 更新访问时间，作为LRU排序依据
+                os.utime(entry_path)
+            except FileNotFoundError:
+                # 条目恰好被其他工作进程淘汰
+                continue
+            except OSError as e:
+                print(f"错误: 媒体缓存 {cache_key}/{kind}: 读取缓存文件 {entry_path} 失败: {e}")
+                continue
+            print(f"媒体缓存命中: {cache_key}/{kind} -> {dest_path}")
+            return dest_path
+        return None
+
+    def store(self, cache_key: str, kind: str, source_path: str) -> bool:
+        """
+         把文件写入缓存（原子改名），然后按预算淘汰最久未访问的条目。失败只记录日志。
+
+         @param cache_key 视频缓存键
+         @param kind 条目类型（MEDIA_KIND_*）
+         @param source_path 要缓存的文件路径（文件本身保持不变）
+         @return 是否已写入缓存
+        """
+        try:
+            file_size = os.path.getsize(source_path)
+        except OSError as e:
+            print(f"错误: 媒体缓存 {cache_key}/{kind}: 无法读取待缓存文件 {source_path}: {e}")
+            return False
+        if file_size == 0 or file_size > self.max_bytes:
+            print(f"媒体缓存 {cache_key}/{kind}: 文件大小 {file_size} 字节不适合缓存（预算 {self.max_bytes} 字节），跳过。")
+            return False
+
+        stem = self._entry_stem(cache_key, kind)
+        entry_path = os.path.join(self.cache_dir, f"{stem}{os.path.splitext(source_path)[1]}")
+        temp_path = os.path.join(self.cache_dir, f"{_TEMP_PREFIX}{uuid.uuid4().hex}")
+        try:
+            _link_or_copy(source_path, temp_path)
+            with self._locked():
+                # 同一条目只保留一个扩展名
+                for stale_path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{glob.escape(stem)}.*")):
+                    if stale_path != entry_path:
+                        _remove_quietly(stale_path)
+                os.replace(temp_path, entry_path)
+                self._evict_locked(keep_path=entry_path)
+        except OSError as e:
+            print(f"错误: 媒体缓存 {cache_key}/{kind}: 写入缓存失败: {e}")
+            _remove_quietly(temp_path)
+            return False
+        print(f"媒体缓存 {cache_key}/{kind}: 已缓存 {file_size} 字节。")
+        return True
+
+    def _evict_locked(self, keep_path: Optional[str] = None) -> None:
+        entries = self._list_entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        # 最久未访问的在前
+        for entry_path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total_bytes <= self.max_bytes:
+                break
+            if entry_path == keep_path:
+                continue
+            _remove_quietly(entry_path)
+            total_bytes -= size
+            print(f"媒体缓存: 已淘汰 {os.path.basename(entry_path)}（{size} 字节）。")
+
+    def _list_entries(self) -> List[Tuple[str, int, float]]:
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name == _LOCK_FILE_NAME:
+                continue
+            if name.startswith(_TEMP_PREFIX):
+                # 崩溃的写入者遗留的临时文件，超过一小时后清理
+                if now - stat_result.st_mtime > 3600:
+                    _remove_quietly(path)
+                continue
+            entries.append((path, stat_result.st_size, stat_result.st_mtime))
+        return entries
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, _LOCK_FILE_NAME), "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _entry_stem(cache_key: str, kind: str) -> str:
+        safe_key = "".join(ch if ch.isalnum() else "_" for ch in cache_key)
+        return f"{safe_key}__{kind}"
+
+def _link_or_copy(source_path: str, dest_path: str) -> None:
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        # 跨文件系统或不支持硬链接时退回复制
+        shutil.copyfile(source_path, dest_path)
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"错误: 媒体缓存: 删除 {path} 失败: {e}")
+
+@functools.lru_cache()
+def get_media_cache() -> Optional[MediaCache]:
+    """
+     获取进程内共享的媒体缓存实例
+
+     @return 媒体缓存；MEDIA_CACHE_ENABLED 为False或缓存目录不可用时返回None
+    """
+    settings = get_settings()
+    if not settings.MEDIA_CACHE_ENABLED:
+        return None
+    try:
+        return MediaCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"错误: 无法创建媒体缓存目录 {settings.MEDIA_CACHE_DIR}，媒体缓存已禁用: {e}")
+        return None
@@ -0,0 +1,236 @@
+"""
+ 外部进程运行工具
+
+ 统一启动 yt-dlp / ffmpeg 等子进程。调用方可以传入进程登记器（例如会话的取消令牌），
+ 子进程启动后会被登记，以便在会话取消时被终止。
+ 异步接口（run_process_async / run_piped_processes）直接在事件循环中逐行读取输出、解析进度并执行超时，
+ 不占用线程；所在任务被取消（会话取消）时子进程组被强制终止。
+"""
+import asyncio
+import collections
+import os
+import signal
+import subprocess
+from typing import Callable, Deque, List, Optional, Protocol, Tuple
+
+# 逐行处理子进程输出的回调（如进度解析），参数为去掉换行符的文本行
+OutputLineHandler = Callable[[str], None]
+
+# 异步运行时每个输出流保留的末尾行数，用于错误日志；完整输出不在内存中累积
+OUTPUT_TAIL_LINES = 200
+
+class ProcessRegistry(Protocol):
+    """可登记/注销子进程的对象（如 app.services.cancellation.CancellationToken）。"""
+
+    def register_process(self, process: subprocess.Popen) -> None: ...
+
+    def unregister_process(self, process: subprocess.Popen) -> None: ...
+
+def run_process(
+    command: List[str],
+    process_registry: Optional[ProcessRegistry] = None
+) -> subprocess.CompletedProcess:
+    """
+     同步运行子进程并收集输出（与 subprocess.run(capture_output=True, text=True, check=False) 等价）
+
+     @param command 命令及参数列表
+     @param process_registry 进程登记器（可选），子进程运行期间处于登记状态
+     @return 运行结果
+     @raise FileNotFoundError 如果命令不存在
+    """
+    # 在POSIX上放入独立进程组，终止时连同其子进程（如yt-dlp调起的ffmpeg）一起结束
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        start_new_session=(os.name == "posix")
+    )
+    if process_registry is not None:
+        process_registry.register_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    except BaseException:
+        kill_process_tree(process)
+        process.communicate()
+        raise
+    finally:
+        if process_registry is not None:
+            process_registry.unregister_process(process)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+def kill_process_tree(process: subprocess.Popen) -> None:
+    """
+     强制终止子进程及其进程组（POSIX），已退出的进程忽略
+
+     @param process 由 run_process 启动的子进程
+    """
+    if process.poll() is not None:
+        return
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    process.kill()
+
+async def run_process_async(
+    command: List[str],
+    timeout_seconds: Optional[float] = None,
+    line_handler: Optional[OutputLineHandler] = None
+) -> subprocess.CompletedProcess:
+    """
+     在事件循环中运行子进程，逐行读取stdout/stderr（回车符也视为行结束，兼容进度条的原地刷新）
+
+     每一行交给 line_handler（如 yt-dlp --newline 或 ffmpeg -progress pipe:1 的进度解析），
+     每个流只保留末尾 OUTPUT_TAIL_LINES 行作为结果中的输出文本。
+     超时或所在任务被取消时，子进程组被强制终止。
+
+     @param command 命令及参数列表
+     @param timeout_seconds 总运行时间上限（秒），为空或小于等于0表示不限制
+     @param line_handler 输出行回调（可选），stdout与stderr的行都会传入
+     @return 运行结果，stdout/stderr为各自末尾若干行的文本
+     @raise FileNotFoundError 如果命令不存在
+     @raise subprocess.TimeoutExpired 如果超过运行时间上限
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=(os.name == "posix")
+    )
+    stdout_tail: Deque[str] = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    stderr_tail: Deque[str] = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    try:
+        await _wait_with_timeout(
+            asyncio.gather(
+                _read_lines(process.stdout, stdout_tail, line_handler),
+                _read_lines(process.stderr, stderr_tail, line_handler),
+                process.wait()
+            ),
+            command,
+            timeout_seconds
+        )
+    except BaseException:
+        _kill_async_process_tree(process)
+        await process.wait()
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, "\n".join(stdout_tail), "\n".join(stderr_tail))
+
+async def run_piped_processes(
+    producer_command: List[str],
+    consumer_command: List[str],
+    timeout_seconds: Optional[float] = None,
+    producer_stderr_handler: Optional[OutputLineHandler] = None
+) -> Tuple[subprocess.CompletedProcess, subprocess.CompletedProcess]:
+    """
+     并行运行两个子进程，生产者的stdout通过操作系统管道直接接到消费者的stdin（如 yt-dlp -o - | ffmpeg -i pipe:0）
+
+     数据不经过Python进程也不落盘。两个进程的stderr被逐行读取（只保留末尾若干行），stdout（消费者）也一并返回。
+     如果超时或所在任务被取消（例如会话取消），两个进程组都会被强制终止。
+
+     @param producer_command 生产者命令及参数列表
+     @param consumer_command 消费者命令及参数列表
+     @param timeout_seconds 总运行时间上限（秒），为空或小于等于0表示不限制
+     @param producer_stderr_handler 生产者stderr的逐行回调（可选，如 yt-dlp 的下载进度）
+     @return (生产者运行结果, 消费者运行结果)，stdout/stderr为文本
+     @raise FileNotFoundError 如果命令不存在
+     @raise subprocess.TimeoutExpired 如果超过运行时间上限
+    """
+    read_fd, write_fd = os.pipe()
+    start_new_session = os.name == "posix"
+    processes: List[asyncio.subprocess.Process] = []
+    try:
+        try:
+            consumer = await asyncio.create_subprocess_exec(
+                *consumer_command, stdin=read_fd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=start_new_session
+            )
+            processes.append(consumer)
+            producer = await asyncio.create_subprocess_exec(
+                *producer_command, stdin=subprocess.DEVNULL, stdout=write_fd, stderr=subprocess.PIPE,
+                start_new_session=start_new_session
+            )
+            processes.append(producer)
+        finally:
+            # 父进程不持有管道两端，生产者退出后消费者才能读到EOF，消费者退出后生产者会收到SIGPIPE
+            os.close(read_fd)
+            os.close(write_fd)
+        producer_stderr: Deque[str] = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        consumer_stdout: Deque[str] = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        consumer_stderr: Deque[str] = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        await _wait_with_timeout(
+            asyncio.gather(
+                _read_lines(producer.stderr, producer_stderr, producer_stderr_handler),
+                _read_lines(consumer.stdout, consumer_stdout),
+                _read_lines(consumer.stderr, consumer_stderr),
+                producer.wait(),
+                consumer.wait()
+            ),
+            producer_command + ["|"] + consumer_command,
+            timeout_seconds
+        )
+    except BaseException:
+        for process in processes:
+            _kill_async_process_tree(process)
+        for process in processes:
+            await process.wait()
+        raise
+    return (
+        subprocess.CompletedProcess(producer_command, producer.returncode, None, "\n".join(producer_stderr)),
+        subprocess.CompletedProcess(consumer_command, consumer.returncode, "\n".join(consumer_stdout), "\n".join(consumer_stderr)),
+    )
+
+async def _wait_with_timeout(awaitable, command: List[str], timeout_seconds: Optional[float]) -> None:
+    if not timeout_seconds or timeout_seconds <= 0:
+        await awaitable
+        return
+    try:
+        await asyncio.wait_for(awaitable, timeout=timeout_seconds)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(command, timeout_seconds) from None
+
+async def _read_lines(
+    stream: Optional[asyncio.StreamReader],
+    tail: Deque[str],
+    line_handler: Optional[OutputLineHandler] = None
+) -> None:
+    if stream is None:
+        return
+    pending = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        # 进度条用回车符原地刷新，按回车符和换行符同时分行
+        lines = (pending + chunk).replace(b"\r", b"\n").split(b"\n")
+        pending = lines.pop()
+        for raw_line in lines:
+            _handle_line(raw_line, tail, line_handler)
+        if len(pending) > 65536:
+            # 没有换行的超长输出（如二进制数据）只保留末尾
+            pending = pending[-65536:]
+    if pending:
+        _handle_line(pending, tail, line_handler)
+
+def _handle_line(raw_line: bytes, tail: Deque[str], line_handler: Optional[OutputLineHandler]) -> None:
+    line = raw_line.decode("utf-8", errors="replace").strip()
+    if not line:
+        return
+    tail.append(line)
+    if line_handler is not None:
+        try:
+            line_handler(line)
+        except Exception as e:
+            # 进度回调出错不影响子进程本身
+            print(f"错误: 处理子进程输出行失败: {e}")
+
+def _kill_async_process_tree(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,78 @@
+"""
+ 子进程进度解析
+
+ 把 yt-dlp（--newline）和 ffmpeg（-progress pipe:1）的输出行解析为完成百分比，
+ 配合 process_runner 的逐行回调使用。
+"""
+import re
+from typing import Callable, Optional
+
+# 百分比回调，参数范围 0~100
+ProgressCallback = Callable[[float], None]
+
+_YT_DLP_PERCENT_RE = re.compile(r"^\[download\]\s+(\d+(?:\.\d+)?)%")
+_FFMPEG_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+def parse_yt_dlp_progress(line: str) -> Optional[float]:
+    """
+     解析 yt-dlp 的下载进度行，例如 "[download]  42.3% of ~ 12.34MiB at 1.2MiB/s ETA 00:10"
+
+     @param line 输出行
+     @return 完成百分比；不是进度行时返回None
+    """
+    match = _YT_DLP_PERCENT_RE.match(line)
+    if match is None:
+        return None
+    return min(100.0, float(match.group(1)))
+
+class FfmpegProgressParser:
+    """
+     ffmpeg 进度解析器（有状态）
+
+     总时长来自调用方（已知时）或 stderr 中输入信息的 "Duration: HH:MM:SS.xx" 行，
+     已处理时长来自 -progress 输出的 out_time_us / out_time_ms 键（两者单位均为微秒），"progress=end" 表示完成。
+
+     @param total_duration_seconds 输入总时长（秒），未知时为空
+    """
+
+    def __init__(self, total_duration_seconds: Optional[float] = None):
+        self.total_duration_seconds = total_duration_seconds
+
+    def __call__(self, line: str) -> Optional[float]:
+        """
+         解析一行输出
+
+         @param line 输出行
+         @return 完成百分比；不是进度行或总时长未知时返回None
+        """
+        if line == "progress=end":
+            return 100.0
+        if line.startswith(("out_time_us=", "out_time_ms=")):
+            if not self.total_duration_seconds:
+                return None
+            try:
+                processed_seconds = int(line.split("=", 1)[1]) / 1_000_000
+            except ValueError:
+                # 开始阶段可能输出 "N/A"
+                return None
+            return max(0.0, min(100.0, processed_seconds * 100.0 / self.total_duration_seconds))
+        if self.total_duration_seconds is None:
+            match = _FFMPEG_DURATION_RE.search(line)
+            if match is not None:
+                hours, minutes, seconds = match.groups()
+                self.total_duration_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        return None
+
+def progress_line_handler(parser: Callable[[str], Optional[float]], callback: ProgressCallback) -> Callable[[str], None]:
+    """
+     把进度解析器和百分比回调组合为 process_runner 的逐行回调
+
+     @param parser 行解析器（parse_yt_dlp_progress 或 FfmpegProgressParser 实例）
+     @param callback 百分比回调
+     @return 逐行回调
+    """
+    def handle_line(line: str) -> None:
+        percent = parser(line)
+        if percent is not None:
+            callback(percent)
+    return handle_line
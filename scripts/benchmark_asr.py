@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+ ASR阶段压测脚本
+
+ 对讯飞LFASR本地替身服务（scripts/lfasr_standin_server.py）逐级提高并发，测量ASR阶段的
+ 吞吐量、单任务耗时分布，以及进程的线程数和内存（RSS及其中的匿名内存）峰值。每个任务使用内容不同的合成音频，
+ 不会被进程内的同音频去重合并。
+
+ 示例：
+   python scripts/benchmark_asr.py --spawn-server --profile realistic --client both --concurrency 1,8,32
+
+ 未设置 DATABASE_URL 时每次运行使用新建临时目录中的SQLite数据库，结束时删除（异步客户端会写入 asr_tasks 表）。
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import shutil
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).parent.parent))
+
+SCRIPTS_DIR = Path(__file__).parent
+SAMPLE_INTERVAL_SECONDS = 0.05
+
+def current_memory_mb() -> Tuple[float, Optional[float]]:
+    """
+     读取当前进程的内存占用（MB）
+
+     @return (常驻内存, 其中的匿名内存)；匿名内存不含映射文件的页缓存（如上传时mmap的音频），
+             非Linux平台为 (历史峰值, None)
+    """
+    rss_mb, anon_mb = None, None
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+                elif line.startswith("RssAnon:"):
+                    anon_mb = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if rss_mb is None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    return rss_mb, anon_mb
+
+class ResourceSampler:
+    """
+     在后台线程中周期采样线程数和内存，记录峰值
+    """
+
+    def __init__(self):
+        self.peak_threads = 0
+        self.peak_rss_mb = 0.0
+        self.peak_anon_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="benchmark-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # 不计入采样线程自身
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            rss_mb, anon_mb = current_memory_mb()
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+            if anon_mb is not None:
+                self.peak_anon_mb = max(self.peak_anon_mb or 0.0, anon_mb)
+            self._stop.wait(SAMPLE_INTERVAL_SECONDS)
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def make_audio_files(directory: str, count: int, size_bytes: int) -> List[str]:
+    """
+     生成内容互不相同的合成音频文件（替身服务不解码音频，只需扩展名合法）
+
+     @param directory 输出目录
+     @param count 文件数量
+     @param size_bytes 每个文件的字节数
+     @return 文件路径列表
+    """
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"benchmark_{index:04d}.mp3")
+        with open(path, "wb") as audio_file:
+            remaining = size_bytes
+            while remaining > 0:
+                block = os.urandom(min(remaining, 1024 * 1024))
+                audio_file.write(block)
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+def fetch_server_stats(api_host: str) -> Optional[Dict[str, Any]]:
+    """
+     读取替身服务的计数器
+
+     @param api_host 替身服务的API地址（以 /api 结尾）
+     @return 统计信息；服务不可达时返回None
+    """
+    stats_url = api_host.rstrip("/").rsplit("/api", 1)[0] + "/stats"
+    try:
+        with urllib.request.urlopen(stats_url, timeout=5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+def start_standin_server(port: int, profile: str, seed: Optional[int]) -> subprocess.Popen:
+    """
+     在子进程中启动替身服务并等待其就绪
+
+     @param port 监听端口
+     @param profile 档位名称
+     @param seed 随机数种子（可选）
+     @return 子进程句柄
+    """
+    command = [sys.executable, str(SCRIPTS_DIR / "lfasr_standin_server.py"), "--port", str(port), "--profile", profile]
+    if seed is not None:
+        command += ["--seed", str(seed)]
+    server = subprocess.Popen(command)
+    api_host = f"http://127.0.0.1:{port}/api"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"替身服务启动失败，返回码 {server.returncode}")
+        if fetch_server_stats(api_host) is not None:
+            return server
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("等待替身服务就绪超时")
+
+def build_asr_service(client_mode: str, api_host: str, poll_min_interval: Optional[float]):
+    """
+     按当前配置创建ASR客户端，只替换接口地址、客户端模式和凭据
+
+     @param client_mode "async" 或 "thread"
+     @param api_host 替身服务的API地址
+     @param poll_min_interval 进度轮询最小间隔（秒，可选）
+     @return ASR服务实例
+    """
+    from app.core.config import get_settings
+    from app.services.asr.factory import get_asr_service
+
+    overrides: Dict[str, Any] = {
+        "XUNFEI_APPID": "benchmark",
+        "XUNFEI_SECRET_KEY": "benchmark",
+        "XUNFEI_API_HOST": api_host,
+        "XUNFEI_CLIENT_MODE": client_mode,
+    }
+    if poll_min_interval is not None:
+        overrides["XUNFEI_POLL_MIN_INTERVAL_SECONDS"] = poll_min_interval
+    return get_asr_service(get_settings().model_copy(update=overrides))
+
+async def run_level(asr_service, audio_paths: List[str], audio_seconds: float, concurrency: int,
+                    use_governor: bool) -> Dict[str, Any]:
+    """
+     以给定并发转写一组音频
+
+     @param asr_service ASR服务实例
+     @param audio_paths 音频文件列表（每个文件一个任务）
+     @param audio_seconds 传给客户端的音频时长（秒），决定轮询节奏
+     @param concurrency 同时进行的任务数
+     @param use_governor 是否同时经过资源调度器的讯飞槽位（XUNFEI_MAX_CONCURRENT_TASKS），与管道一致
+     @return 本级的测量结果
+    """
+    from app.services.resource_governor import XUNFEI, get_resource_governor
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def transcribe_one(audio_path: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            started_at = time.monotonic()
+            if use_governor and not asr_service.manages_provider_slots:
+                async with get_resource_governor().acquire(XUNFEI):
+                    result = await asr_service.transcribe(audio_path, audio_duration_seconds=audio_seconds)
+            else:
+                result = await asr_service.transcribe(audio_path, audio_duration_seconds=audio_seconds)
+            if result:
+                latencies.append(time.monotonic() - started_at)
+            else:
+                failures += 1
+
+    with ResourceSampler() as sampler:
+        started_at = time.monotonic()
+        await asyncio.gather(*(transcribe_one(path) for path in audio_paths))
+        wall_seconds = time.monotonic() - started_at
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "jobs": len(audio_paths),
+        "succeeded": len(latencies),
+        "failed": failures,
+        "wall_seconds": round(wall_seconds, 2),
+        "jobs_per_minute": round(len(latencies) * 60 / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+        "latency_p50": round(statistics.median(latencies), 2) if latencies else None,
+        "latency_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else None,
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(sampler.peak_rss_mb, 1),
+        "peak_anon_mb": round(sampler.peak_anon_mb, 1) if sampler.peak_anon_mb is not None else None,
+    }
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    """
+     依次对每种客户端、每个并发级别执行压测
+
+     @param args 命令行参数
+     @return 全部测量结果
+    """
+    from app.services.asr.task_poller import stop_asr_task_poller
+    from app.services.xunfei_async_asr_service import close_lfasr_http_client
+
+    from lfasr_standin_server import ASSUMED_AUDIO_BYTES_PER_SECOND
+
+    # 与替身服务生成结果时假定的码率一致
+    audio_seconds = args.audio_seconds or args.audio_mb * 1024 * 1024 / ASSUMED_AUDIO_BYTES_PER_SECOND
+    results = []
+    client_modes = ["async", "thread"] if args.client == "both" else [args.client]
+    with tempfile.TemporaryDirectory(prefix="asr_benchmark_") as audio_dir:
+        try:
+            for client_mode in client_modes:
+                asr_service = build_asr_service(client_mode, args.api_host, args.poll_min_interval)
+                for concurrency in args.concurrency:
+                    job_count = args.jobs_per_level or concurrency
+                    audio_paths = await asyncio.to_thread(
+                        make_audio_files, audio_dir, job_count, int(args.audio_mb * 1024 * 1024)
+                    )
+                    stats_before = fetch_server_stats(args.api_host)
+                    level = await run_level(asr_service, audio_paths, audio_seconds, concurrency, args.governor)
+                    stats_after = fetch_server_stats(args.api_host)
+                    level["client"] = client_mode
+                    if stats_before and stats_after:
+                        before, after = stats_before["counters"], stats_after["counters"]
+                        level["server_requests"] = sum(
+                            after.get(key, 0) - before.get(key, 0) for key in after if key.startswith("requests.")
+                        )
+                    results.append(level)
+                    print(json.dumps(level, ensure_ascii=False))
+        finally:
+            await stop_asr_task_poller()
+            await close_lfasr_http_client()
+    return results
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    """
+     以表格形式输出测量结果
+
+     @param results 测量结果列表
+    """
+    columns = ["client", "concurrency", "jobs", "succeeded", "failed", "wall_seconds", "jobs_per_minute",
+               "latency_p50", "latency_p95", "peak_threads", "peak_rss_mb", "peak_anon_mb", "server_requests"]
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in results:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
+
+def parse_args():
+    """
+     解析命令行参数
+
+     @return 解析后的参数
+    """
+    parser = argparse.ArgumentParser(description="对讯飞LFASR替身服务压测ASR阶段")
+    parser.add_argument("--api-host", type=str, default="http://127.0.0.1:8765/api",
+                        help="替身服务的API地址 (默认: http://127.0.0.1:8765/api)")
+    parser.add_argument("--spawn-server", action="store_true", help="在子进程中启动替身服务（端口取自 --api-host）")
+    parser.add_argument("--profile", type=str, default="fast", help="--spawn-server 时使用的档位 (默认: fast)")
+    parser.add_argument("--seed", type=int, default=None, help="--spawn-server 时的故障注入随机数种子")
+    parser.add_argument("--client", choices=["async", "thread", "both"], default="async", help="压测的客户端 (默认: async)")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 4, 16],
+                        help="逗号分隔的并发级别 (默认: 1,4,16)")
+    parser.add_argument("--jobs-per-level", type=int, default=None, help="每级的任务数 (默认: 等于并发数)")
+    parser.add_argument("--audio-mb", type=float, default=2.0, help="每个合成音频的大小（MB，默认: 2）")
+    parser.add_argument("--audio-seconds", type=float, default=None,
+                        help="传给客户端的音频时长（秒，默认按替身服务假定的码率由 --audio-mb 换算）")
+    parser.add_argument("--poll-min-interval", type=float, default=None,
+                        help="覆盖 XUNFEI_POLL_MIN_INTERVAL_SECONDS（替身处理耗时很短时可调小）")
+    parser.add_argument("--governor", action="store_true",
+                        help="每个任务先获取资源调度器的讯飞槽位（受 XUNFEI_MAX_CONCURRENT_TASKS 限制），与管道行为一致")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    db_dir = None
+    if not os.environ.get("DATABASE_URL"):
+        db_dir = tempfile.mkdtemp(prefix="asr_benchmark_db_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'asr_benchmark.db')}"
+    if not args.governor:
+        # 异步客户端自行获取讯飞槽位；不测调度器时放开上限，只由各级并发数限制
+        os.environ["XUNFEI_MAX_CONCURRENT_TASKS"] = str(max(args.concurrency))
+
+    server = None
+    try:
+        from app.db.init_db import init_db
+        init_db()
+
+        if args.spawn_server:
+            port = int(args.api_host.rstrip("/").rsplit(":", 1)[1].split("/", 1)[0])
+            server = start_standin_server(port, args.profile, args.seed)
+        benchmark_results = asyncio.run(run_benchmark(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if db_dir is not None:
+            shutil.rmtree(db_dir, ignore_errors=True)
+    print()
+    print_table(benchmark_results)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+ 讯飞LFASR本地替身服务
+
+ 用FastAPI实现 /prepare、/upload、/merge、/getProgress、/getResult 五个接口，响应格式与讯飞一致
+（`ok`、`err_no`、`failed`，`data` 为JSON字符串），供压测和联调使用，不消耗真实的讯飞额度。
+ 支持按档位（--profile）或单独参数配置：
+ - 接口延迟：固定延迟 + 随机抖动；
+ - 故障注入：HTTP 5xx、HTTP 429、业务错误（ok=-1）的比例，以及转写任务失败（status=-1）的比例；
+ - 处理耗时：merge 之后任务完成所需的时间 = 基础耗时 + 每MB耗时 × 音频大小。
+ GET /stats 返回各接口的请求数、注入的错误数和收到的上传字节数。
+
+ 客户端指向替身服务：XUNFEI_API_HOST=http://127.0.0.1:8765/api
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import uuid
+from dataclasses import dataclass, asdict, replace
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.services.xunfei_asr_service import BYTES_PER_MB, generate_lfasr_signa
+
+# 讯飞LFASR文档中的错误码（替身只用到其中几种）
+ERR_GENERIC = 26600
+ERR_ILLEGAL_ACCESS = 10105
+ERR_TASK_NOT_FOUND = 26602
+ERR_TASK_NOT_FINISHED = 26604
+ERR_SLICES_INCOMPLETE = 26605
+
+# 生成转写结果时假定的音频码率（字节/秒，约128kbps）及每段时长（毫秒）
+ASSUMED_AUDIO_BYTES_PER_SECOND = 16 * 1024
+RESULT_SEGMENT_MS = 10_000
+
+@dataclass
+class StandinProfile:
+    """
+     替身服务的行为配置
+
+     @param latency_ms 每个请求的固定延迟（毫秒）
+     @param latency_jitter_ms 在固定延迟之上叠加的随机延迟上限（毫秒）
+     @param http_error_rate 返回HTTP 503的请求比例
+     @param rate_limit_rate 返回HTTP 429的请求比例
+     @param api_error_rate 返回业务错误（ok=-1）的请求比例
+     @param task_failure_rate merge 后最终失败（status=-1）的任务比例
+     @param processing_base_seconds 任务处理的基础耗时（秒）
+     @param processing_seconds_per_mb 每MB音频增加的处理耗时（秒）
+    """
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    http_error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    api_error_rate: float = 0.0
+    task_failure_rate: float = 0.0
+    processing_base_seconds: float = 1.0
+    processing_seconds_per_mb: float = 0.0
+
+# 预置档位：fast 用于测客户端自身开销，realistic 近似真实服务，flaky 在 realistic 基础上注入故障
+PROFILES: Dict[str, StandinProfile] = {
+    "fast": StandinProfile(),
+    "realistic": StandinProfile(latency_ms=80, latency_jitter_ms=60, processing_base_seconds=5, processing_seconds_per_mb=2),
+    "flaky": StandinProfile(latency_ms=80, latency_jitter_ms=60, http_error_rate=0.05, rate_limit_rate=0.02,
+                            api_error_rate=0.01, task_failure_rate=0.02, processing_base_seconds=5, processing_seconds_per_mb=2),
+}
+
+@dataclass
+class _StandinTask:
+    file_len: int
+    slice_num: int
+    uploaded_slices: set
+    merged_at: Optional[float] = None
+    processing_seconds: float = 0.0
+    will_fail: bool = False
+
+def _envelope(data: Any = None, err_no: int = 0, failed: Optional[str] = None) -> Dict[str, Any]:
+    """
+     构造讯飞格式的响应体
+
+     @param data 业务数据（非字符串时序列化为JSON字符串）
+     @param err_no 错误码，0表示成功
+     @param failed 错误信息
+     @return 响应体字典
+    """
+    if data is not None and not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    return {"ok": 0 if err_no == 0 else -1, "err_no": err_no, "failed": failed, "data": data}
+
+def _build_result(file_len: int) -> list:
+    """
+     按音频大小生成占位转写结果（每段约10秒）
+
+     @param file_len 音频字节数
+     @return 与讯飞 getResult 相同结构的分段列表
+    """
+    duration_ms = max(1, file_len * 1000 // ASSUMED_AUDIO_BYTES_PER_SECOND)
+    segments = []
+    for index, start_ms in enumerate(range(0, duration_ms, RESULT_SEGMENT_MS)):
+        end_ms = min(duration_ms, start_ms + RESULT_SEGMENT_MS)
+        segments.append({"bg": str(start_ms), "ed": str(end_ms), "onebest": f"替身转写第{index + 1}段。", "speaker": "0"})
+    return segments
+
+def create_app(profile: StandinProfile, secret_key: Optional[str] = None, seed: Optional[int] = None) -> FastAPI:
+    """
+     创建替身服务应用
+
+     @param profile 行为配置
+     @param secret_key 讯飞密钥（可选），提供时校验请求的 signa
+     @param seed 随机数种子（可选），用于复现故障注入
+     @return FastAPI应用
+    """
+    app = FastAPI(title="LFASR stand-in")
+    rng = random.Random(seed)
+    tasks: Dict[str, _StandinTask] = {}
+    stats: Counter = Counter()
+    started_at = time.time()
+
+    async def read_form(request: Request) -> Dict[str, str]:
+        # 表单为 application/x-www-form-urlencoded；不依赖 python-multipart
+        body = (await request.body()).decode("utf-8", errors="replace")
+        form = {key: values[-1] for key, values in parse_qs(body).items()}
+        form.update(request.query_params)
+        return form
+
+    async def inject(endpoint: str, form: Dict[str, str]) -> Optional[JSONResponse]:
+        stats[f"requests.{endpoint}"] += 1
+        delay_ms = profile.latency_ms + rng.uniform(0, profile.latency_jitter_ms)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+        if secret_key is not None and form.get("signa") != generate_lfasr_signa(form.get("app_id", ""), secret_key, form.get("ts", "")):
+            stats["errors.signa"] += 1
+            return JSONResponse(_envelope(err_no=ERR_ILLEGAL_ACCESS, failed="illegal access"))
+        draw = rng.random()
+        if draw < profile.http_error_rate:
+            stats["injected.http_503"] += 1
+            return JSONResponse({"message": "injected upstream error"}, status_code=503)
+        draw -= profile.http_error_rate
+        if draw < profile.rate_limit_rate:
+            stats["injected.http_429"] += 1
+            return JSONResponse({"message": "injected rate limit"}, status_code=429)
+        draw -= profile.rate_limit_rate
+        if draw < profile.api_error_rate:
+            stats["injected.api_error"] += 1
+            return JSONResponse(_envelope(err_no=ERR_GENERIC, failed="injected api error"))
+        return None
+
+    def find_task(form: Dict[str, str]) -> Optional[_StandinTask]:
+        return tasks.get(form.get("task_id", ""))
+
+    @app.post("/api/prepare")
+    async def prepare(request: Request):
+        form = await read_form(request)
+        injected = await inject("prepare", form)
+        if injected is not None:
+            return injected
+        try:
+            file_len = int(form["file_len"])
+            slice_num = int(form["slice_num"])
+        except (KeyError, ValueError):
+            return _envelope(err_no=ERR_GENERIC, failed="file_len and slice_num are required")
+        # 每次启动都不重复，接续同一数据库的压测不会与上次的 asr_tasks 主键冲突
+        task_id = f"standin{uuid.uuid4().hex}"
+        tasks[task_id] = _StandinTask(file_len=file_len, slice_num=slice_num, uploaded_slices=set())
+        stats["tasks.prepared"] += 1
+        return _envelope(task_id)
+
+    @app.post("/api/upload")
+    async def upload(request: Request):
+        form = dict(request.query_params)
+        injected = await inject("upload", form)
+        if injected is not None:
+            return injected
+        task = find_task(form)
+        if task is None:
+            return _envelope(err_no=ERR_TASK_NOT_FOUND, failed="task not found")
+        # 按块读取请求体只统计字节数，替身自身的内存占用不随分片大小增长
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+        stats["upload.bytes"] += received
+        task.uploaded_slices.add(form.get("slice_id", ""))
+        return _envelope()
+
+    @app.post("/api/merge")
+    async def merge(request: Request):
+        form = await read_form(request)
+        injected = await inject("merge", form)
+        if injected is not None:
+            return injected
+        task = find_task(form)
+        if task is None:
+            return _envelope(err_no=ERR_TASK_NOT_FOUND, failed="task not found")
+        if len(task.uploaded_slices) < task.slice_num:
+            return _envelope(err_no=ERR_SLICES_INCOMPLETE, failed=f"{len(task.uploaded_slices)}/{task.slice_num} slices uploaded")
+        if task.merged_at is None:
+            task.merged_at = time.monotonic()
+            task.processing_seconds = profile.processing_base_seconds + profile.processing_seconds_per_mb * task.file_len / BYTES_PER_MB
+            task.will_fail = rng.random() < profile.task_failure_rate
+            stats["tasks.merged"] += 1
+        return _envelope()
+
+    @app.post("/api/getProgress")
+    async def get_progress(request: Request):
+        form = await read_form(request)
+        injected = await inject("getProgress", form)
+        if injected is not None:
+            return injected
+        task = find_task(form)
+        if task is None:
+            return _envelope(err_no=ERR_TASK_NOT_FOUND, failed="task not found")
+        if task.merged_at is None:
+            return _envelope({"status": 1, "desc": "音频上传中"})
+        elapsed = time.monotonic() - task.merged_at
+        if elapsed < task.processing_seconds / 2:
+            return _envelope({"status": 2, "desc": "处理队列中"})
+        if elapsed < task.processing_seconds:
+            return _envelope({"status": 3, "desc": "正在处理中"})
+        if task.will_fail:
+            return _envelope({"status": -1, "desc": "任务失败（注入）"})
+        return _envelope({"status": 9, "desc": "转写结果上传完成"})
+
+    @app.post("/api/getResult")
+    async def get_result(request: Request):
+        form = await read_form(request)
+        injected = await inject("getResult", form)
+        if injected is not None:
+            return injected
+        task = find_task(form)
+        if task is None:
+            return _envelope(err_no=ERR_TASK_NOT_FOUND, failed="task not found")
+        if task.merged_at is None or task.will_fail or time.monotonic() - task.merged_at < task.processing_seconds:
+            return _envelope(err_no=ERR_TASK_NOT_FINISHED, failed="task not finished")
+        stats["tasks.completed"] += 1
+        return _envelope(_build_result(task.file_len))
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "profile": asdict(profile),
+            "uptime_seconds": round(time.time() - started_at, 1),
+            "tasks_in_memory": len(tasks),
+            "counters": dict(stats),
+        }
+
+    return app
+
+def parse_args():
+    """
+     解析命令行参数（单独给出的参数覆盖 --profile 档位中的对应项）
+
+     @return 解析后的参数
+    """
+    parser = argparse.ArgumentParser(description="讯飞LFASR本地替身服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口 (默认: 8765)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="预置档位 (默认: fast)")
+    parser.add_argument("--secret-key", type=str, default=None, help="讯飞密钥，提供时校验请求签名")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子，用于复现故障注入")
+    for field_name in StandinProfile.__annotations__:
+        parser.add_argument(f"--{field_name.replace('_', '-')}", type=float, default=None,
+                            help=f"覆盖档位中的 {field_name}")
+    parser.add_argument("--log-level", type=str, choices=["debug", "info", "warning", "error"], default="warning",
+                        help="uvicorn日志级别 (默认: warning)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    overrides = {name: getattr(args, name) for name in StandinProfile.__annotations__ if getattr(args, name) is not None}
+    standin_profile = replace(PROFILES[args.profile], **overrides)
+    print(f"启动讯飞LFASR替身服务 - 监听 {args.host}:{args.port}，档位 {args.profile}: {asdict(standin_profile)}")
+    print(f"客户端配置: XUNFEI_API_HOST=http://{args.host}:{args.port}/api")
+    uvicorn.run(create_app(standin_profile, args.secret_key, args.seed), host=args.host, port=args.port, log_level=args.log_level)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+ 启动管道工作进程脚本
+
+ 该脚本在独立进程中运行会话处理管道工作池，从数据库任务队列认领并执行任务。
+ 与API进程分离部署时，请在API侧设置 PIPELINE_RUN_WORKERS_IN_API=false。
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).parent.parent))
+
+def run_worker(worker_count=None):
+    """
+     运行管道工作池直到进程被终止
+
+     @param worker_count 工作协程数量（默认使用配置 PIPELINE_WORKER_COUNT）
+    """
+    from app.core.config import get_settings
+    from app.db.init_db import init_db
+    from app.services.job_queue import PipelineWorkerPool
+
+    settings = get_settings()
+    init_db()
+    pool = PipelineWorkerPool(settings, worker_count=worker_count)
+
+    print(f"启动AI学习伴侣系统管道工作进程 - 工作协程数 {pool.worker_count}")
+    print("按CTRL+C停止工作进程")
+
+    try:
+        asyncio.run(pool.run_forever())
+    except KeyboardInterrupt:
+        print("管道工作进程已停止")
+
+def parse_args():
+    """
+     解析命令行参数
+
+     @return 解析后的参数
+    """
+    parser = argparse.ArgumentParser(description="启动AI学习伴侣系统管道工作进程")
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="工作协程数量 (默认: 配置项 PIPELINE_WORKER_COUNT)"
+    )
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    # 解析命令行参数
+    args = parse_args()
+
+    # 运行工作进程
+    run_worker(worker_count=args.workers)